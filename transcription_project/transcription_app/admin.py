@@ -1,3 +1,84 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AudioFile, JobQueueEntry, JobStageMetric
+
+
+class JobStageMetricInline(admin.TabularInline):
+    model = JobStageMetric
+    extra = 0
+    can_delete = False
+    fields = (
+        "stage",
+        "status",
+        "started_at",
+        "wall_seconds",
+        "cpu_seconds",
+        "peak_rss_bytes",
+        "real_time_factor",
+        "profile",
+    )
+    readonly_fields = fields
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(AudioFile)
+class AudioFileAdmin(admin.ModelAdmin):
+    list_display = ("id", "user", "status", "stage", "progress", "uploaded_at")
+    list_filter = ("status",)
+    search_fields = ("file", "user__username")
+    fields = ("user", "file", "status", "stage", "progress", "profile")
+    readonly_fields = ("user", "file", "status", "stage", "progress")
+    inlines = [JobStageMetricInline]
+
+
+@admin.register(JobStageMetric)
+class JobStageMetricAdmin(admin.ModelAdmin):
+    list_display = (
+        "audio_file",
+        "stage",
+        "status",
+        "started_at",
+        "wall_seconds",
+        "cpu_seconds",
+        "peak_rss_mib",
+        "audio_seconds",
+        "real_time_factor",
+    )
+    list_filter = ("stage", "status", "worker")
+    date_hierarchy = "started_at"
+    list_select_related = ("audio_file",)
+
+    def peak_rss_mib(self, obj):
+        return round(obj.peak_rss_bytes / (1 << 20), 1)
+
+    peak_rss_mib.short_description = "Peak RSS (MiB)"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(JobQueueEntry)
+class JobQueueEntryAdmin(admin.ModelAdmin):
+    list_display = (
+        "audio_file",
+        "user",
+        "tier",
+        "state",
+        "priority",
+        "audio_seconds",
+        "estimated_seconds",
+        "enqueued_at",
+        "wait_seconds",
+    )
+    list_filter = ("state", "tier")
+    list_select_related = ("audio_file", "user")
+    fields = ("audio_file", "user", "tier", "state", "priority")
+    readonly_fields = ("audio_file", "user", "tier", "state")
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,236 @@
+import logging
+
+import torch
+import whisper
+from django.conf import settings
+
+try:
+    import faster_whisper
+except ImportError:
+    faster_whisper = None
+
+logger = logging.getLogger(__name__)
+
+
+def allowed_models():
+    """Model sizes jobs may ask for; the deployment default is always allowed."""
+    return set(settings.TRANSCRIPTION_ASR_ALLOWED_MODELS) | {
+        settings.WHISPER_MODEL_SIZE
+    }
+
+
+class AsrConfig:
+    """Which speech recognition engine transcribes a job, and how.
+
+    Unset fields fall back to the TRANSCRIPTION_ASR_* settings, so a
+    deployment picks its defaults and individual jobs override them.
+    """
+
+    def __init__(
+        self,
+        backend=None,
+        model_size=None,
+        compute_type=None,
+        threads=None,
+        beam_size=None,
+        device=None,
+    ):
+        self.backend = backend or settings.TRANSCRIPTION_ASR_BACKEND
+        self.model_size = model_size or settings.WHISPER_MODEL_SIZE
+        self.compute_type = compute_type or settings.TRANSCRIPTION_ASR_COMPUTE_TYPE
+        if threads is None:
+            threads = settings.TRANSCRIPTION_ASR_THREADS
+        self.threads = threads
+        self.beam_size = beam_size or settings.TRANSCRIPTION_ASR_BEAM_SIZE
+        self.device = device or settings.TRANSCRIPTION_DEVICE
+
+    @classmethod
+    def for_audio_file(cls, audio_file):
+        config = cls(
+            backend=audio_file.asr_backend,
+            model_size=audio_file.asr_model,
+            compute_type=audio_file.asr_compute_type,
+        )
+        # Jobs are validated on upload, but never load what was not allowed
+        config.check_model_allowed()
+        return config
+
+    @classmethod
+    def parse(cls, spec):
+        """``backend[:model_size[:compute_type]]``, e.g. ``whisper:base:int8``."""
+        return cls(*(spec.split(":") + [None] * 2)[:3])
+
+    def model_key(self):
+        """Registry key of the loaded model; beam size is chosen per decode."""
+        return (
+            "asr",
+            self.backend,
+            self.model_size,
+            self.compute_type,
+            self.threads,
+            self.device,
+        )
+
+    def decode_options(self):
+        return {"beam_size": self.beam_size} if self.beam_size else {}
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, AsrConfig)
+            and self.model_key() == other.model_key()
+            and self.beam_size == other.beam_size
+        )
+
+    def __hash__(self):
+        return hash((self.model_key(), self.beam_size))
+
+    def __repr__(self):
+        return f"{self.backend}:{self.model_size}:{self.compute_type}"
+
+    @property
+    def batchable(self):
+        # The batch scheduler runs greedy fp32 decoding on a plain Whisper model
+        return (
+            self.backend == "whisper"
+            and self.compute_type == "float32"
+            and not self.beam_size
+        )
+
+    def check_model_allowed(self):
+        if self.model_size not in allowed_models():
+            raise ValueError(
+                f"Model {self.model_size!r} is not allowed; choose one of "
+                f"{', '.join(sorted(allowed_models()))}"
+            )
+
+    def validate(self, restrict_models=True):
+        """Raise ValueError for unknown, unavailable or disallowed configurations.
+
+        Operators benchmarking models pass ``restrict_models=False``.
+        """
+        if restrict_models:
+            self.check_model_allowed()
+        backend_class = BACKENDS.get(self.backend)
+        if backend_class is None:
+            raise ValueError(f"Unknown ASR backend {self.backend!r}")
+        if not backend_class.is_available():
+            raise ValueError(f"ASR backend {self.backend!r} is not installed")
+        if self.compute_type not in backend_class.compute_types:
+            raise ValueError(
+                f"{self.backend} supports compute types "
+                f"{', '.join(backend_class.compute_types)}"
+            )
+
+
+class AsrBackend:
+    """A loaded speech recognition model.
+
+    ``transcribe`` takes 16 kHz mono float32 audio and Whisper's transcribe
+    options and returns Whisper's result shape: a dict with ``text`` and
+    ``segments`` carrying ``start``, ``end``, ``text`` and, when word
+    timestamps are requested, ``words``.
+    """
+
+    name = None
+    compute_types = ()
+
+    def __init__(self, config):
+        self.config = config
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def transcribe(self, audio, **options):
+        raise NotImplementedError
+
+
+def quantize_dynamic_int8(model):
+    """Linear layers with int8 weights, activations quantized on the fly.
+
+    Whisper's layers subclass nn.Linear only to cast weights to the input
+    dtype, and quantize_dynamic matches exact types, so they are turned back
+    into plain nn.Linear first.
+    """
+    for module in model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+class WhisperBackend(AsrBackend):
+    """openai-whisper on PyTorch; int8 uses dynamic quantization on CPU."""
+
+    name = "whisper"
+    compute_types = ("float32", "float16", "int8")
+
+    def __init__(self, config):
+        super().__init__(config)
+        if config.compute_type == "int8" and config.device != "cpu":
+            raise ValueError("Dynamic int8 quantization only runs on CPU")
+        if config.threads:
+            # PyTorch's thread pool is per process, so it is sized once here
+            # rather than around every decode
+            torch.set_num_threads(config.threads)
+        self.model = whisper.load_model(config.model_size, device=config.device)
+        if config.compute_type == "int8":
+            self.model = quantize_dynamic_int8(self.model)
+
+    def transcribe(self, audio, **options):
+        options = dict(options, fp16=self.config.compute_type == "float16")
+        return self.model.transcribe(audio, **options)
+
+
+class FasterWhisperBackend(AsrBackend):
+    """CTranslate2 Whisper models through faster-whisper, when installed."""
+
+    name = "faster-whisper"
+    compute_types = ("int8", "int8_float32", "int8_float16", "float16", "float32")
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.model = faster_whisper.WhisperModel(
+            config.model_size,
+            device=config.device,
+            compute_type=config.compute_type,
+            cpu_threads=config.threads or 0,
+        )
+
+    @classmethod
+    def is_available(cls):
+        return faster_whisper is not None
+
+    def transcribe(self, audio, **options):
+        segments, _ = self.model.transcribe(
+            audio,
+            language=options.get("language"),
+            initial_prompt=options.get("initial_prompt"),
+            word_timestamps=options.get("word_timestamps", False),
+            beam_size=options.get("beam_size") or 1,
+        )
+        results = []
+        for index, segment in enumerate(segments):
+            result = {
+                "id": index,
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text,
+            }
+            if segment.words is not None:
+                result["words"] = [
+                    {"word": word.word, "start": word.start, "end": word.end}
+                    for word in segment.words
+                ]
+            results.append(result)
+        return {"text": "".join(s["text"] for s in results), "segments": results}
+
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend, FasterWhisperBackend)}
+
+
+def load_backend(config):
+    config.validate(restrict_models=False)
+    logger.info(f"Loading ASR backend {config!r}")
+    return BACKENDS[config.backend](config)
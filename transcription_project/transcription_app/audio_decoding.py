@@ -0,0 +1,145 @@
+import re
+import subprocess
+import tempfile
+import wave
+from pathlib import Path
+
+import numpy as np
+import torch
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 4
+# Read 30 seconds of decoded audio at a time (~1.9 MB)
+CHUNK_SAMPLES = SAMPLE_RATE * 30
+STDERR_TAIL_BYTES = 4096
+DURATION_RE = re.compile(rb"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+
+
+class AudioDecodingError(Exception):
+    pass
+
+
+def ffmpeg_command(source, sample_rate=SAMPLE_RATE):
+    return [
+        "ffmpeg",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-threads",
+        "0",
+        "-i",
+        str(source),
+        "-f",
+        "f32le",
+        "-ac",
+        "1",
+        "-ar",
+        str(sample_rate),
+        "-",
+    ]
+
+
+def iter_pcm_chunks(audio_path, chunk_samples=CHUNK_SAMPLES, sample_rate=SAMPLE_RATE):
+    """Yield mono float32 PCM from ffmpeg in arrays of at most chunk_samples."""
+    # stderr goes to a file: a pipe that is only read after stdout ends
+    # would block ffmpeg once a damaged file fills it with errors
+    stderr_file = tempfile.TemporaryFile()
+    try:
+        process = subprocess.Popen(
+            ffmpeg_command(audio_path, sample_rate),
+            stdout=subprocess.PIPE,
+            stderr=stderr_file,
+        )
+    except FileNotFoundError:
+        stderr_file.close()
+        raise AudioDecodingError("ffmpeg is not installed")
+
+    chunk_bytes = chunk_samples * BYTES_PER_SAMPLE
+    completed = False
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            usable = len(data) - len(data) % BYTES_PER_SAMPLE
+            yield np.frombuffer(data[:usable], dtype=np.float32)
+        completed = True
+    finally:
+        if not completed:
+            process.kill()
+        process.stdout.close()
+        returncode = process.wait()
+        # The last errors are enough to tell what went wrong
+        stderr_file.seek(max(stderr_file.seek(0, 2) - STDERR_TAIL_BYTES, 0))
+        stderr = stderr_file.read().decode(errors="replace")
+        stderr_file.close()
+
+    if returncode != 0:
+        raise AudioDecodingError(f"ffmpeg failed to decode {audio_path}: {stderr}")
+
+
+def decode_audio(audio_path, mmap_path=None, sample_rate=SAMPLE_RATE):
+    """Decode an audio file to a 1-D float32 array at ``sample_rate``.
+
+    Chunks are appended to a single buffer that is viewed as an array
+    without copying. With ``mmap_path`` they are streamed to that file
+    instead and the result is memory-mapped, so resident memory stays at
+    one chunk regardless of the recording length.
+    """
+    if mmap_path is None:
+        buffer = bytearray()
+        for chunk in iter_pcm_chunks(audio_path, sample_rate=sample_rate):
+            buffer += chunk.data
+        return np.frombuffer(buffer, dtype=np.float32)
+
+    mmap_path = Path(mmap_path)
+    mmap_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(mmap_path, "wb") as f:
+        for chunk in iter_pcm_chunks(audio_path, sample_rate=sample_rate):
+            f.write(chunk.data)
+    if mmap_path.stat().st_size == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(mmap_path, dtype=np.float32, mode="c")
+
+
+def probe_duration(audio_path):
+    """Length of a recording in seconds from its headers, or None if unknown."""
+    try:
+        with wave.open(str(audio_path), "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    except (wave.Error, EOFError, OSError):
+        pass
+    try:
+        # Without an output file ffmpeg only reads the headers, then exits 1
+        result = subprocess.run(
+            ["ffmpeg", "-nostdin", "-hide_banner", "-i", str(audio_path)],
+            capture_output=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = DURATION_RE.search(result.stderr)
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def write_wav(audio_path, wav_path, sample_rate=SAMPLE_RATE):
+    """Stream an audio file into a 16-bit mono WAV without holding it in memory."""
+    with wave.open(str(wav_path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        for chunk in iter_pcm_chunks(audio_path, sample_rate=sample_rate):
+            pcm = np.clip(chunk, -1.0, 1.0) * 32767
+            wav.writeframes(pcm.astype("<i2").tobytes())
+    return wav_path
+
+
+def to_pyannote_input(audio, sample_rate=SAMPLE_RATE):
+    """Wrap a decoded array in the in-memory format pyannote pipelines accept."""
+    return {
+        "waveform": torch.from_numpy(np.asarray(audio)).unsqueeze(0),
+        "sample_rate": sample_rate,
+    }
@@ -0,0 +1,245 @@
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+import torch
+import whisper
+from django.conf import settings
+
+from .audio_decoding import SAMPLE_RATE
+from .model_registry import get_whisper_model, whisper_inference_lock
+
+logger = logging.getLogger(__name__)
+
+# Whisper's encoder always sees 30 second windows
+MAX_CLIP_SECONDS = 30
+LATENCY_SAMPLES = 1000
+# Whisper's timestamp tokens are 20 ms apart
+TIMESTAMP_SECONDS = 0.02
+# whisper.transcribe's defaults for treating a window as silent, and for
+# retrying it at higher temperatures
+NO_SPEECH_THRESHOLD = 0.6
+LOGPROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+
+
+def split_segments(tokens, tokenizer, duration):
+    """Timed segments from a decode's tokens, split at timestamp tokens."""
+    segments = []
+    start = 0.0
+    text_tokens = []
+    for token in tokens:
+        if token < tokenizer.timestamp_begin:
+            if token < tokenizer.eot:
+                text_tokens.append(token)
+            continue
+        time = min((token - tokenizer.timestamp_begin) * TIMESTAMP_SECONDS, duration)
+        if text_tokens:
+            segments.append((start, max(time, start), tokenizer.decode(text_tokens)))
+            text_tokens = []
+        start = time
+    if text_tokens:
+        # Text after the last timestamp runs to the end of the clip
+        segments.append((start, max(duration, start), tokenizer.decode(text_tokens)))
+    return [
+        {"id": i, "start": start, "end": end, "text": text}
+        for i, (start, end, text) in enumerate(
+            segment for segment in segments if segment[2].strip()
+        )
+    ]
+
+
+class BatchJob:
+    def __init__(self, audio):
+        self.audio = audio
+        self.future = Future()
+        self.submitted_at = time.monotonic()
+
+
+class BatchScheduler:
+    """Coalesces short clips submitted from concurrent tasks into batched decodes.
+
+    Jobs wait at most ``max_wait`` seconds for companions before a batch of
+    up to ``max_batch_size`` clips is padded to Whisper's 30 second window
+    and run through the encoder and decoder together. Tasks only share a
+    scheduler when they run in the same process, i.e. with the threads or
+    gevent worker pools.
+    """
+
+    def __init__(self, model_size, max_batch_size, max_wait):
+        self.model_size = model_size
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._jobs = 0
+        self._batches = 0
+        self._audio_seconds = 0.0
+        self._busy_seconds = 0.0
+        self._wait_times = deque(maxlen=LATENCY_SAMPLES)
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def submit(self, audio):
+        if len(audio) > MAX_CLIP_SECONDS * SAMPLE_RATE:
+            raise ValueError("Batched transcription only handles clips up to 30s")
+        self._ensure_running()
+        job = BatchJob(audio)
+        self._queue.put(job)
+        return job.future
+
+    def transcribe(self, audio):
+        return self.submit(audio).result()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="whisper-batch-scheduler", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            try:
+                outputs = self._infer([job.audio for job in batch])
+            except Exception as e:
+                logger.error(f"Batched transcription failed: {str(e)}", exc_info=True)
+                for job in batch:
+                    job.future.set_exception(e)
+                continue
+            finished = time.monotonic()
+
+            for job, segments in zip(batch, outputs):
+                text = "".join(segment["text"] for segment in segments)
+                job.future.set_result((text, segments))
+            self._record(batch, started, finished)
+
+    def _infer(self, audios):
+        """Timed segments for each clip.
+
+        Clips that whisper.transcribe would treat as silent come back empty,
+        and those it would retry at a higher temperature are transcribed on
+        their own with its fallback.
+        """
+        model = get_whisper_model(self.model_size)
+        fp16 = model.device.type != "cpu"
+        clips = [np.asarray(audio, dtype=np.float32) for audio in audios]
+        mels = torch.stack(
+            [
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(clip), model.dims.n_mels
+                )
+                for clip in clips
+            ]
+        ).to(model.device)
+        options = whisper.DecodingOptions(language="en", fp16=fp16)
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            model.is_multilingual,
+            num_languages=model.num_languages,
+            language="en",
+            task="transcribe",
+        )
+        outputs = []
+        with whisper_inference_lock(self.model_size), torch.inference_mode():
+            results = whisper.decode(model, mels, options)
+            for clip, result in zip(clips, results):
+                if (
+                    result.no_speech_prob > NO_SPEECH_THRESHOLD
+                    and result.avg_logprob < LOGPROB_THRESHOLD
+                ):
+                    outputs.append([])
+                elif (
+                    result.compression_ratio > COMPRESSION_RATIO_THRESHOLD
+                    or result.avg_logprob < LOGPROB_THRESHOLD
+                ):
+                    segments = model.transcribe(clip, language="en", fp16=fp16)[
+                        "segments"
+                    ]
+                    outputs.append(segments)
+                else:
+                    duration = len(clip) / SAMPLE_RATE
+                    outputs.append(split_segments(result.tokens, tokenizer, duration))
+        return outputs
+
+    def _record(self, batch, started, finished):
+        with self._lock:
+            self._batches += 1
+            self._jobs += len(batch)
+            self._busy_seconds += finished - started
+            for job in batch:
+                self._audio_seconds += len(job.audio) / SAMPLE_RATE
+                self._wait_times.append(started - job.submitted_at)
+                self._latencies.append(finished - job.submitted_at)
+        logger.debug(
+            f"Decoded batch of {len(batch)} clips in {finished - started:.2f}s"
+        )
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._started_at
+            latencies = sorted(self._latencies)
+            wait_times = sorted(self._wait_times)
+
+        def percentile(values, fraction):
+            if not values:
+                return None
+            return values[min(len(values) - 1, int(len(values) * fraction))]
+
+        return {
+            "model_size": self.model_size,
+            "jobs": self._jobs,
+            "batches": self._batches,
+            "queued": self._queue.qsize(),
+            "mean_batch_size": self._jobs / self._batches if self._batches else 0,
+            "jobs_per_second": self._jobs / elapsed if elapsed else 0,
+            "audio_seconds_per_busy_second": (
+                self._audio_seconds / self._busy_seconds if self._busy_seconds else 0
+            ),
+            "wait_p50": percentile(wait_times, 0.5),
+            "wait_p95": percentile(wait_times, 0.95),
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p95": percentile(latencies, 0.95),
+        }
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_batch_scheduler(model_size=None):
+    model_size = model_size or settings.WHISPER_MODEL_SIZE
+    with _schedulers_lock:
+        if model_size not in _schedulers:
+            _schedulers[model_size] = BatchScheduler(
+                model_size,
+                settings.TRANSCRIPTION_BATCH_MAX_SIZE,
+                settings.TRANSCRIPTION_BATCH_MAX_WAIT_MS / 1000,
+            )
+        return _schedulers[model_size]
+
+
+def scheduler_stats():
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    return [scheduler.stats() for scheduler in schedulers]
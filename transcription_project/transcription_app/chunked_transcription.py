@@ -0,0 +1,235 @@
+import logging
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import torch
+from django.conf import settings
+
+from .audio_decoding import SAMPLE_RATE
+from .vad import find_split_points
+
+logger = logging.getLogger(__name__)
+
+# Characters of preceding text passed as the prompt to the next chunk
+PROMPT_CHARS = 200
+# Chunks handed to the pool ahead of the one being stitched, per worker
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+
+def plan_chunks(audio, chunk_seconds, overlap_seconds):
+    """Split audio at quiet points into (owned_start, owned_end, start, end) samples.
+
+    Each chunk is decoded over [start, end), which pads the region it owns
+    with ``overlap_seconds`` of context on either side.
+    """
+    overlap = int(overlap_seconds * SAMPLE_RATE)
+    points = find_split_points(audio, chunk_seconds)
+    return [
+        (
+            owned_start,
+            owned_end,
+            max(0, owned_start - overlap),
+            min(len(audio), owned_end + overlap),
+        )
+        for owned_start, owned_end in zip(points, points[1:])
+        if owned_end > owned_start
+    ]
+
+
+def shift_segment(segment, offset):
+    segment = dict(segment)
+    segment["start"] += offset
+    segment["end"] += offset
+    if "words" in segment:
+        segment["words"] = [
+            dict(word, start=word["start"] + offset, end=word["end"] + offset)
+            for word in segment["words"]
+        ]
+    return segment
+
+
+# Shorter repeats at a chunk edge are only dropped when they are the whole
+# segment, so a word that is merely said twice survives
+MIN_OVERLAP_WORDS = 2
+
+
+def _normalize(text):
+    return re.sub(r"\W+", " ", text).strip().lower()
+
+
+def _words(text):
+    """(position, normalized word) for the words of ``text.split()``."""
+    words = []
+    for position, word in enumerate(text.split()):
+        normalized = _normalize(word)
+        if normalized:
+            words.append((position, normalized))
+    return words
+
+
+def _drop_repeated_prefix(previous_text, text):
+    """Cut the start of ``text`` that repeats the end of ``previous_text``.
+
+    Returns the remaining text, empty when all of it is a repeat.
+    """
+    previous = [word for _, word in _words(previous_text)]
+    words = _words(text)
+    current = [word for _, word in words]
+    for length in range(min(len(previous), len(current)), 0, -1):
+        if length < MIN_OVERLAP_WORDS and length < len(current):
+            break
+        if previous[-length:] == current[:length]:
+            if length == len(current):
+                return ""
+            return " " + " ".join(text.split()[words[length][0] :])
+    return text
+
+
+class SegmentStitcher:
+    """Merges per-chunk segments (already on the global timeline) in order.
+
+    A segment is kept by the chunk whose owned region contains its midpoint.
+    Where it overlaps the previous segment in time, words repeating the end
+    of that segment are cut, and the segment starts where the previous one
+    ends; segments left without text or time are dropped.
+    """
+
+    def __init__(self):
+        self.segments = []
+
+    def add(self, owned_start, owned_end, segments):
+        """Add one chunk's segments; returns the ones that were kept."""
+        kept = []
+        for segment in segments:
+            midpoint = (segment["start"] + segment["end"]) / 2
+            if not owned_start <= midpoint < owned_end:
+                continue
+            if self.segments:
+                previous = self.segments[-1]
+                if segment["start"] < previous["end"]:
+                    text = _drop_repeated_prefix(previous["text"], segment["text"])
+                    if not text or segment["end"] <= previous["end"]:
+                        continue
+                    if "words" in segment:
+                        # Whisper words follow the whitespace-separated text
+                        dropped = len(segment["text"].split()) - len(text.split())
+                        segment["words"] = segment["words"][dropped:]
+                    segment["text"] = text
+                    segment["start"] = previous["end"]
+            segment["id"] = len(self.segments)
+            self.segments.append(segment)
+            kept.append(segment)
+        return kept
+
+
+def stitch_segments(chunk_results):
+    """Stitch (owned_start, owned_end, segments) chunk results, times in seconds."""
+    stitcher = SegmentStitcher()
+    for owned_start, owned_end, segments in chunk_results:
+        stitcher.add(owned_start, owned_end, segments)
+    return stitcher.segments
+
+
+def transcribe_chunk(audio, asr, options):
+    from .model_registry import asr_inference_lock, get_asr_model
+
+    model = get_asr_model(asr)
+    with asr_inference_lock(asr):
+        return model.transcribe(audio, **options)["segments"]
+
+
+def _init_worker(threads):
+    import django
+
+    django.setup()
+    torch.set_num_threads(threads)
+
+
+def _chunk_worker_count():
+    workers = settings.TRANSCRIPTION_CHUNK_WORKERS
+    if multiprocessing.current_process().daemon and workers > 1:
+        # Daemonic pool processes (e.g. Celery prefork children) can't fork;
+        # the transcribe queue's workers use the threads pool for this
+        logger.warning("Chunked transcription running sequentially in a daemon")
+        return 1
+    return workers
+
+
+def iter_transcribe_chunked(audio, asr, options, chunk_seconds=None, sequential=False):
+    """Transcribe silence-aligned chunks, yielding results as soon as they're ready.
+
+    Yields (seconds_done, segments) per chunk in timeline order, where the
+    segments are the newly stitched ones. Sequential decoding feeds the tail
+    of the text so far to the next chunk as its prompt, like Whisper does
+    between its own 30 second windows.
+    """
+    chunks = plan_chunks(
+        audio,
+        chunk_seconds or settings.TRANSCRIPTION_CHUNK_SECONDS,
+        settings.TRANSCRIPTION_CHUNK_OVERLAP_SECONDS,
+    )
+    workers = 1 if sequential else min(_chunk_worker_count(), len(chunks))
+    logger.info(f"Transcribing {len(chunks)} chunks with {workers} workers")
+    stitcher = SegmentStitcher()
+
+    def stitched(chunk, segments):
+        owned_start, owned_end, start, _ = chunk
+        offset = start / SAMPLE_RATE
+        return owned_end / SAMPLE_RATE, stitcher.add(
+            owned_start / SAMPLE_RATE,
+            owned_end / SAMPLE_RATE,
+            [shift_segment(segment, offset) for segment in segments],
+        )
+
+    if workers <= 1:
+        for chunk in chunks:
+            chunk_options = options
+            if sequential and stitcher.segments:
+                text = "".join(segment["text"] for segment in stitcher.segments)
+                chunk_options = dict(options, initial_prompt=text[-PROMPT_CHARS:])
+            _, _, start, end = chunk
+            yield stitched(
+                chunk, transcribe_chunk(audio[start:end], asr, chunk_options)
+            )
+        return
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads,),
+    ) as executor:
+        # Only a few chunks are copied to the pool at a time, so the audio
+        # isn't held twice in memory
+        remaining = iter(chunks)
+        in_flight = deque()
+
+        def submit():
+            for chunk in remaining:
+                _, _, start, end = chunk
+                future = executor.submit(
+                    transcribe_chunk, audio[start:end].copy(), asr, options
+                )
+                in_flight.append((chunk, future))
+                return
+
+        for _ in range(workers * CHUNKS_IN_FLIGHT_PER_WORKER):
+            submit()
+        while in_flight:
+            chunk, future = in_flight.popleft()
+            segments = future.result()
+            submit()
+            yield stitched(chunk, segments)
+
+
+def transcribe_chunked(audio, asr, options):
+    """Transcribe long audio as silence-aligned chunks across a process pool."""
+    segments = []
+    for _, new_segments in iter_transcribe_chunked(audio, asr, options):
+        segments.extend(new_segments)
+    text = "".join(segment["text"] for segment in segments)
+    return text, segments
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+TURN_DTYPE = np.dtype([("start", "<f8"), ("end", "<f8"), ("speaker", "<i4")])
+
+
+class DiarizationResult:
+    """Cached pyannote output for one recording.
+
+    ``turns`` and ``embeddings`` are memory-mapped, so loading a result costs
+    a few page faults regardless of the recording's length. Row ``i`` of
+    ``embeddings`` is the centroid of speaker ``labels[i]``.
+    """
+
+    def __init__(self, labels, turns, embeddings=None):
+        self.labels = labels
+        self.turns = turns
+        self.embeddings = embeddings
+
+    def turn_list(self):
+        """Turns as (start, end, label) tuples, as assign_speakers takes them."""
+        return [
+            (float(start), float(end), self.labels[speaker])
+            for start, end, speaker in self.turns.tolist()
+        ]
+
+
+def vad_key():
+    """Which audio the diarization saw: the VAD settings decide what is cut."""
+    if not settings.TRANSCRIPTION_VAD_ENABLED:
+        return "no-vad"
+    config = [
+        settings.TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS,
+        settings.TRANSCRIPTION_VAD_MIN_SPEECH_SECONDS,
+        settings.TRANSCRIPTION_VAD_PADDING_SECONDS,
+        settings.TRANSCRIPTION_VAD_MIN_ENERGY,
+        settings.TRANSCRIPTION_VAD_MIN_SILENCE_RATIO,
+    ]
+    return "vad-" + hashlib.sha256(json.dumps(config).encode()).hexdigest()[:12]
+
+
+def cache_dir(content_hash, model=None):
+    model = model or settings.PYANNOTE_DIARIZATION_MODEL
+    model_dir = re.sub(r"[^\w.-]+", "_", model)
+    return (
+        Path(settings.MEDIA_ROOT)
+        / "diarization"
+        / model_dir
+        / vad_key()
+        / content_hash[:2]
+        / content_hash
+    )
+
+
+def store(content_hash, turns, embeddings=None, labels=None):
+    """Cache ``turns`` ((start, end, label) tuples) and per-speaker embeddings.
+
+    ``labels`` gives the speaker order of the ``embeddings`` rows; it defaults
+    to the labels in order of first appearance.
+    """
+    if labels is None:
+        labels = list(dict.fromkeys(label for _, _, label in turns))
+    index = {label: i for i, label in enumerate(labels)}
+    array = np.array(
+        [(start, end, index[label]) for start, end, label in turns], dtype=TURN_DTYPE
+    )
+
+    target = cache_dir(content_hash)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=target.parent, suffix=".tmp"))
+    try:
+        np.save(tmp_dir / "turns.npy", array)
+        if embeddings is not None:
+            np.save(tmp_dir / "embeddings.npy", np.asarray(embeddings, np.float32))
+        with open(tmp_dir / "labels.json", "w") as f:
+            json.dump(labels, f)
+        os.chmod(tmp_dir, 0o755)
+        try:
+            os.rename(tmp_dir, target)
+        except OSError:
+            # Another worker cached the same recording first
+            shutil.rmtree(tmp_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def load(content_hash):
+    """The cached DiarizationResult for a recording, or None."""
+    if not content_hash:
+        return None
+    directory = cache_dir(content_hash)
+    try:
+        with open(directory / "labels.json") as f:
+            labels = json.load(f)
+        turns = np.load(directory / "turns.npy", mmap_mode="r")
+    except FileNotFoundError:
+        return None
+
+    embeddings_path = directory / "embeddings.npy"
+    embeddings = None
+    if embeddings_path.exists():
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+    return DiarizationResult(labels, turns, embeddings)
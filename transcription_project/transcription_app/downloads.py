@@ -0,0 +1,194 @@
+import gzip
+import os
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import content_disposition_header, http_date, quote_etag
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STREAM_BLOCK_SIZE = 1 << 16
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _compress_gzip(source, target):
+    with open(source, "rb") as src, gzip.open(target, "wb") as dst:
+        shutil.copyfileobj(src, dst, STREAM_BLOCK_SIZE)
+
+
+def _compress_brotli(source, target):
+    compressor = brotli.Compressor(mode=brotli.MODE_TEXT)
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        for block in iter(lambda: src.read(STREAM_BLOCK_SIZE), b""):
+            dst.write(compressor.process(block))
+        dst.write(compressor.finish())
+
+
+ENCODINGS = [("br", ".br", _compress_brotli), ("gzip", ".gz", _compress_gzip)]
+
+
+def _accepted_encodings(request):
+    header = request.META.get("HTTP_ACCEPT_ENCODING", "")
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def precompressed(path, suffix, compress):
+    """Path to a compressed copy of ``path``, built once next to it."""
+    target = Path(f"{path}{suffix}")
+    if target.exists() and target.stat().st_mtime >= path.stat().st_mtime:
+        return target
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    os.close(fd)
+    try:
+        compress(path, tmp_name)
+        os.chmod(tmp_name, 0o644)
+        os.replace(tmp_name, target)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    return target
+
+
+def is_single_range(header):
+    match = RANGE_RE.match(header.strip())
+    return bool(match) and any(match.groups())
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range, or None if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match or size == 0:
+        return None
+    first, last = match.groups()
+    if first == "":
+        if last == "" or int(last) == 0:
+            return None
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _iter_range(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _sendfile_response(path, content_type):
+    mode = settings.TRANSCRIPTION_DOWNLOAD_SENDFILE
+    response = HttpResponse(content_type=content_type)
+    if mode == "x-sendfile":
+        response["X-Sendfile"] = str(path)
+    elif mode == "x-accel-redirect":
+        relative = Path(path).resolve().relative_to(Path(settings.MEDIA_ROOT).resolve())
+        response["X-Accel-Redirect"] = (
+            settings.TRANSCRIPTION_DOWNLOAD_ACCEL_PREFIX + relative.as_posix()
+        )
+    else:
+        raise ValueError(f"Unknown TRANSCRIPTION_DOWNLOAD_SENDFILE mode: {mode}")
+    return response
+
+
+def serve_file(
+    request,
+    path,
+    filename=None,
+    content_type="application/octet-stream",
+    compressible=False,
+):
+    """Serve a file with conditional GET, byte ranges and optional compression.
+
+    With TRANSCRIPTION_DOWNLOAD_SENDFILE set, only headers are produced and
+    the front-end server (Apache X-Sendfile or nginx X-Accel-Redirect)
+    streams the bytes, handling ranges and compression itself.
+    """
+    path = Path(path)
+    filename = filename or path.name
+    stat = path.stat()
+    version = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+    last_modified = int(stat.st_mtime)
+    sendfile = settings.TRANSCRIPTION_DOWNLOAD_SENDFILE
+
+    range_header = request.META.get("HTTP_RANGE")
+    if range_header and not is_single_range(range_header):
+        # Multiple or malformed ranges are ignored and the whole file is sent
+        range_header = None
+    if range_header and request.META.get("HTTP_IF_RANGE") not in (
+        None,
+        quote_etag(version),
+        http_date(last_modified),
+    ):
+        range_header = None
+
+    encoding = None
+    if (
+        compressible
+        and settings.TRANSCRIPTION_DOWNLOAD_COMPRESSION
+        and not sendfile
+        and not range_header
+    ):
+        accepted = _accepted_encodings(request)
+        for name, suffix, compress in ENCODINGS:
+            if name in accepted and (name != "br" or brotli is not None):
+                encoding = (name, suffix, compress)
+                version = f"{version}-{name}"
+                break
+    etag = quote_etag(version)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response["ETag"] = etag
+        return response
+
+    if sendfile:
+        response = _sendfile_response(path, content_type)
+    elif range_header:
+        byte_range = parse_range(range_header, stat.st_size)
+        if byte_range is None:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{stat.st_size}"
+            return response
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _iter_range(path, start, length), status=206, content_type=content_type
+        )
+        response["Content-Length"] = str(length)
+        response["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    else:
+        if encoding:
+            name, suffix, compress = encoding
+            path = precompressed(path, suffix, compress)
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        if encoding:
+            response["Content-Encoding"] = name
+
+    if compressible:
+        patch_vary_headers(response, ("Accept-Encoding",))
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    response["Content-Disposition"] = content_disposition_header(True, filename)
+    return response
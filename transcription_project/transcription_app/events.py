@@ -0,0 +1,84 @@
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotFound, JsonResponse, StreamingHttpResponse
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .models import AudioFile
+from .progress import TERMINAL_STATUSES, get_channel
+
+logger = logging.getLogger(__name__)
+
+
+def _raw_token(request):
+    header = request.headers.get("Authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token.strip()
+    # EventSource can't set headers, so browsers pass the access token here
+    return request.GET.get("token")
+
+
+@sync_to_async
+def authenticate(raw_token):
+    """Return the user for a JWT access token, or None."""
+    if not raw_token:
+        return None
+    auth = JWTAuthentication()
+    try:
+        return auth.get_user(auth.get_validated_token(raw_token))
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+
+def _snapshot(audio_file):
+    return {
+        "status": audio_file.status,
+        "stage": audio_file.stage,
+        "percent": 100.0 if audio_file.status == "completed" else audio_file.progress,
+    }
+
+
+def _format_event(event):
+    return f"event: progress\ndata: {json.dumps(event)}\n\n"
+
+
+async def _event_stream(audio_file):
+    event = _snapshot(audio_file)
+    yield _format_event(event)
+    if event["status"] in TERMINAL_STATUSES:
+        return
+
+    async for event in get_channel().subscribe(audio_file.id):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        yield _format_event(event)
+        if event.get("status") in TERMINAL_STATUSES:
+            return
+
+
+async def audio_file_events(request, pk):
+    """Server-sent stream of an audio file's status, stage and percent done.
+
+    Served by the ASGI application; each connection holds no thread or
+    database connection while it waits for the worker's next update.
+    """
+    user = await authenticate(_raw_token(request))
+    if user is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."}, status=401
+        )
+    audio_file = await AudioFile.objects.filter(id=pk, user=user).afirst()
+    if audio_file is None:
+        return HttpResponseNotFound()
+
+    response = StreamingHttpResponse(
+        _event_stream(audio_file), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
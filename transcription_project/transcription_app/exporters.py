@@ -0,0 +1,224 @@
+import datetime
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+def format_timestamp(seconds):
+    return str(datetime.timedelta(seconds=seconds))
+
+
+class TranscriptFormat:
+    """Writes one output format; the exporter calls it once per segment."""
+
+    extension = None
+
+    def begin(self, f, transcription):
+        pass
+
+    def write_segment(self, f, index, segment, speaker):
+        raise NotImplementedError
+
+    def end(self, f):
+        pass
+
+
+class TextFormat(TranscriptFormat):
+    extension = "txt"
+
+    def write_segment(self, f, index, segment, speaker):
+        f.write(f"{speaker}: {segment['text']}\n")
+
+
+class JsonFormat(TranscriptFormat):
+    extension = "json"
+
+    def begin(self, f, transcription):
+        f.write(f'{{"transcription":{json.dumps(transcription)},"segments":[')
+
+    def write_segment(self, f, index, segment, speaker):
+        if index > 1:
+            f.write(",")
+        f.write(
+            json.dumps(
+                {
+                    "text": segment["text"],
+                    "speaker": speaker,
+                    "start": segment["start"],
+                    "end": segment["end"],
+                    **({"words": segment["words"]} if "words" in segment else {}),
+                },
+                separators=(",", ":"),
+            )
+        )
+
+    def end(self, f):
+        f.write("]}")
+
+
+class SrtFormat(TranscriptFormat):
+    extension = "srt"
+
+    def write_segment(self, f, index, segment, speaker):
+        start_time = format_timestamp(segment["start"])
+        end_time = format_timestamp(segment["end"])
+        f.write(
+            f"{index}\n{start_time} --> {end_time}\n{speaker}: {segment['text']}\n\n"
+        )
+
+
+class VttFormat(SrtFormat):
+    extension = "vtt"
+
+    def begin(self, f, transcription):
+        f.write("WEBVTT\n\n")
+
+
+FORMATS = {}
+
+
+def register_format(format_class):
+    FORMATS[format_class.extension] = format_class
+    return format_class
+
+
+for _format_class in (TextFormat, JsonFormat, SrtFormat, VttFormat):
+    register_format(_format_class)
+
+
+def transcript_document(transcription, segments):
+    """The canonical transcript stored on AudioFile.transcription_json."""
+    return {
+        "transcription": transcription,
+        "segments": [
+            {
+                "text": segment["text"],
+                "speaker": segment.get("speaker", "UNKNOWN"),
+                "start": segment["start"],
+                "end": segment["end"],
+                **({"words": segment["words"]} if "words" in segment else {}),
+            }
+            for segment in segments
+        ],
+    }
+
+
+def transcription_dir(session_id, base_name):
+    return Path(settings.MEDIA_ROOT) / "transcriptions" / str(session_id) / base_name
+
+
+def transcription_file_name(base_name, extension, version=0):
+    """Renders are named by transcript version, so a stale one is never served."""
+    suffix = f".v{version}" if version else ""
+    return f"{base_name}_transcription_with_speakers{suffix}.{extension}"
+
+
+class TranscriptExporter:
+    """Writes every enabled format in a single pass over the segments.
+
+    Each format goes to a temporary file in the output directory that is
+    renamed into place once complete, so readers never see partial files.
+    """
+
+    def __init__(self, session_id, base_name, formats=None, version=0):
+        if formats is None:
+            formats = settings.TRANSCRIPTION_EXPORT_FORMATS
+        unknown = set(formats) - set(FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown transcript formats: {sorted(unknown)}")
+        self.base_name = base_name
+        self.version = version
+        self.output_dir = transcription_dir(session_id, base_name)
+        self.formats = [FORMATS[extension]() for extension in formats]
+
+    def path_for(self, extension):
+        return self.output_dir / transcription_file_name(
+            self.base_name, extension, self.version
+        )
+
+    def clear(self):
+        """Delete renders of other transcript versions.
+
+        The directory and in-progress temporary files stay, since on-demand
+        renders may be writing there concurrently.
+        """
+        current = {
+            transcription_file_name(self.base_name, extension, self.version)
+            for extension in FORMATS
+        }
+        try:
+            paths = list(self.output_dir.iterdir())
+        except FileNotFoundError:
+            return
+        for path in paths:
+            if path.suffix == ".tmp" or path.name in current:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def export(self, transcription, segments):
+        if not self.formats:
+            return {}
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        outputs = []
+        try:
+            for output_format in self.formats:
+                f = tempfile.NamedTemporaryFile(
+                    mode="w",
+                    encoding="utf-8",
+                    buffering=WRITE_BUFFER_SIZE,
+                    dir=self.output_dir,
+                    suffix=".tmp",
+                    delete=False,
+                )
+                outputs.append((output_format, f))
+                output_format.begin(f, transcription)
+
+            for index, segment in enumerate(segments, start=1):
+                speaker = segment.get("speaker", "UNKNOWN")
+                for output_format, f in outputs:
+                    output_format.write_segment(f, index, segment, speaker)
+
+            paths = {}
+            for output_format, f in outputs:
+                output_format.end(f)
+                f.close()
+                path = self.path_for(output_format.extension)
+                # NamedTemporaryFile creates files readable by the owner only
+                os.chmod(f.name, 0o644)
+                os.replace(f.name, path)
+                paths[output_format.extension] = path
+        except BaseException:
+            for _, f in outputs:
+                f.close()
+                if os.path.exists(f.name):
+                    os.unlink(f.name)
+            raise
+
+        logger.info(f"Saved {', '.join(paths)} transcriptions to {self.output_dir}")
+        return paths
+
+
+def render_transcript(audio_file, extension):
+    """Path to a rendered transcript, rendering it from the stored segments once."""
+    path = Path(audio_file.get_file_path(extension))
+    if not path.exists():
+        transcription, segments = audio_file.get_transcript()
+        exporter = TranscriptExporter(
+            audio_file.id,
+            path.parent.name,
+            [extension],
+            version=audio_file.transcript_version,
+        )
+        exporter.export(transcription, segments)
+    return path
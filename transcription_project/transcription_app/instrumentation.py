@@ -0,0 +1,218 @@
+import cProfile
+import logging
+import resource
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from .models import JobStageMetric
+from .scheduler import queue_stats
+
+logger = logging.getLogger(__name__)
+
+# Stages being measured in this process, which CPU time and RSS can't tell apart
+_active = set()
+_active_lock = threading.Lock()
+
+
+def _reset_peak_rss():
+    """Restart the kernel's RSS high-water mark so it covers one stage."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes(reset):
+    if reset:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    # Lifetime peak of the worker process, in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def profile_path(audio_file_id, stage):
+    return Path(settings.MEDIA_ROOT) / "profiles" / str(audio_file_id) / f"{stage}.prof"
+
+
+class StageMeasurement:
+    def __init__(self):
+        self.audio_seconds = None
+        self.shared_process = False
+
+
+def _start(measurement):
+    """Track a running stage; True if it has the process to itself."""
+    with _active_lock:
+        if _active:
+            measurement.shared_process = True
+            for other in _active:
+                other.shared_process = True
+        _active.add(measurement)
+        return not measurement.shared_process
+
+
+def _finish(measurement):
+    with _active_lock:
+        _active.discard(measurement)
+
+
+@contextmanager
+def measure_stage(audio_file_id, stage, profile=False):
+    """Record wall time, CPU time and peak RSS of one pipeline stage.
+
+    CPU time and peak RSS are the worker process's, which includes the
+    threads PyTorch and ffmpeg readers start. When other stages run in the
+    same process (threads pool), the run is marked ``shared_process`` and
+    the RSS high-water mark is not reset under them.
+
+    The block may set ``audio_seconds`` on the yielded measurement so the
+    real-time factor can be computed. With ``profile``, the stage also runs
+    under cProfile and the stats are saved next to the job's other media.
+    """
+    measurement = StageMeasurement()
+    reset = _start(measurement) and _reset_peak_rss()
+    profiler = cProfile.Profile() if profile else None
+    status = "failed"
+    started_at = timezone.now()
+    wall_started = time.perf_counter()
+    cpu_started = time.process_time()
+    if profiler:
+        profiler.enable()
+    try:
+        yield measurement
+        status = "succeeded"
+    finally:
+        if profiler:
+            profiler.disable()
+        wall = time.perf_counter() - wall_started
+        cpu = time.process_time() - cpu_started
+        peak_rss = _peak_rss_bytes(reset)
+        _finish(measurement)
+        stats_path = ""
+        if profiler:
+            path = profile_path(audio_file_id, stage)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(path)
+            stats_path = str(path.relative_to(settings.MEDIA_ROOT))
+        try:
+            JobStageMetric.objects.create(
+                audio_file_id=audio_file_id,
+                stage=stage,
+                status=status,
+                worker=socket.gethostname(),
+                started_at=started_at,
+                wall_seconds=wall,
+                cpu_seconds=cpu,
+                peak_rss_bytes=peak_rss,
+                shared_process=measurement.shared_process,
+                audio_seconds=measurement.audio_seconds,
+                profile=stats_path,
+            )
+        except Exception as e:
+            # Metrics must never fail the job they describe
+            logger.warning(f"Could not record {stage} metrics: {e}")
+
+
+def render_prometheus():
+    """Aggregated stage metrics in the Prometheus text exposition format.
+
+    Totals are summed over the metrics still stored, so they drop when jobs
+    are deleted and are exposed as gauges. CPU time and peak RSS only count
+    runs that had their worker process to themselves.
+    """
+    exclusive = Q(shared_process=False)
+    rows = (
+        JobStageMetric.objects.values("stage", "status")
+        .annotate(
+            runs=Count("id"),
+            wall=Sum("wall_seconds"),
+            cpu=Sum("cpu_seconds", filter=exclusive),
+            audio=Sum("audio_seconds"),
+            peak_rss=Max("peak_rss_bytes", filter=exclusive),
+        )
+        .order_by("stage", "status")
+    )
+    metrics = [
+        ("runs", "transcription_stage_runs", "gauge", "Recorded pipeline stage runs"),
+        (
+            "wall",
+            "transcription_stage_wall_seconds",
+            "gauge",
+            "Wall-clock seconds spent in recorded pipeline stage runs",
+        ),
+        (
+            "cpu",
+            "transcription_stage_cpu_seconds",
+            "gauge",
+            "Worker process CPU seconds of recorded stage runs",
+        ),
+        (
+            "audio",
+            "transcription_stage_audio_seconds",
+            "gauge",
+            "Seconds of audio processed by recorded pipeline stage runs",
+        ),
+        (
+            "peak_rss",
+            "transcription_stage_peak_rss_bytes",
+            "gauge",
+            "Largest peak resident set size of a stage run",
+        ),
+    ]
+    lines = []
+    for key, name, metric_type, help_text in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for row in rows:
+            labels = f'stage="{row["stage"]}",status="{row["status"]}"'
+            lines.append(f"{name}{{{labels}}} {float(row[key] or 0)!r}")
+
+    queues = queue_stats()
+    queue_metrics = [
+        ("queued", "transcription_queue_depth", "gauge", "Jobs waiting for a slot"),
+        ("running", "transcription_queue_running", "gauge", "Jobs holding a slot"),
+        (
+            "backlog_seconds",
+            "transcription_queue_backlog_seconds",
+            "gauge",
+            "Estimated pipeline seconds of the queued jobs",
+        ),
+        (
+            "oldest_wait_seconds",
+            "transcription_queue_oldest_wait_seconds",
+            "gauge",
+            "How long the oldest queued job has waited",
+        ),
+        (
+            "dispatched",
+            "transcription_queue_dispatched",
+            "gauge",
+            "Recorded jobs started from the queue",
+        ),
+        (
+            "wait_seconds",
+            "transcription_queue_wait_seconds",
+            "gauge",
+            "Seconds recorded started jobs spent queued",
+        ),
+    ]
+    for key, name, metric_type, help_text in queue_metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for tier, stats in sorted(queues.items()):
+            lines.append(f'{name}{{tier="{tier}"}} {float(stats[key])!r}')
+    return "\n".join(lines) + "\n"
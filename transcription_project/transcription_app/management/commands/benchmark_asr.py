@@ -0,0 +1,155 @@
+import gc
+import json
+import os
+import platform
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transcription_app.asr_backends import AsrConfig
+from transcription_app.audio_decoding import SAMPLE_RATE, decode_audio
+from transcription_app.model_registry import get_asr_model
+from transcription_app.search import tokenize
+
+AUDIO_SUFFIXES = {".wav", ".flac", ".mp3", ".m4a", ".ogg", ".webm"}
+
+
+def edit_distance(reference, hypothesis):
+    """Word-level Levenshtein distance."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ref_word != hyp_word),
+                )
+            )
+        previous = current
+    return previous[-1]
+
+
+def word_error_rate(references, hypotheses):
+    """Corpus WER: total word edits over total reference words."""
+    errors = words = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        reference, hypothesis = tokenize(reference), tokenize(hypothesis)
+        errors += edit_distance(reference, hypothesis)
+        words += len(reference)
+    return errors / max(words, 1)
+
+
+def load_corpus(directory):
+    """(name, audio path, reference text) for each audio file with a .txt next to it."""
+    corpus = []
+    for path in sorted(Path(directory).iterdir()):
+        reference = path.with_suffix(".txt")
+        if path.suffix.lower() in AUDIO_SUFFIXES and reference.is_file():
+            corpus.append((path.stem, path, reference.read_text()))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ASR backends and settings for accuracy (WER) and speed (real-time "
+        "factor) on a fixed corpus of audio files with reference transcripts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--corpus",
+            required=True,
+            help="Directory of audio files, each with a same-named .txt reference",
+        )
+        parser.add_argument(
+            "--config",
+            action="append",
+            dest="configs",
+            help="backend[:model[:compute_type]], e.g. whisper:base:int8; repeatable",
+        )
+        parser.add_argument("--threads", type=int)
+        parser.add_argument("--beam-size", type=int)
+        parser.add_argument("--language", default="en")
+        parser.add_argument("--output", help="Write results as JSON to this path")
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(options["corpus"]):
+            raise CommandError(f"No corpus directory at {options['corpus']}")
+        corpus = load_corpus(options["corpus"])
+        if not corpus:
+            raise CommandError("The corpus has no audio files with references")
+
+        configs = []
+        for spec in options["configs"] or ["whisper"]:
+            config = AsrConfig.parse(spec)
+            if options["threads"] is not None:
+                config.threads = options["threads"]
+            if options["beam_size"] is not None:
+                config.beam_size = options["beam_size"]
+            try:
+                config.validate(restrict_models=False)
+            except ValueError as e:
+                raise CommandError(f"{spec}: {e}")
+            configs.append(config)
+
+        audio = [decode_audio(path) for _, path, _ in corpus]
+        audio_seconds = sum(len(clip) for clip in audio) / SAMPLE_RATE
+        references = [reference for _, _, reference in corpus]
+        self.stdout.write(f"{len(corpus)} files, {audio_seconds:.1f}s of audio")
+
+        results = {}
+        for config in configs:
+            results[repr(config)] = self.benchmark(
+                config, audio, audio_seconds, references, options["language"]
+            )
+
+        self.stdout.write(f"{'config':>32} {'WER':>7} {'RTF':>7} {'load s':>7}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>32} {result['wer']:7.2%} {result['real_time_factor']:7.3f} "
+                f"{result['load_seconds']:7.1f}"
+            )
+        if options["output"]:
+            report = {
+                "meta": {
+                    "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "cpus": os.cpu_count(),
+                    "corpus": [name for name, _, _ in corpus],
+                    "audio_seconds": audio_seconds,
+                },
+                "results": results,
+            }
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def benchmark(self, config, audio, audio_seconds, references, language):
+        started = time.perf_counter()
+        model = get_asr_model(config)
+        load_seconds = time.perf_counter() - started
+        options = {"language": language, **config.decode_options()}
+
+        hypotheses = []
+        transcribe_seconds = 0.0
+        for clip in audio:
+            gc.collect()
+            started = time.perf_counter()
+            hypotheses.append(model.transcribe(clip, **options)["text"])
+            transcribe_seconds += time.perf_counter() - started
+        return {
+            "backend": config.backend,
+            "model": config.model_size,
+            "compute_type": config.compute_type,
+            "threads": config.threads,
+            "beam_size": config.beam_size,
+            "wer": word_error_rate(references, hypotheses),
+            "real_time_factor": transcribe_seconds / audio_seconds,
+            "transcribe_seconds": transcribe_seconds,
+            "load_seconds": load_seconds,
+            "hypotheses": hypotheses,
+        }
@@ -0,0 +1,131 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from transcription_app.models import AudioFile, CustomUser
+
+STATUSES = ["completed"] * 8 + ["failed", "pending"]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with audio files and measure page latency "
+        "of the audio-files list endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--pages", type=int, default=200)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--keepdb",
+            action="store_true",
+            help="Keep the seeded test database between runs",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, keepdb=options["keepdb"])
+        try:
+            users = self.seed(options)
+            self.measure(users[0], options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options["keepdb"]
+            )
+            teardown_test_environment()
+
+    def seed(self, options):
+        users = list(CustomUser.objects.order_by("id")[: options["users"]])
+        if AudioFile.objects.exists():
+            self.stdout.write("Reusing seeded database")
+            return users
+
+        users = CustomUser.objects.bulk_create(
+            CustomUser(username=f"bench{i}", email=f"bench{i}@example.com")
+            for i in range(options["users"])
+        )
+        users = list(CustomUser.objects.order_by("id"))
+
+        rng = random.Random(options["seed"])
+        now = timezone.now()
+        started = time.perf_counter()
+        for batch_start in range(0, options["rows"], options["batch_size"]):
+            files = []
+            for i in range(
+                batch_start, min(options["rows"], batch_start + options["batch_size"])
+            ):
+                status = rng.choice(STATUSES)
+                files.append(
+                    AudioFile(
+                        user=rng.choice(users),
+                        file=f"uploads/{i}.wav",
+                        processed=status == "completed",
+                        status=status,
+                    )
+                )
+            with transaction.atomic():
+                files = AudioFile.objects.bulk_create(files)
+                # auto_now_add stamps every row with the same time; bulk_update
+                # writes the spread-out upload times as they are
+                for audio_file in files:
+                    audio_file.uploaded_at = now - datetime.timedelta(
+                        seconds=rng.randint(0, 365 * 86400)
+                    )
+                AudioFile.objects.bulk_update(files, ["uploaded_at"], batch_size=1000)
+        self.stdout.write(
+            f"Seeded {options['rows']} rows for {len(users)} users "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+        return users
+
+    def measure(self, user, options):
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse("audiofile-list")
+        month_ago = (timezone.now() - datetime.timedelta(days=30)).isoformat()
+        scenarios = [
+            ("all", {}),
+            ("status=failed", {"status": "failed"}),
+            ("last 30 days", {"uploaded_after": month_ago}),
+        ]
+
+        for label, params in scenarios:
+            timings = []
+            next_url = None
+            for _ in range(options["pages"]):
+                started = time.perf_counter()
+                if next_url:
+                    response = client.get(next_url)
+                else:
+                    response = client.get(
+                        url, {**params, "page_size": options["page_size"]}
+                    )
+                timings.append((time.perf_counter() - started) * 1000)
+                next_url = response.data["next"]
+                if not next_url:
+                    break
+
+            self.stdout.write(
+                f"{label:>15}: {len(timings)} pages, "
+                f"p50 {statistics.median(timings):.2f}ms, "
+                f"p95 {percentile(timings, 0.95):.2f}ms, "
+                f"max {max(timings):.2f}ms"
+            )
@@ -0,0 +1,373 @@
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from pyannote.core import Annotation, Segment
+from rest_framework_simplejwt.tokens import AccessToken
+
+from transcription_app.asr_backends import AsrConfig
+from transcription_app.audio_decoding import SAMPLE_RATE
+from transcription_app.exporters import FORMATS
+from transcription_app.model_registry import get_registry
+from transcription_app.segment_store import SegmentStore
+from transcription_app.transcription_service import TranscriptionService
+
+STUB_MODEL = "benchmark-stub"
+SEGMENT_SECONDS = 4.0
+TURN_SECONDS = 7.0
+WORDS = "the budget for next quarter looks fine so we can hire two more people".split()
+
+
+class StubWhisperModel:
+    """Deterministic stand-in for a Whisper model: one segment every 4s."""
+
+    def transcribe(self, audio, **options):
+        duration = len(audio) / SAMPLE_RATE
+        segments = []
+        for index, start in enumerate(np.arange(0, duration, SEGMENT_SECONDS)):
+            end = min(duration, start + SEGMENT_SECONDS)
+            words = [WORDS[(index + i) % len(WORDS)] for i in range(8)]
+            segments.append(
+                {
+                    "id": index,
+                    "start": float(start),
+                    "end": float(end),
+                    "text": " " + " ".join(words) + ".",
+                    "tokens": list(range(16)),
+                    "avg_logprob": -0.25,
+                    "no_speech_prob": 0.01,
+                }
+            )
+        return {"text": "".join(s["text"] for s in segments), "segments": segments}
+
+
+class StubDiarizationPipeline:
+    """Alternates three speakers every 7s, like a round-table meeting."""
+
+    def __call__(self, audio, hook=None, return_embeddings=False):
+        duration = audio["waveform"].shape[-1] / audio["sample_rate"]
+        annotation = Annotation()
+        for index, start in enumerate(np.arange(0, duration, TURN_SECONDS)):
+            end = min(duration, start + TURN_SECONDS)
+            annotation[Segment(start, end)] = f"SPEAKER_{index % 3:02d}"
+        embeddings = np.random.default_rng(0).standard_normal((3, 256))
+        return (annotation, embeddings) if return_embeddings else annotation
+
+
+def synthetic_wav(path, seconds, seed=0):
+    """Speech-like audio: noise bursts with pauses, so VAD finds split points."""
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * SAMPLE_RATE)
+    audio = rng.normal(0, 0.1, samples)
+    envelope = (np.sin(np.arange(samples) / SAMPLE_RATE * np.pi / 3) > -0.6).astype(
+        np.float64
+    )
+    audio *= envelope
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def timed(function, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        # Don't bill this run for garbage left by the previous one
+        gc.collect()
+        started = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - started)
+    return result, timings
+
+
+def stage_summary(timings, audio_seconds):
+    median = statistics.median(timings)
+    return {
+        "metric": "median_seconds",
+        "median_seconds": median,
+        "min_seconds": min(timings),
+        "max_seconds": max(timings),
+        "real_time_factor": median / audio_seconds,
+    }
+
+
+def latency_summary(latencies, elapsed):
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "metric": "p95_ms",
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "max_ms": float(latencies_ms.max()),
+        "requests_per_second": len(latencies) / elapsed,
+    }
+
+
+def compare_results(baseline, current, max_regression, min_delta_seconds):
+    """(name, baseline, current) for every benchmark that got slower.
+
+    A benchmark regresses when its headline metric grew by more than
+    ``max_regression`` (a fraction) and by more than ``min_delta_seconds``,
+    which keeps noise on sub-millisecond measurements from failing runs.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or before.get("metric") != result["metric"]:
+            continue
+        metric = result["metric"]
+        old, new = before[metric], result[metric]
+        delta_seconds = (new - old) / (1000 if metric.endswith("_ms") else 1)
+        if new > old * (1 + max_regression) and delta_seconds > min_delta_seconds:
+            regressions.append((name, old, new))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the pipeline stages and REST endpoints offline with synthetic "
+        "audio and stub models, optionally failing on regressions"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--duration", type=float, default=600)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument(
+            "--whisper-model",
+            default=STUB_MODEL,
+            help="A real Whisper size (e.g. tiny) instead of the stub",
+        )
+        parser.add_argument("--files", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--skip-api", action="store_true")
+        parser.add_argument("--output", help="Write results as JSON to this path")
+        parser.add_argument("--baseline", help="Results JSON to compare against")
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            default=0.25,
+            help="Allowed slowdown against the baseline, as a fraction",
+        )
+        parser.add_argument(
+            "--min-delta-ms",
+            type=float,
+            default=5.0,
+            help="Slowdowns smaller than this never count as regressions",
+        )
+
+    def handle(self, *args, **options):
+        work_dir = tempfile.mkdtemp(prefix="transcription-benchmark-")
+        registry = get_registry()
+        registry.get(AsrConfig(model_size=STUB_MODEL).model_key(), StubWhisperModel)
+        registry.get(
+            ("pyannote", STUB_MODEL, settings.TRANSCRIPTION_DEVICE),
+            StubDiarizationPipeline,
+        )
+        try:
+            with override_settings(
+                MEDIA_ROOT=work_dir,
+                PYANNOTE_DIARIZATION_MODEL=STUB_MODEL,
+                TRANSCRIPTION_EXPORT_FORMATS=list(FORMATS),
+            ):
+                results, segments = self.benchmark_stages(work_dir, options)
+                if not options["skip_api"]:
+                    results.update(self.benchmark_api(segments, options))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "machine": platform.machine(),
+                "cpus": os.cpu_count(),
+                "options": {
+                    key: options[key]
+                    for key in (
+                        "duration",
+                        "repeat",
+                        "whisper_model",
+                        "files",
+                        "requests",
+                        "concurrency",
+                    )
+                },
+            },
+            "results": results,
+        }
+        for name, result in results.items():
+            headline = result[result["metric"]]
+            self.stdout.write(f"{name:>24}: {result['metric']} {headline:.4f}")
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                baseline = json.load(f)
+            regressions = compare_results(
+                baseline,
+                report,
+                options["max_regression"],
+                options["min_delta_ms"] / 1000,
+            )
+            for name, old, new in regressions:
+                self.stderr.write(f"{name} regressed: {old:.4f} -> {new:.4f}")
+            if regressions:
+                raise CommandError(
+                    f"{len(regressions)} benchmark(s) regressed by more than "
+                    f"{options['max_regression']:.0%}"
+                )
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline"))
+
+    def benchmark_stages(self, work_dir, options):
+        seconds = options["duration"]
+        repeat = options["repeat"]
+        wav_path = os.path.join(work_dir, "benchmark.wav")
+        synthetic_wav(wav_path, seconds)
+        service = TranscriptionService("benchmark", options["whisper_model"])
+        results = {}
+
+        audio, timings = timed(
+            lambda: service.load_audio(
+                wav_path, mmap_path=os.path.join(work_dir, "audio.pcm")
+            ),
+            repeat,
+        )
+        results["stage.decode"] = stage_summary(timings, seconds)
+
+        speech, timings = timed(lambda: service.speech_map(audio), repeat)
+        results["stage.vad"] = stage_summary(timings, seconds)
+        if speech is not None:
+            results["stage.vad"]["speech_ratio"] = speech.speech_ratio
+
+        segments, timings = timed(
+            lambda: [
+                s for batch in service.iter_transcribe(audio, speech) for s in batch
+            ],
+            repeat,
+        )
+        results["stage.transcribe"] = stage_summary(timings, seconds)
+
+        turns, timings = timed(lambda: service.diarize(audio, speech=speech), repeat)
+        results["stage.diarize"] = stage_summary(timings, seconds)
+
+        def merge():
+            merged = service.assign_speakers([dict(s) for s in segments], turns)
+            return SegmentStore.from_bytes(
+                SegmentStore.from_segments(merged).to_bytes()
+            )
+
+        store, timings = timed(merge, repeat)
+        results["stage.merge"] = stage_summary(timings, seconds)
+
+        text = "".join(segment["text"] for segment in segments)
+        _, timings = timed(
+            lambda: service.export_transcription(text, store, wav_path), repeat
+        )
+        results["stage.export"] = stage_summary(timings, seconds)
+        return results, list(store)
+
+    def benchmark_api(self, segments, options):
+        from transcription_app.models import AudioFile, CustomUser
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            user = CustomUser.objects.create_user(
+                username="benchmark", email="benchmark@example.com", password="x" * 12
+            )
+            text = "".join(segment["text"] for segment in segments)
+            segment_data = SegmentStore.from_segments(segments).to_bytes()
+            AudioFile.objects.bulk_create(
+                AudioFile(
+                    user=user,
+                    file=f"uploads/benchmark-{index}.wav",
+                    status="completed",
+                    processed=True,
+                    transcription_text=text,
+                    segment_data=segment_data,
+                )
+                for index in range(options["files"])
+            )
+            ids = list(AudioFile.objects.values_list("id", flat=True))
+            headers = {"HTTP_AUTHORIZATION": f"Bearer {AccessToken.for_user(user)}"}
+            endpoints = {
+                "api.list": lambda i: "/api/audio-files/",
+                "api.transcription": lambda i: (
+                    f"/api/audio-files/{ids[i % len(ids)]}/transcription/"
+                ),
+                "api.download": lambda i: (
+                    f"/api/audio-files/{ids[i % len(ids)]}/download/?format=srt"
+                ),
+            }
+            return {
+                name: self.load_test(path, headers, options)
+                for name, path in endpoints.items()
+            }
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def load_test(self, path, headers, options):
+        local = threading.local()
+
+        def get(index):
+            response = local.client.get(path(index), **headers)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            if response.status_code != 200:
+                raise CommandError(f"{path(index)} answered {response.status_code}")
+
+        def warm_up():
+            # Each thread opens its own database connection on first use
+            local.client = Client()
+            get(0)
+
+        def request(index):
+            started = time.perf_counter()
+            get(index)
+            return time.perf_counter() - started
+
+        with ThreadPoolExecutor(
+            options["concurrency"], initializer=warm_up
+        ) as executor:
+            list(executor.map(lambda _: None, range(options["concurrency"])))
+            gc.collect()
+            started = time.perf_counter()
+            latencies = list(executor.map(request, range(options["requests"])))
+        return latency_summary(latencies, time.perf_counter() - started)
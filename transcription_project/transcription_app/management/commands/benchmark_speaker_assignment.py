@@ -0,0 +1,70 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from transcription_app.speaker_assignment import (
+    label_intervals,
+    label_intervals_bruteforce,
+)
+
+
+def synthetic_timeline(count, rng, labels=None):
+    """Back-to-back intervals with jittered lengths and small overlaps."""
+    items = []
+    position = 0.0
+    for _ in range(count):
+        length = rng.uniform(0.5, 6.0)
+        start = max(0.0, position - rng.uniform(0.0, 0.3))
+        end = position + length
+        if labels:
+            items.append((start, end, rng.choice(labels)))
+        else:
+            items.append((start, end))
+        position = end + rng.uniform(0.0, 0.5)
+    return items
+
+
+class Command(BaseCommand):
+    help = "Compare sweep-line speaker assignment against the pairwise baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--segments", type=int, default=10000)
+        parser.add_argument("--turns", type=int, default=10000)
+        parser.add_argument("--speakers", type=int, default=8)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--skip-baseline",
+            action="store_true",
+            help="Only time the sweep-line implementation",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        speakers = [f"SPEAKER_{i:02d}" for i in range(options["speakers"])]
+        segments = synthetic_timeline(options["segments"], rng)
+        turns = synthetic_timeline(options["turns"], rng, labels=speakers)
+
+        started = time.perf_counter()
+        labels = label_intervals(segments, turns)
+        sweep_time = time.perf_counter() - started
+        self.stdout.write(
+            f"sweep-line: {len(segments)} segments x {len(turns)} turns "
+            f"in {sweep_time:.3f}s"
+        )
+
+        if options["skip_baseline"]:
+            return
+
+        started = time.perf_counter()
+        expected = label_intervals_bruteforce(segments, turns)
+        baseline_time = time.perf_counter() - started
+        self.stdout.write(f"pairwise:   {baseline_time:.3f}s")
+
+        if labels != expected:
+            raise CommandError("Label mismatch between implementations")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Identical labels, {baseline_time / sweep_time:.0f}x faster"
+            )
+        )
@@ -0,0 +1,87 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from transcription_app.speaker_embeddings import normalize
+from transcription_app.speaker_index import SpeakerIndex
+
+
+def synthetic_voices(speakers, per_speaker, dim, noise, rng):
+    """Embeddings scattered around one random direction per speaker."""
+    centres = normalize(rng.standard_normal((speakers, dim)))
+    labels = np.repeat(np.arange(speakers), per_speaker)
+    embeddings = centres[labels] + noise * rng.standard_normal(
+        (len(labels), dim)
+    ).astype(np.float32) / np.sqrt(dim)
+    return centres, normalize(embeddings), labels
+
+
+class Command(BaseCommand):
+    help = "Time per-speaker lookups in a speaker index against exhaustive search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--embeddings", type=int, default=100000)
+        parser.add_argument("--speakers", type=int, default=2000)
+        parser.add_argument("--dim", type=int, default=256)
+        parser.add_argument("--queries", type=int, default=1000)
+        parser.add_argument("--nprobe", type=int, default=8)
+        parser.add_argument("--noise", type=float, default=1.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--budget-ms",
+            type=float,
+            default=1.0,
+            help="Fail if the p95 single-speaker lookup is slower than this",
+        )
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options["seed"])
+        per_speaker = max(1, options["embeddings"] // options["speakers"])
+        centres, embeddings, labels = synthetic_voices(
+            options["speakers"], per_speaker, options["dim"], options["noise"], rng
+        )
+        truth = rng.integers(0, options["speakers"], options["queries"])
+        queries = normalize(
+            centres[truth]
+            + options["noise"]
+            * rng.standard_normal((len(truth), options["dim"])).astype(np.float32)
+            / np.sqrt(options["dim"])
+        )
+
+        started = time.perf_counter()
+        index = SpeakerIndex(embeddings, labels, nprobe=options["nprobe"])
+        self.stdout.write(
+            f"index: {len(index)} embeddings x {options['dim']} dims "
+            f"built in {time.perf_counter() - started:.2f}s"
+        )
+        exhaustive = SpeakerIndex(embeddings, labels, ivf_min_size=len(labels) + 1)
+
+        timings = {}
+        for name, candidate in (("ivf", index), ("exhaustive", exhaustive)):
+            candidate.search(queries[:1])  # warm up BLAS
+            single = []
+            for query in queries:
+                started = time.perf_counter()
+                candidate.search(query)
+                single.append(time.perf_counter() - started)
+            started = time.perf_counter()
+            found, _ = candidate.search(queries)
+            bulk = (time.perf_counter() - started) / len(queries)
+            single_ms = np.array(single) * 1000
+            timings[name] = (found.astype(int), np.percentile(single_ms, 95))
+            self.stdout.write(
+                f"{name:>10}: single p50 {np.percentile(single_ms, 50):.3f}ms "
+                f"p95 {np.percentile(single_ms, 95):.3f}ms, "
+                f"bulk {bulk * 1000:.3f}ms per speaker, "
+                f"accuracy {np.mean(found.astype(int) == truth):.3f}"
+            )
+
+        found, p95 = timings["ivf"]
+        recall = np.mean(found == timings["exhaustive"][0])
+        self.stdout.write(f"agreement with exhaustive search: {recall:.3f}")
+        if p95 > options["budget_ms"]:
+            raise CommandError(
+                f"p95 lookup {p95:.3f}ms exceeds the {options['budget_ms']}ms budget"
+            )
+        self.stdout.write(self.style.SUCCESS("p95 lookup within budget"))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from transcription_app import search
+from transcription_app.models import AudioFile
+
+
+class Command(BaseCommand):
+    help = "Rebuild the transcript search index from completed audio files"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Only reindex this user id")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        audio_files = AudioFile.objects.filter(
+            Q(segment_data__isnull=False) | Q(transcription_json__isnull=False),
+            processed=True,
+        ).only(
+            "id", "user_id", "transcription_text", "transcription_json", "segment_data"
+        )
+        if options["user"]:
+            audio_files = audio_files.filter(user_id=options["user"])
+
+        started = time.perf_counter()
+        files = segments = 0
+        for audio_file in audio_files.iterator(chunk_size=options["batch_size"]):
+            segments += search.index_transcript(audio_file)
+            files += 1
+            if files % options["batch_size"] == 0:
+                self.stdout.write(f"{files} files, {segments} segments")
+        search.optimize()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {segments} segments from {files} files "
+                f"in {time.perf_counter() - started:.1f}s ({search.backend()})"
+            )
+        )
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audiofile",
+            name="transcription_mode",
+            field=models.CharField(
+                choices=[("standard", "Standard"), ("chunked", "Chunked")],
+                default="standard",
+                max_length=20,
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0003_uploadsession"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TranscriptionResult",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content_hash", models.CharField(max_length=64)),
+                ("config_key", models.CharField(max_length=64)),
+                ("transcription_text", models.TextField(blank=True)),
+                ("transcription_json", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="audiofile",
+            name="content_hash",
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddConstraint(
+            model_name="transcriptionresult",
+            constraint=models.UniqueConstraint(
+                fields=("content_hash", "config_key"), name="unique_result_per_config"
+            ),
+        ),
+    ]
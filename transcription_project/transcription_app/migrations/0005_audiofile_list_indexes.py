@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "transcription_app",
+            "0004_transcriptionresult_audiofile_content_hash_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="audiofile",
+            index=models.Index(
+                fields=["user", "-uploaded_at", "-id"], name="audiofile_user_uploaded"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="audiofile",
+            index=models.Index(
+                fields=["user", "status", "-uploaded_at", "-id"],
+                name="audiofile_user_status",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="audiofile",
+            index=models.Index(fields=["status"], name="audiofile_status"),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-17 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0005_audiofile_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audiofile",
+            name="progress",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="audiofile",
+            name="stage",
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
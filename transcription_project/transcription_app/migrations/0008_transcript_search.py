@@ -0,0 +1,136 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import DatabaseError, migrations, models
+
+FTS_TABLE = "transcription_app_segment_fts"
+SEGMENT_TABLE = "transcription_app_transcriptsegment"
+
+CREATE_FTS = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        text, content='{SEGMENT_TABLE}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {SEGMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {SEGMENT_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF text ON {SEGMENT_TABLE}
+    BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+
+def create_fts(apps, schema_editor):
+    """SQLite builds with FTS5 get a full-text index kept in sync by triggers.
+
+    Other databases fall back to the SearchPosting inverted index.
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    try:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp.fts5_probe")
+    except DatabaseError:
+        return
+    for statement in CREATE_FTS:
+        schema_editor.execute(statement)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0007_speaker_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TranscriptSegment",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("position", models.PositiveIntegerField()),
+                ("speaker", models.CharField(blank=True, max_length=100)),
+                ("start", models.FloatField()),
+                ("end", models.FloatField()),
+                ("text", models.TextField()),
+                (
+                    "audio_file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_segments",
+                        to="transcription_app.audiofile",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SearchPosting",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("term", models.CharField(max_length=64)),
+                ("frequency", models.PositiveSmallIntegerField(default=1)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "segment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="postings",
+                        to="transcription_app.transcriptsegment",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="transcriptsegment",
+            index=models.Index(
+                fields=["audio_file", "position"], name="segment_position"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="searchposting",
+            index=models.Index(fields=["user", "term"], name="posting_user_term"),
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0008_transcript_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audiofile",
+            name="segment_data",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="transcriptionresult",
+            name="segment_data",
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="transcriptionresult",
+            name="transcription_json",
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0009_segment_data"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audiofile",
+            name="profile",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="JobStageMetric",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("stage", models.CharField(max_length=20)),
+                ("status", models.CharField(max_length=20)),
+                ("worker", models.CharField(blank=True, max_length=255)),
+                ("started_at", models.DateTimeField()),
+                ("wall_seconds", models.FloatField()),
+                ("cpu_seconds", models.FloatField()),
+                ("peak_rss_bytes", models.BigIntegerField()),
+                ("audio_seconds", models.FloatField(blank=True, null=True)),
+                ("profile", models.CharField(blank=True, max_length=255)),
+                (
+                    "audio_file",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stage_metrics",
+                        to="transcription_app.audiofile",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["stage", "status"], name="stage_metric_stage")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0010_stage_metrics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audiofile",
+            name="asr_backend",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="audiofile",
+            name="asr_compute_type",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="audiofile",
+            name="asr_model",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0011_audiofile_asr"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="tier",
+            field=models.CharField(
+                choices=[("free", "Free"), ("paid", "Paid")],
+                default="free",
+                max_length=20,
+            ),
+        ),
+        migrations.CreateModel(
+            name="JobQueueEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("tier", models.CharField(max_length=20)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("running", "Running"),
+                            ("done", "Done"),
+                        ],
+                        default="queued",
+                        max_length=20,
+                    ),
+                ),
+                ("priority", models.IntegerField(default=0)),
+                ("audio_seconds", models.FloatField(blank=True, null=True)),
+                ("estimated_seconds", models.FloatField(blank=True, null=True)),
+                ("enqueued_at", models.DateTimeField(auto_now_add=True)),
+                ("dispatched_at", models.DateTimeField(blank=True, null=True)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "audio_file",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="queue_entry",
+                        to="transcription_app.audiofile",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["state", "user"], name="queue_entry_state_user"
+                    )
+                ],
+            },
+        ),
+    ]
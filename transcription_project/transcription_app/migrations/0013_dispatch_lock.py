@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:34
+
+from django.db import migrations, models
+
+
+def create_lock(apps, schema_editor):
+    apps.get_model("transcription_app", "DispatchLock").objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0012_job_queue"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DispatchLock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_lock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0013_dispatch_lock"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="jobstagemetric",
+            name="shared_process",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0014_stage_metric_shared_process"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="audiofile",
+            name="transcript_version",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
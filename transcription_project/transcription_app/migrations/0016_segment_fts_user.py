@@ -0,0 +1,60 @@
+from django.db import migrations
+
+FTS_TABLE = "transcription_app_segment_fts"
+SEGMENT_TABLE = "transcription_app_transcriptsegment"
+
+
+def fts_statements(columns):
+    """The FTS5 table and its sync triggers for ``columns`` of the segments."""
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    return [
+        f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+            {names}, content='{SEGMENT_TABLE}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )""",
+        f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {SEGMENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {names}) VALUES (new.id, {new});
+        END""",
+        f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {SEGMENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {names})
+            VALUES ('delete', old.id, {old});
+        END""",
+        f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF {names}
+        ON {SEGMENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {names})
+            VALUES ('delete', old.id, {old});
+            INSERT INTO {FTS_TABLE}(rowid, {names}) VALUES (new.id, {new});
+        END""",
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+    ]
+
+
+def rebuild_fts(columns):
+    def rebuild(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != "sqlite":
+            return
+        if FTS_TABLE not in connection.introspection.table_names():
+            # No FTS5 in this SQLite build; search uses the inverted index
+            return
+        for action in ("insert", "delete", "update"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{action}")
+        schema_editor.execute(f"DROP TABLE {FTS_TABLE}")
+        for statement in fts_statements(columns):
+            schema_editor.execute(statement)
+
+    return rebuild
+
+
+class Migration(migrations.Migration):
+    """Index each segment's user id so searches are scoped inside the MATCH."""
+
+    dependencies = [
+        ("transcription_app", "0015_audiofile_transcript_version"),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_fts(["text", "user_id"]), rebuild_fts(["text"])),
+    ]
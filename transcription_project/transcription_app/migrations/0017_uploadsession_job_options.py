@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-17 14:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("transcription_app", "0016_segment_fts_user"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadsession",
+            name="asr_backend",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="uploadsession",
+            name="asr_compute_type",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="uploadsession",
+            name="asr_model",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="uploadsession",
+            name="profile",
+            field=models.BooleanField(default=False),
+        ),
+    ]
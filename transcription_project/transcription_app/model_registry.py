@@ -0,0 +1,134 @@
+import gc
+import logging
+import threading
+from collections import OrderedDict
+
+import torch
+from django.conf import settings
+from pyannote.audio import Pipeline
+
+from .asr_backends import AsrConfig, load_backend
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Process-wide LRU cache of loaded models, keyed by (kind, name, device)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._models = OrderedDict()
+        self._inference_locks = {}
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def __len__(self):
+        return len(self._models)
+
+    def keys(self):
+        return list(self._models)
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                return self._models[key]
+
+            logger.info(f"Loading model {key}")
+            model = loader()
+            if model is None:
+                raise RuntimeError(f"Model loader returned nothing for {key}")
+            self._models[key] = model
+            self._evict()
+            return model
+
+    def inference_lock(self, key):
+        """Lock serializing inference on one model across threads.
+
+        Whisper installs per-call hooks on shared modules while decoding, so
+        a model instance must not run two decodes at once.
+        """
+        with self._lock:
+            return self._inference_locks.setdefault(key, threading.Lock())
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+            self._release_memory()
+
+    def _evict(self):
+        evicted = False
+        while self.max_size and len(self._models) > self.max_size:
+            key, _ = self._models.popitem(last=False)
+            logger.info(f"Evicted model {key} from registry")
+            evicted = True
+        if evicted:
+            self._release_memory()
+
+    @staticmethod
+    def _release_memory():
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry(settings.TRANSCRIPTION_MODEL_CACHE_SIZE)
+    return _registry
+
+
+def get_asr_model(config=None):
+    config = config or AsrConfig()
+    return get_registry().get(config.model_key(), lambda: load_backend(config))
+
+
+def asr_inference_lock(config=None):
+    config = config or AsrConfig()
+    return get_registry().inference_lock(config.model_key())
+
+
+def _plain_whisper(size, device):
+    return AsrConfig("whisper", size, "float32", device=device)
+
+
+def get_whisper_model(size=None, device=None):
+    """The bare fp32 Whisper model, shared with the default ASR backend."""
+    return get_asr_model(_plain_whisper(size, device)).model
+
+
+def whisper_inference_lock(size=None, device=None):
+    return asr_inference_lock(_plain_whisper(size, device))
+
+
+def get_diarization_pipeline(name=None, device=None):
+    name = name or settings.PYANNOTE_DIARIZATION_MODEL
+    device = device or settings.TRANSCRIPTION_DEVICE
+
+    def load():
+        pipeline = Pipeline.from_pretrained(
+            name, use_auth_token=settings.PYANNOTE_AUTH_TOKEN
+        )
+        if pipeline is not None and device != "cpu":
+            pipeline.to(torch.device(device))
+        return pipeline
+
+    return get_registry().get(("pyannote", name, device), load)
+
+
+def warm_up():
+    """Load the default models so the first task doesn't pay for it."""
+    for loader in (get_asr_model, get_diarization_pipeline):
+        try:
+            loader()
+        except Exception as e:
+            logger.error(f"Failed to warm up {loader.__name__}: {str(e)}")
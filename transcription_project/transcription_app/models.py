@@ -2,33 +2,88 @@ from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.conf import settings
 import os
+import uuid
+from .exporters import transcription_dir, transcription_file_name
+from .segment_store import load_segments
 
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
     username = models.CharField(max_length=150, unique=True)
+    # Key into TRANSCRIPTION_TIERS: scheduling weight, priority and job caps
+    tier = models.CharField(
+        max_length=20, choices=[("free", "Free"), ("paid", "Paid")], default="free"
+    )
     # Add any other fields you might need
 
 
 class AudioFile(models.Model):
+    TRANSCRIPTION_MODE_CHOICES = [
+        ("standard", "Standard"),
+        ("chunked", "Chunked"),
+    ]
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     file = models.FileField(upload_to="uploads/")
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
     status = models.CharField(max_length=20, default="pending")
+    # Pipeline stage currently running and how far through the audio it is
+    stage = models.CharField(max_length=20, blank=True)
+    progress = models.FloatField(default=0)
     transcription_text = models.TextField(blank=True, null=True)
+    # Written before segment_data existed; new transcripts use segment_data
     transcription_json = models.JSONField(blank=True, null=True)
+    # SegmentStore.to_bytes() of the finished transcript
+    segment_data = models.BinaryField(blank=True, null=True)
+    transcription_mode = models.CharField(
+        max_length=20, choices=TRANSCRIPTION_MODE_CHOICES, default="standard"
+    )
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # Run every pipeline stage of this job under cProfile
+    profile = models.BooleanField(default=False)
+    # Speech recognition for this job; blank uses the deployment's default
+    asr_backend = models.CharField(max_length=32, blank=True)
+    asr_model = models.CharField(max_length=64, blank=True)
+    asr_compute_type = models.CharField(max_length=32, blank=True)
+    # Bumped whenever a new transcript is stored; names its rendered files
+    transcript_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "-uploaded_at", "-id"], name="audiofile_user_uploaded"
+            ),
+            models.Index(
+                fields=["user", "status", "-uploaded_at", "-id"],
+                name="audiofile_user_status",
+            ),
+            models.Index(fields=["status"], name="audiofile_status"),
+        ]
 
     def get_file_path(self, extension):
         base_name = os.path.splitext(os.path.basename(self.file.name))[0]
         return os.path.join(
-            settings.MEDIA_ROOT,
-            "transcriptions",
-            str(self.user.id),
-            base_name,
-            f"{base_name}_transcription_with_speakers.{extension}",
+            transcription_dir(self.id, base_name),
+            transcription_file_name(base_name, extension, self.transcript_version),
         )
 
+    @property
+    def has_transcript(self):
+        return bool(self.segment_data or self.transcription_json)
+
+    def get_transcript(self):
+        """The full text and a SegmentStore of the transcript's segments."""
+        text = self.transcription_text
+        if text is None:
+            text = (self.transcription_json or {}).get("transcription", "")
+        return text, load_segments(self.segment_data, self.transcription_json)
+
+    def transcript_document(self):
+        """The transcript as JSON, built from the stored segments on demand."""
+        text, segments = self.get_transcript()
+        return segments.document(text)
+
     def get_file_url(self, extension):
         base_name = os.path.splitext(self.file.name)[0]
         return os.path.join(settings.MEDIA_URL, f"{base_name}.{extension}")
@@ -44,3 +99,189 @@ class AudioFile(models.Model):
 
     def get_json_url(self):
         return self.get_file_url("json")
+
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    transcription_mode = models.CharField(
+        max_length=20,
+        choices=AudioFile.TRANSCRIPTION_MODE_CHOICES,
+        default="standard",
+    )
+    # Job options copied to the AudioFile on finalize
+    profile = models.BooleanField(default=False)
+    asr_backend = models.CharField(max_length=32, blank=True)
+    asr_model = models.CharField(max_length=64, blank=True)
+    asr_compute_type = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    audio_file = models.OneToOneField(
+        AudioFile, blank=True, null=True, on_delete=models.SET_NULL
+    )
+
+    def get_part_path(self):
+        return os.path.join(settings.MEDIA_ROOT, "upload_sessions", f"{self.id}.part")
+
+
+class SpeakerProfile(models.Model):
+    """A person a user has named, recognised across their recordings."""
+
+    user = models.ForeignKey(
+        CustomUser, on_delete=models.CASCADE, related_name="speaker_profiles"
+    )
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "name"], name="unique_speaker_name_per_user"
+            )
+        ]
+
+
+class SpeakerEmbedding(models.Model):
+    """One enrolled voice sample: a unit-length float32 vector."""
+
+    profile = models.ForeignKey(
+        SpeakerProfile, on_delete=models.CASCADE, related_name="embeddings"
+    )
+    # Denormalised so a user's index loads without a join
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    audio_file = models.ForeignKey(
+        AudioFile, blank=True, null=True, on_delete=models.SET_NULL
+    )
+    vector = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class TranscriptSegment(models.Model):
+    """A completed transcript segment, as indexed for full-text search."""
+
+    audio_file = models.ForeignKey(
+        AudioFile, on_delete=models.CASCADE, related_name="search_segments"
+    )
+    # Denormalised so searches filter on one table
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    position = models.PositiveIntegerField()
+    speaker = models.CharField(max_length=100, blank=True)
+    start = models.FloatField()
+    end = models.FloatField()
+    text = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["audio_file", "position"], name="segment_position")
+        ]
+
+
+class SearchPosting(models.Model):
+    """Inverted index entry, used where SQLite FTS5 isn't available."""
+
+    term = models.CharField(max_length=64)
+    segment = models.ForeignKey(
+        TranscriptSegment, on_delete=models.CASCADE, related_name="postings"
+    )
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    frequency = models.PositiveSmallIntegerField(default=1)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "term"], name="posting_user_term")]
+
+
+class JobStageMetric(models.Model):
+    """Resources used by one run of one pipeline stage."""
+
+    audio_file = models.ForeignKey(
+        AudioFile, on_delete=models.CASCADE, related_name="stage_metrics"
+    )
+    stage = models.CharField(max_length=20)
+    status = models.CharField(max_length=20)
+    worker = models.CharField(max_length=255, blank=True)
+    started_at = models.DateTimeField()
+    wall_seconds = models.FloatField()
+    cpu_seconds = models.FloatField()
+    peak_rss_bytes = models.BigIntegerField()
+    # Other stages ran in the same worker process meanwhile (--pool threads),
+    # so cpu_seconds and peak_rss_bytes include theirs
+    shared_process = models.BooleanField(default=False)
+    # Length of the recording, once it has been decoded
+    audio_seconds = models.FloatField(blank=True, null=True)
+    # cProfile stats, relative to MEDIA_ROOT
+    profile = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["stage", "status"], name="stage_metric_stage"),
+        ]
+
+    @property
+    def real_time_factor(self):
+        """Wall time per second of audio; below 1 is faster than real time."""
+        if not self.audio_seconds:
+            return None
+        return self.wall_seconds / self.audio_seconds
+
+
+class JobQueueEntry(models.Model):
+    """A transcription job waiting for, holding or done with a pipeline slot."""
+
+    STATE_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+    ]
+
+    audio_file = models.OneToOneField(
+        AudioFile, on_delete=models.CASCADE, related_name="queue_entry"
+    )
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    # The user's tier when the job was submitted
+    tier = models.CharField(max_length=20)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default="queued")
+    # Higher runs first among a user's jobs and breaks ties between users
+    priority = models.IntegerField(default=0)
+    audio_seconds = models.FloatField(blank=True, null=True)
+    # Expected pipeline wall time from the recent real-time factor
+    estimated_seconds = models.FloatField(blank=True, null=True)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["state", "user"], name="queue_entry_state_user"),
+        ]
+
+    @property
+    def wait_seconds(self):
+        if self.dispatched_at is None:
+            return None
+        return (self.dispatched_at - self.enqueued_at).total_seconds()
+
+
+class DispatchLock(models.Model):
+    """Single row locked while the scheduler hands out pipeline slots."""
+
+    locked_at = models.DateTimeField(blank=True, null=True)
+
+
+class TranscriptionResult(models.Model):
+    """Transcription output cached by audio content hash and pipeline config."""
+
+    content_hash = models.CharField(max_length=64)
+    config_key = models.CharField(max_length=64)
+    transcription_text = models.TextField(blank=True)
+    transcription_json = models.JSONField(blank=True, null=True)
+    segment_data = models.BinaryField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["content_hash", "config_key"], name="unique_result_per_config"
+            )
+        ]
@@ -0,0 +1,10 @@
+from rest_framework.pagination import CursorPagination
+
+
+class AudioFileCursorPagination(CursorPagination):
+    """Keyset pagination over (uploaded_at, id), newest first."""
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = ("-uploaded_at", "-id")
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import AudioFile
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+def _key(audio_file_id):
+    return f"audio_file:{audio_file_id}:progress"
+
+
+class CacheChannel:
+    """Latest event per audio file in the "progress" cache, polled by readers.
+
+    Works with any cache shared by the web and worker processes and needs
+    nothing beyond Django itself.
+    """
+
+    def __init__(self):
+        self.cache = caches["progress"]
+
+    def publish(self, audio_file_id, event):
+        event = {**event, "time": time.time()}
+        self.cache.set(_key(audio_file_id), event, settings.TRANSCRIPTION_PROGRESS_TTL)
+
+    async def subscribe(self, audio_file_id):
+        """Yield events as they change, or None when a keep-alive is due."""
+        last = None
+        idle = 0.0
+        while True:
+            event = await self.cache.aget(_key(audio_file_id))
+            if event is not None and event != last:
+                last = event
+                idle = 0.0
+                yield event
+            elif idle >= settings.TRANSCRIPTION_PROGRESS_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield None
+            await asyncio.sleep(settings.TRANSCRIPTION_PROGRESS_POLL_SECONDS)
+            idle += settings.TRANSCRIPTION_PROGRESS_POLL_SECONDS
+
+
+class RedisChannel:
+    """Redis pub/sub, with the latest event kept for late subscribers."""
+
+    def __init__(self, url):
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, audio_file_id, event):
+        payload = json.dumps({**event, "time": time.time()})
+        pipe = self.client.pipeline()
+        pipe.set(_key(audio_file_id), payload, ex=settings.TRANSCRIPTION_PROGRESS_TTL)
+        pipe.publish(_key(audio_file_id), payload)
+        pipe.execute()
+
+    async def subscribe(self, audio_file_id):
+        """Yield published events, or None when a keep-alive is due."""
+        client = aioredis.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        keepalive = settings.TRANSCRIPTION_PROGRESS_KEEPALIVE_SECONDS
+        try:
+            await pubsub.subscribe(_key(audio_file_id))
+            latest = await client.get(_key(audio_file_id))
+            if latest is not None:
+                yield json.loads(latest)
+            last = time.monotonic()
+            while True:
+                # get_message also returns None early for control messages,
+                # so only wait out what is left of the keep-alive interval
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=max(keepalive - (time.monotonic() - last), 0),
+                )
+                if message is not None:
+                    last = time.monotonic()
+                    yield json.loads(message["data"])
+                elif time.monotonic() - last >= keepalive:
+                    last = time.monotonic()
+                    yield None
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_channel = None
+
+
+def get_channel():
+    global _channel
+    if _channel is None:
+        url = settings.TRANSCRIPTION_PROGRESS_REDIS_URL
+        if url and redis is None:
+            logger.warning("redis is not installed, publishing progress to the cache")
+        _channel = RedisChannel(url) if url and redis else CacheChannel()
+    return _channel
+
+
+def publish(audio_file_id, event):
+    # Progress is advisory, so a broken channel must not fail the job
+    try:
+        get_channel().publish(audio_file_id, event)
+    except Exception as e:
+        logger.error(f"Failed to publish progress for {audio_file_id}: {str(e)}")
+
+
+def set_status(audio_file_id, status, **fields):
+    """Write ``status`` (and any result ``fields``) in one UPDATE and announce it."""
+    AudioFile.objects.filter(id=audio_file_id).update(status=status, **fields)
+    publish(audio_file_id, {"status": status})
+
+
+class ProgressReporter:
+    """Reports how far a stage has got through the audio of one file.
+
+    Progress is published to the progress channel at most once per
+    TRANSCRIPTION_PROGRESS_INTERVAL_SECONDS. Only the start and end of a stage
+    are written to the database, touching just the stage and progress columns.
+    """
+
+    def __init__(self, audio_file_id):
+        self.audio_file_id = audio_file_id
+        self._stage = None
+        self._published_at = 0.0
+
+    def __call__(self, stage, percent):
+        percent = round(min(100.0, max(0.0, percent)), 1)
+        now = time.monotonic()
+        boundary = stage != self._stage or percent == 100
+        if (
+            not boundary
+            and now - self._published_at
+            < settings.TRANSCRIPTION_PROGRESS_INTERVAL_SECONDS
+        ):
+            return
+        if boundary:
+            self._stage = stage
+            AudioFile(id=self.audio_file_id, stage=stage, progress=percent).save(
+                update_fields=["stage", "progress"]
+            )
+        self._published_at = now
+        publish(
+            self.audio_file_id,
+            {"status": "processing", "stage": stage, "percent": percent},
+        )
@@ -0,0 +1,475 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import uuid
+import wave
+from collections import Counter
+from urllib.parse import parse_qs
+
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .audio_decoding import SAMPLE_RATE, ffmpeg_command
+from .batch_scheduler import get_batch_scheduler
+from .events import authenticate
+from .models import AudioFile
+from .result_cache import hash_file
+from .search import index_transcript
+from .segment_store import SegmentStore
+from .speaker_assignment import UNKNOWN_SPEAKER
+from .speaker_embeddings import OnlineSpeakerClustering, embed_clip
+from .vad import FRAME_SECONDS, frame_energy
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_PATH = "/ws/transcribe/"
+# Frames of quiet kept in front of an utterance
+LEAD_IN_FRAMES = 10
+WAV_BLOCK_SAMPLES = SAMPLE_RATE * 30
+
+# Open streams per user in this process
+_streams = Counter()
+
+
+def encode_window(audio):
+    """A window as base64 16-bit PCM, half the size of float32 for the broker."""
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+    return base64.b64encode(pcm).decode()
+
+
+def decode_window(data):
+    pcm = np.frombuffer(base64.b64decode(data), dtype="<i2")
+    return pcm.astype(np.float32) / 32768
+
+
+async def run_on_worker(task, audio):
+    """Result of ``task`` for one window, run on the "realtime" queue."""
+    result = task.delay(encode_window(audio))
+    return await sync_to_async(result.get, thread_sensitive=False)(
+        timeout=settings.TRANSCRIPTION_REALTIME_WORKER_TIMEOUT
+    )
+
+
+class StreamSegmenter:
+    """Cuts a live 16 kHz stream into utterance windows at pauses.
+
+    A window closes once speech has been followed by ``silence_seconds`` of
+    frames below ``energy_threshold``, or at the quietest frame of its second
+    half when it reaches ``max_seconds``, which bounds the latency of final
+    results. Silence between utterances is dropped.
+    """
+
+    def __init__(self, energy_threshold, silence_seconds, max_seconds):
+        self.energy_threshold = energy_threshold
+        self.frame_samples = int(SAMPLE_RATE * FRAME_SECONDS)
+        self.silence_frames = max(1, int(silence_seconds / FRAME_SECONDS))
+        self.max_frames = int(max_seconds / FRAME_SECONDS)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        # Stream position of buffer[0], in samples
+        self.start = 0
+        self.energies = []
+        self.speech_frames = 0
+        self.silent_run = 0
+
+    @property
+    def pending(self):
+        """(start, audio) of the utterance in progress, if any."""
+        if not self.speech_frames:
+            return None
+        return self.start, self.buffer
+
+    def feed(self, samples):
+        """Add samples; returns the windows they completed as (start, audio)."""
+        self.buffer = np.concatenate([self.buffer, samples.astype(np.float32)])
+        analyzed = len(self.energies) * self.frame_samples
+        new_energies = frame_energy(self.buffer[analyzed:], self.frame_samples)
+
+        windows = []
+        for energy in new_energies:
+            self.energies.append(float(energy))
+            if energy >= self.energy_threshold:
+                self.speech_frames += 1
+                self.silent_run = 0
+            else:
+                self.silent_run += 1
+
+            if self.speech_frames and self.silent_run >= self.silence_frames:
+                windows.append(self._cut(len(self.energies)))
+            elif not self.speech_frames and len(self.energies) > LEAD_IN_FRAMES:
+                self._drop(len(self.energies) - LEAD_IN_FRAMES)
+            elif len(self.energies) >= self.max_frames:
+                half = len(self.energies) // 2
+                quietest = half + int(np.argmin(self.energies[half:]))
+                windows.append(self._cut(quietest + 1))
+        return windows
+
+    def flush(self):
+        window = self.pending
+        self._drop(len(self.buffer) // self.frame_samples + 1)
+        return window
+
+    def _cut(self, frames):
+        window = (self.start, self.buffer[: frames * self.frame_samples])
+        self._drop(frames)
+        return window
+
+    def _drop(self, frames):
+        samples = min(len(self.buffer), frames * self.frame_samples)
+        self.buffer = self.buffer[samples:]
+        self.start += samples
+        self.energies = self.energies[frames:]
+        self.speech_frames = sum(
+            1 for energy in self.energies if energy >= self.energy_threshold
+        )
+        self.silent_run = 0
+        for energy in reversed(self.energies):
+            if energy >= self.energy_threshold:
+                break
+            self.silent_run += 1
+
+
+class RealtimeSession:
+    """Transcribes one live stream and persists it as an AudioFile at the end.
+
+    Windows are decoded, and speaker embeddings computed, on the
+    "realtime" Celery queue, whose workers share batched decodes between
+    concurrent streams. With TRANSCRIPTION_REALTIME_ON_WORKERS off they run
+    in this process instead. Final segments are sent in order;
+    partial results for the utterance in progress are sent whenever no
+    earlier partial is still being decoded.
+    """
+
+    def __init__(self, user, send):
+        self.user = user
+        self.send = send
+        self.id = uuid.uuid4().hex
+        self.segmenter = StreamSegmenter(
+            settings.TRANSCRIPTION_REALTIME_ENERGY_THRESHOLD,
+            settings.TRANSCRIPTION_REALTIME_SILENCE_SECONDS,
+            settings.TRANSCRIPTION_REALTIME_MAX_WINDOW_SECONDS,
+        )
+        self.clustering = OnlineSpeakerClustering(
+            settings.TRANSCRIPTION_REALTIME_SPEAKER_THRESHOLD
+        )
+        self.segments = []
+        self.samples = 0
+        self.finalized = 0
+        self.embeddings_available = True
+        self._samples_since_partial = 0
+        self._partial = None
+        self._last_final = None
+        self.recording_path = os.path.join(
+            settings.MEDIA_ROOT, "realtime", f"{self.id}.pcm"
+        )
+        os.makedirs(os.path.dirname(self.recording_path), exist_ok=True)
+        self._recording = open(self.recording_path, "wb")
+
+    async def transcribe(self, audio):
+        if settings.TRANSCRIPTION_REALTIME_ON_WORKERS:
+            from .tasks import realtime_transcribe  # tasks imports this module
+
+            return await run_on_worker(realtime_transcribe, audio)
+        text, _ = await asyncio.wrap_future(get_batch_scheduler().submit(audio))
+        return text
+
+    async def embed(self, audio):
+        if settings.TRANSCRIPTION_REALTIME_ON_WORKERS:
+            from .tasks import realtime_embed  # tasks imports this module
+
+            return await run_on_worker(realtime_embed, audio)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, embed_clip, audio)
+
+    async def speaker(self, audio):
+        min_samples = settings.TRANSCRIPTION_REALTIME_MIN_SPEAKER_SECONDS * SAMPLE_RATE
+        if not self.embeddings_available or len(audio) < min_samples:
+            return UNKNOWN_SPEAKER
+        try:
+            embedding = await self.embed(audio)
+        except Exception as e:
+            logger.error(f"Speaker embeddings unavailable: {str(e)}")
+            self.embeddings_available = False
+            return UNKNOWN_SPEAKER
+        return self.clustering.assign(embedding)
+
+    async def feed(self, samples):
+        self._recording.write(samples.astype(np.float32).tobytes())
+        self.samples += len(samples)
+        for start, audio in self.segmenter.feed(samples):
+            self._finalize(start, audio)
+
+        self._samples_since_partial += len(samples)
+        partial_samples = settings.TRANSCRIPTION_REALTIME_PARTIAL_SECONDS * SAMPLE_RATE
+        pending = self.segmenter.pending
+        if (
+            pending
+            and self._samples_since_partial >= partial_samples
+            and (self._partial is None or self._partial.done())
+        ):
+            self._samples_since_partial = 0
+            start, audio = pending
+            self._partial = asyncio.create_task(
+                self._send_partial(self.finalized, start, audio.copy())
+            )
+
+    def _finalize(self, start, audio):
+        self.finalized += 1
+        self._samples_since_partial = 0
+        self._last_final = asyncio.create_task(
+            self._send_final(self._last_final, start, audio)
+        )
+
+    async def _send_partial(self, window, start, audio):
+        try:
+            text = await self.transcribe(audio)
+        except Exception as e:
+            logger.error(f"Realtime session {self.id} failed to decode: {str(e)}")
+            return
+        # A final result for this window may have overtaken the partial
+        if window == self.finalized and text.strip():
+            await self.send(
+                {
+                    "type": "partial",
+                    "start": start / SAMPLE_RATE,
+                    "end": (start + len(audio)) / SAMPLE_RATE,
+                    "text": text,
+                }
+            )
+
+    async def _send_final(self, previous, start, audio):
+        try:
+            text, speaker = await asyncio.gather(
+                self.transcribe(audio), self.speaker(audio)
+            )
+        except Exception as e:
+            logger.error(f"Realtime session {self.id} failed to decode: {str(e)}")
+            text = ""
+        if previous is not None:
+            await previous
+        if not text.strip():
+            return
+        segment = {
+            "id": len(self.segments),
+            "start": start / SAMPLE_RATE,
+            "end": (start + len(audio)) / SAMPLE_RATE,
+            "text": text,
+            "speaker": speaker,
+        }
+        self.segments.append(segment)
+        await self.send({"type": "final", "segment": segment})
+
+    async def close(self):
+        """Finish decoding and persist the session; returns the AudioFile."""
+        pending = self.segmenter.flush()
+        if pending:
+            self._finalize(*pending)
+        if self._last_final is not None:
+            await self._last_final
+        if self._partial is not None:
+            self._partial.cancel()
+        self._recording.close()
+        try:
+            if not self.samples:
+                return None
+            return await sync_to_async(self._persist)()
+        finally:
+            os.unlink(self.recording_path)
+
+    def abort(self):
+        for task in (self._partial, self._last_final):
+            if task is not None:
+                task.cancel()
+        self._recording.close()
+        if os.path.exists(self.recording_path):
+            os.unlink(self.recording_path)
+
+    def _persist(self):
+        name = default_storage.get_available_name(
+            os.path.join("uploads", f"realtime-{self.id}.wav")
+        )
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        recording = np.memmap(self.recording_path, dtype=np.float32, mode="r")
+        with wave.open(path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            for offset in range(0, len(recording), WAV_BLOCK_SAMPLES):
+                block = recording[offset : offset + WAV_BLOCK_SAMPLES]
+                wav.writeframes(
+                    (np.clip(block, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+                )
+        del recording
+
+        text = "".join(segment["text"] for segment in self.segments)
+        segments = SegmentStore.from_segments(self.segments)
+        audio_file = AudioFile.objects.create(
+            user=self.user,
+            file=name,
+            status="completed",
+            processed=True,
+            stage="realtime",
+            progress=100,
+            transcription_text=text,
+            segment_data=segments.to_bytes(),
+            content_hash=hash_file(path),
+        )
+        index_transcript(audio_file, segments)
+        logger.info(
+            f"Persisted realtime session {self.id} as AudioFile {audio_file.id}"
+        )
+        return audio_file
+
+
+class PcmDecoder:
+    """Little-endian 16-bit mono PCM at 16 kHz."""
+
+    def __init__(self, on_samples):
+        self.on_samples = on_samples
+        self._remainder = b""
+
+    async def write(self, data):
+        data = self._remainder + data
+        usable = len(data) - len(data) % 2
+        self._remainder = data[usable:]
+        if usable:
+            pcm = np.frombuffer(data[:usable], dtype="<i2")
+            await self.on_samples(pcm.astype(np.float32) / 32768)
+
+    async def close(self):
+        pass
+
+
+class FfmpegDecoder:
+    """Compressed streams (Opus in WebM or Ogg, as browsers record) via ffmpeg."""
+
+    def __init__(self, on_samples):
+        self.on_samples = on_samples
+        self.process = None
+        self._reader = None
+
+    async def write(self, data):
+        if self.process is None:
+            self.process = await asyncio.create_subprocess_exec(
+                *ffmpeg_command("pipe:0"),
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+            self._reader = asyncio.create_task(self._read())
+        self.process.stdin.write(data)
+        await self.process.stdin.drain()
+
+    async def _read(self):
+        remainder = b""
+        while True:
+            data = await self.process.stdout.read(1 << 16)
+            if not data:
+                break
+            data = remainder + data
+            usable = len(data) - len(data) % 4
+            remainder = data[usable:]
+            if usable:
+                await self.on_samples(np.frombuffer(data[:usable], dtype="<f4"))
+
+    async def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        await self._reader
+        await self.process.wait()
+
+
+DECODERS = {"pcm_s16le": PcmDecoder, "opus": FfmpegDecoder}
+
+
+async def _close(send, code):
+    await send({"type": "websocket.close", "code": code})
+
+
+async def websocket_application(scope, receive, send):
+    """Live transcription over a WebSocket at /ws/transcribe/.
+
+    Query parameters: ``token`` (JWT access token, unless sent as an
+    Authorization header) and ``encoding`` (``pcm_s16le``, 16 kHz mono, the
+    default, or ``opus`` in WebM/Ogg). Binary messages carry audio; a text
+    message ``{"type": "stop"}`` ends the stream. The server sends
+    ``partial`` and ``final`` messages and, once the session has been saved,
+    ``{"type": "completed", "audio_file": <id>}``. A user already streaming
+    TRANSCRIPTION_REALTIME_MAX_STREAMS_PER_USER times to this process is
+    refused with code 4429.
+    """
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+    if scope["path"] != WEBSOCKET_PATH:
+        await _close(send, 4404)
+        return
+
+    params = parse_qs(scope.get("query_string", b"").decode())
+    headers = dict(scope.get("headers", []))
+    scheme, _, token = headers.get(b"authorization", b"").decode().partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        token = params.get("token", [None])[0]
+    user = await authenticate(token)
+    if user is None:
+        await _close(send, 4401)
+        return
+    decoder_class = DECODERS.get(params.get("encoding", ["pcm_s16le"])[0])
+    if decoder_class is None:
+        await _close(send, 4400)
+        return
+
+    if _streams[user.id] >= settings.TRANSCRIPTION_REALTIME_MAX_STREAMS_PER_USER:
+        await _close(send, 4429)
+        return
+
+    _streams[user.id] += 1
+    try:
+        await _stream(user, decoder_class, receive, send)
+    finally:
+        _streams[user.id] -= 1
+        if not _streams[user.id]:
+            del _streams[user.id]
+
+
+async def _stream(user, decoder_class, receive, send):
+    await send({"type": "websocket.accept"})
+    connected = True
+
+    async def send_json(data):
+        if connected:
+            await send({"type": "websocket.send", "text": json.dumps(data)})
+
+    session = RealtimeSession(user, send_json)
+    decoder = decoder_class(session.feed)
+    try:
+        while True:
+            message = await receive()
+            if message["type"] == "websocket.disconnect":
+                connected = False
+                break
+            if message.get("bytes"):
+                await decoder.write(message["bytes"])
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if isinstance(control, dict) and control.get("type") == "stop":
+                    break
+        await decoder.close()
+        audio_file = await session.close()
+    except BaseException:
+        session.abort()
+        raise
+
+    await send_json(
+        {"type": "completed", "audio_file": audio_file.id if audio_file else None}
+    )
+    if connected:
+        await _close(send, 1000)
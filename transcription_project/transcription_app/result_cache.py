@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.db.models import F
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler,
+    TemporaryFileUploadHandler,
+)
+
+from . import diarization_cache
+from .asr_backends import AsrConfig
+from .models import AudioFile, TranscriptionResult
+from .search import index_transcript
+from .segment_store import load_segments
+from .speaker_index import name_speakers
+
+logger = logging.getLogger(__name__)
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_key(audio_file):
+    """Identify every setting that changes the transcription of the same audio."""
+    asr = AsrConfig.for_audio_file(audio_file)
+    config = {
+        "version": settings.TRANSCRIPTION_CONFIG_VERSION,
+        "asr_backend": asr.backend,
+        "whisper_model": asr.model_size,
+        "compute_type": asr.compute_type,
+        "beam_size": asr.beam_size,
+        "diarization_model": settings.PYANNOTE_DIARIZATION_MODEL,
+        "word_timestamps": settings.TRANSCRIPTION_WORD_TIMESTAMPS,
+        # What is decoded, and how, also depends on these
+        "vad": diarization_cache.vad_key(),
+        "batching": settings.TRANSCRIPTION_BATCHING_ENABLED,
+        "partial_window": settings.TRANSCRIPTION_PARTIAL_WINDOW_SECONDS,
+        "transcription_mode": audio_file.transcription_mode,
+    }
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(audio_file):
+    if not audio_file.content_hash:
+        return None
+    return TranscriptionResult.objects.filter(
+        content_hash=audio_file.content_hash, config_key=config_key(audio_file)
+    ).first()
+
+
+def store(audio_file, transcription, segments):
+    if not audio_file.content_hash:
+        return
+    TranscriptionResult.objects.update_or_create(
+        content_hash=audio_file.content_hash,
+        config_key=config_key(audio_file),
+        defaults={
+            "transcription_text": transcription,
+            "segment_data": segments.to_bytes(),
+        },
+    )
+
+
+def apply_cached_result(audio_file):
+    """Complete ``audio_file`` from the result cache. Returns True on a hit."""
+    result = lookup(audio_file)
+    if result is None:
+        return False
+
+    segments = load_segments(result.segment_data, result.transcription_json)
+    segments = name_speakers(audio_file, segments)
+    AudioFile.objects.filter(id=audio_file.id).update(
+        status="completed",
+        processed=True,
+        transcription_text=result.transcription_text,
+        segment_data=segments.to_bytes(),
+        transcript_version=F("transcript_version") + 1,
+    )
+    audio_file.refresh_from_db()
+    index_transcript(audio_file, segments)
+    logger.info(
+        f"AudioFile {audio_file.id} completed from cache ({audio_file.content_hash})"
+    )
+    return True
+
+
+class HashingUploadMixin:
+    """Computes SHA-256 of uploaded files as Django receives their chunks."""
+
+    def new_file(self, *args, **kwargs):
+        # Set up first: the memory handler raises StopFutureHandlers from here
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        # A memory handler that isn't activated (file too large) passes the
+        # data on to the temporary file handler, which hashes it instead
+        if getattr(self, "activated", True):
+            self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.sha256.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
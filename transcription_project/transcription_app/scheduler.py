@@ -0,0 +1,256 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.utils import timezone
+
+from .audio_decoding import probe_duration
+from .models import AudioFile, DispatchLock, JobQueueEntry, JobStageMetric
+
+logger = logging.getLogger(__name__)
+
+REAL_TIME_FACTOR_CACHE_KEY = "transcription:real_time_factor"
+# Stage metrics from this far back inform duration estimates
+REAL_TIME_FACTOR_WINDOW = timedelta(days=7)
+
+
+class QueueFull(Exception):
+    pass
+
+
+def tier_settings(tier):
+    return settings.TRANSCRIPTION_TIERS.get(tier, settings.TRANSCRIPTION_TIERS["free"])
+
+
+def real_time_factor():
+    """Recent pipeline wall seconds per second of audio, summed over stages."""
+    factor = cache.get(REAL_TIME_FACTOR_CACHE_KEY)
+    if factor is None:
+        rows = (
+            JobStageMetric.objects.filter(
+                status="succeeded",
+                audio_seconds__gt=0,
+                started_at__gte=timezone.now() - REAL_TIME_FACTOR_WINDOW,
+            )
+            .values("stage")
+            .annotate(wall=Sum("wall_seconds"), audio=Sum("audio_seconds"))
+        )
+        factor = sum(row["wall"] / row["audio"] for row in rows) or (
+            settings.TRANSCRIPTION_DEFAULT_REAL_TIME_FACTOR
+        )
+        cache.set(REAL_TIME_FACTOR_CACHE_KEY, factor, 300)
+    return factor
+
+
+def check_capacity(user):
+    """Raise QueueFull when the user can't queue another job."""
+    limit = tier_settings(user.tier)["max_queued"]
+    queued = JobQueueEntry.objects.filter(user=user, state="queued").count()
+    if queued >= limit:
+        raise QueueFull(f"{queued} jobs are already queued; the limit is {limit}")
+
+
+def enqueue(audio_file):
+    """Queue a job for the pipeline and start it if a slot is free.
+
+    The recording's length is probed by a task, so a job still waiting
+    after this dispatch gets its estimate and short-job priority later.
+    """
+    # tasks imports this module
+    from .tasks import estimate_job
+
+    user = audio_file.user
+    entry = JobQueueEntry.objects.create(
+        audio_file=audio_file,
+        user=user,
+        tier=user.tier,
+        priority=tier_settings(user.tier)["priority"],
+    )
+    logger.info(f"Queued audio file {audio_file.id} for user {user.id}")
+    if audio_file.id not in dispatch():
+        estimate_job.delay(audio_file.id)
+    return entry
+
+
+def estimate(audio_file_id):
+    """Fill in a queued job's length, expected run time and priority."""
+    entry = (
+        JobQueueEntry.objects.filter(audio_file_id=audio_file_id, state="queued")
+        .select_related("audio_file")
+        .first()
+    )
+    if entry is None:
+        return
+    audio_seconds = probe_duration(entry.audio_file.file.path)
+    if audio_seconds is None:
+        return
+    priority = tier_settings(entry.tier)["priority"]
+    if audio_seconds <= settings.TRANSCRIPTION_SHORT_JOB_SECONDS:
+        priority += settings.TRANSCRIPTION_SHORT_JOB_PRIORITY
+    JobQueueEntry.objects.filter(id=entry.id, state="queued").update(
+        priority=priority,
+        audio_seconds=audio_seconds,
+        estimated_seconds=audio_seconds * real_time_factor(),
+    )
+    logger.info(
+        f"Estimated audio file {audio_file_id}: {audio_seconds:.0f}s of audio, "
+        f"priority {priority}"
+    )
+
+
+def release(audio_file_id):
+    """Give up a job's slot once it completed or failed, and fill free slots."""
+    JobQueueEntry.objects.filter(
+        audio_file_id=audio_file_id, state__in=["queued", "running"]
+    ).update(state="done", finished_at=timezone.now())
+    dispatch()
+
+
+def _reap():
+    """Free slots of jobs that ended without releasing them."""
+    ended = AudioFile.objects.filter(status__in=["completed", "failed"])
+    JobQueueEntry.objects.filter(state="running", audio_file__in=ended).update(
+        state="done", finished_at=timezone.now()
+    )
+
+
+def _lock():
+    """Hold the dispatch lock until the surrounding transaction ends.
+
+    The update takes a row lock on most databases and the write lock on
+    SQLite, so concurrent dispatchers count running jobs one at a time.
+    """
+    if not DispatchLock.objects.filter(pk=1).update(locked_at=timezone.now()):
+        DispatchLock.objects.get_or_create(pk=1)
+        DispatchLock.objects.filter(pk=1).update(locked_at=timezone.now())
+
+
+def dispatch():
+    """Start queued jobs while pipeline slots are free, fairly across users.
+
+    Each free slot goes to the user with the fewest running jobs per unit of
+    tier weight who is under their tier's cap; ties go to the user with the
+    highest priority job, then the longest wait. That user's next job is
+    their highest priority one, shortest first. Returns the started ids.
+    """
+    # tasks imports this module
+    from .tasks import process_audio_file
+
+    with transaction.atomic():
+        _lock()
+        started = _claim_jobs()
+    # Tasks are only sent once their claims are committed
+    for audio_file_id in started:
+        process_audio_file.delay(audio_file_id)
+    if started:
+        logger.info(f"Dispatched audio files {started}")
+    return started
+
+
+def _claim_jobs():
+    _reap()
+    running = JobQueueEntry.objects.filter(state="running")
+    capacity = settings.TRANSCRIPTION_MAX_ACTIVE_JOBS - running.count()
+    if capacity <= 0:
+        return []
+
+    active = dict(
+        running.values("user").annotate(jobs=Count("id")).values_list("user", "jobs")
+    )
+    # Weights and caps follow the user's current tier, whatever tier each
+    # of their queued jobs was submitted under
+    waiting = {
+        row["user"]: row
+        for row in JobQueueEntry.objects.filter(state="queued")
+        .values("user", user_tier=F("user__tier"))
+        .annotate(
+            jobs=Count("id"), top_priority=Max("priority"), oldest=Min("enqueued_at")
+        )
+    }
+
+    started = []
+    while capacity > 0:
+        candidates = [
+            row
+            for user, row in waiting.items()
+            if row["jobs"]
+            and active.get(user, 0) < tier_settings(row["user_tier"])["max_active"]
+        ]
+        if not candidates:
+            break
+        row = min(
+            candidates,
+            key=lambda row: (
+                active.get(row["user"], 0) / tier_settings(row["user_tier"])["weight"],
+                -row["top_priority"],
+                row["oldest"],
+            ),
+        )
+        entry = (
+            JobQueueEntry.objects.filter(user=row["user"], state="queued")
+            .order_by(
+                "-priority",
+                F("estimated_seconds").asc(nulls_last=True),
+                "enqueued_at",
+            )
+            .first()
+        )
+        row["jobs"] -= 1
+        if entry is None:
+            continue
+        JobQueueEntry.objects.filter(id=entry.id).update(
+            state="running", dispatched_at=timezone.now()
+        )
+        active[row["user"]] = active.get(row["user"], 0) + 1
+        capacity -= 1
+        started.append(entry.audio_file_id)
+    return started
+
+
+def queue_stats():
+    """Queue depth, running jobs and waiting times per tier."""
+    now = timezone.now()
+    stats = {}
+
+    def tier_stats(tier):
+        return stats.setdefault(
+            tier,
+            {
+                "queued": 0,
+                "running": 0,
+                "backlog_seconds": 0.0,
+                "oldest_wait_seconds": 0.0,
+                "dispatched": 0,
+                "wait_seconds": 0.0,
+            },
+        )
+
+    for row in (
+        JobQueueEntry.objects.filter(state__in=["queued", "running"])
+        .values("tier", "state")
+        .annotate(
+            jobs=Count("id"),
+            backlog=Sum("estimated_seconds"),
+            oldest=Min("enqueued_at"),
+        )
+    ):
+        tier = tier_stats(row["tier"])
+        tier[row["state"]] = row["jobs"]
+        if row["state"] == "queued":
+            tier["backlog_seconds"] = row["backlog"] or 0.0
+            tier["oldest_wait_seconds"] = (now - row["oldest"]).total_seconds()
+
+    for row in (
+        JobQueueEntry.objects.filter(dispatched_at__isnull=False)
+        .values("tier")
+        .annotate(
+            dispatched=Count("id"), wait=Sum(F("dispatched_at") - F("enqueued_at"))
+        )
+    ):
+        tier = tier_stats(row["tier"])
+        tier["dispatched"] = row["dispatched"]
+        tier["wait_seconds"] = row["wait"].total_seconds() if row["wait"] else 0.0
+    return stats
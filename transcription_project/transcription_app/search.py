@@ -0,0 +1,211 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, When
+
+from .models import SearchPosting, TranscriptSegment
+
+FTS_TABLE = "transcription_app_segment_fts"
+WORD_RE = re.compile(r"\w+")
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+# Longer words are indexed by their prefix so postings fit the term column
+MAX_TERM_LENGTH = 64
+
+_fts_available = {}
+
+
+def tokenize(text):
+    return [word[:MAX_TERM_LENGTH] for word in WORD_RE.findall(text.lower())]
+
+
+def parse_query(query):
+    """Split a query into phrases; quoted text stays together."""
+    phrases = []
+    for quoted, word in QUERY_RE.findall(query):
+        words = tokenize(quoted or word)
+        if words:
+            phrases.append(words)
+    return phrases
+
+
+def backend():
+    configured = settings.TRANSCRIPTION_SEARCH_BACKEND
+    if configured != "auto":
+        return configured
+    if connection.alias not in _fts_available:
+        _fts_available[connection.alias] = (
+            connection.vendor == "sqlite"
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return "fts5" if _fts_available[connection.alias] else "inverted"
+
+
+def index_transcript(audio_file, segments=None):
+    """Replace the search index entries of ``audio_file`` with its segments.
+
+    The FTS5 table follows TranscriptSegment through triggers; the inverted
+    index is maintained here when FTS5 isn't available.
+    """
+    if segments is None:
+        segments = audio_file.get_transcript()[1]
+    segments = [
+        TranscriptSegment(
+            audio_file_id=audio_file.id,
+            user_id=audio_file.user_id,
+            position=position,
+            speaker=segment["speaker"],
+            start=segment["start"],
+            end=segment["end"],
+            text=segment["text"].strip(),
+        )
+        for position, segment in enumerate(segments)
+    ]
+    with transaction.atomic():
+        TranscriptSegment.objects.filter(audio_file_id=audio_file.id).delete()
+        TranscriptSegment.objects.bulk_create(segments)
+        if backend() == "inverted":
+            # Re-read ids: not every backend returns them from bulk_create
+            rows = TranscriptSegment.objects.filter(
+                audio_file_id=audio_file.id
+            ).values_list("id", "text")
+            SearchPosting.objects.bulk_create(
+                SearchPosting(
+                    term=term,
+                    segment_id=segment_id,
+                    user_id=audio_file.user_id,
+                    frequency=frequency,
+                )
+                for segment_id, text in rows
+                for term, frequency in Counter(tokenize(text)).items()
+            )
+    return len(segments)
+
+
+def rename_speaker(audio_file, label, name):
+    TranscriptSegment.objects.filter(audio_file=audio_file, speaker=label).update(
+        speaker=name
+    )
+
+
+def search(user, query, limit=20, offset=0):
+    """Segments of ``user``'s transcripts matching every word of ``query``.
+
+    Returns dicts with the audio file, segment position, speaker, times,
+    text and a relevance score (higher is better), best first.
+    """
+    phrases = parse_query(query)
+    if not phrases:
+        return []
+    if backend() == "fts5":
+        return _search_fts(user, phrases, limit, offset)
+    return _search_inverted(user, phrases, limit, offset)
+
+
+def _hit(audio_file_id, position, speaker, start, end, text, score):
+    return {
+        "audio_file": audio_file_id,
+        "segment": position,
+        "speaker": speaker,
+        "start": start,
+        "end": end,
+        "text": text,
+        "score": score,
+    }
+
+
+def _search_fts(user, phrases, limit, offset):
+    # The user id is indexed as a token of its own column, so FTS5 only
+    # intersects the user's rows instead of ranking every user's matches
+    text = " ".join('"' + " ".join(words) + '"' for words in phrases)
+    match = f'user_id : "{user.id}" AND text : ({text})'
+    segment_table = TranscriptSegment._meta.db_table
+    # The user id column doesn't count towards relevance
+    rank = f"bm25({FTS_TABLE}, 1.0, 0.0)"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT s.audio_file_id, s.position, s.speaker, s.start, s."end",
+                   s.text, -{rank} AS score
+            FROM {FTS_TABLE}
+            JOIN {segment_table} s ON s.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s
+            ORDER BY {rank}
+            LIMIT %s OFFSET %s
+            """,
+            [match, limit, offset],
+        )
+        return [_hit(*row) for row in cursor.fetchall()]
+
+
+def _search_inverted(user, phrases, limit, offset):
+    terms = sorted({word for words in phrases for word in words})
+    postings = SearchPosting.objects.filter(user=user)
+    total = TranscriptSegment.objects.filter(user=user).count()
+    frequencies = dict(
+        postings.filter(term__in=terms)
+        .values_list("term")
+        .annotate(df=Count("id"))
+        .values_list("term", "df")
+    )
+    if len(frequencies) < len(terms):
+        return []
+    weights = {
+        term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for term, df in frequencies.items()
+    }
+
+    candidates = (
+        postings.filter(term__in=terms)
+        .values("segment")
+        .annotate(
+            matched=Count("id"),
+            score=Sum(
+                Case(
+                    *(
+                        When(term=term, then=F("frequency") * weight)
+                        for term, weight in weights.items()
+                    ),
+                    output_field=FloatField(),
+                )
+            ),
+        )
+        .filter(matched=len(terms))
+        .order_by("-score", "segment")
+    )
+    multiword = [" ".join(words) for words in phrases if len(words) > 1]
+    hits = []
+    # Phrases are checked against the text; over-fetch to keep pages full
+    batch = limit + offset if not multiword else (limit + offset) * 4
+    start = 0
+    while len(hits) < limit + offset:
+        page = list(candidates[start : start + batch])
+        if not page:
+            break
+        start += batch
+        segments = TranscriptSegment.objects.in_bulk([row["segment"] for row in page])
+        for row in page:
+            segment = segments[row["segment"]]
+            text = f" {' '.join(tokenize(segment.text))} "
+            if all(f" {phrase} " in text for phrase in multiword):
+                hits.append(
+                    _hit(
+                        segment.audio_file_id,
+                        segment.position,
+                        segment.speaker,
+                        segment.start,
+                        segment.end,
+                        segment.text,
+                        row["score"],
+                    )
+                )
+    return hits[offset : offset + limit]
+
+
+def optimize():
+    """Merge FTS5 b-trees after a bulk reindex."""
+    if backend() == "fts5":
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES('optimize')")
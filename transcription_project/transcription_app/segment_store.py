@@ -0,0 +1,246 @@
+import json
+import struct
+
+import numpy as np
+
+MAGIC = b"TSEG"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")
+START_DTYPE = np.dtype("<f8")
+SPEAKER_DTYPE = np.dtype("<i4")
+OFFSET_DTYPE = np.dtype("<i8")
+# Whisper segment keys the pipeline actually reads
+SEGMENT_KEYS = ("start", "end", "text", "speaker")
+WORD_KEYS = ("word", "start", "end", "speaker")
+
+
+def slim_segments(segments):
+    """Drop tokens, log-probabilities and other decoder output we never read."""
+    slim = []
+    for segment in segments:
+        kept = {key: segment[key] for key in SEGMENT_KEYS if key in segment}
+        if "words" in segment:
+            kept["words"] = [
+                {key: word[key] for key in WORD_KEYS if key in word}
+                for word in segment["words"]
+            ]
+        slim.append(kept)
+    return slim
+
+
+class SegmentStore:
+    """Transcript segments stored column-wise.
+
+    Start and end times, speaker ids and text offsets are NumPy columns and
+    the text of every segment lives in one UTF-8 buffer, so a transcript
+    costs a few arrays rather than a dict per segment. Segments are built as
+    dicts only when they're read, and ``to_bytes`` gives the blob stored on
+    AudioFile.segment_data.
+
+    Word timestamps, when the transcript has them, are a nested store of
+    every word in order; ``word_bounds`` gives each segment's range in it.
+    """
+
+    __slots__ = (
+        "starts",
+        "ends",
+        "speaker_ids",
+        "speakers",
+        "offsets",
+        "buffer",
+        "words",
+        "word_bounds",
+    )
+
+    def __init__(
+        self,
+        starts,
+        ends,
+        speaker_ids,
+        speakers,
+        offsets,
+        buffer,
+        words=None,
+        word_bounds=None,
+    ):
+        self.starts = starts
+        self.ends = ends
+        self.speaker_ids = speaker_ids
+        self.speakers = speakers
+        self.offsets = offsets
+        self.buffer = buffer
+        self.words = words
+        self.word_bounds = word_bounds
+
+    @classmethod
+    def from_segments(cls, segments):
+        segments = list(segments)
+        speakers = {}
+        texts = []
+        rows = []
+        for segment in segments:
+            speaker = segment.get("speaker", "UNKNOWN")
+            speaker_id = speakers.setdefault(speaker, len(speakers))
+            texts.append(segment["text"].encode())
+            rows.append((segment["start"], segment["end"], speaker_id))
+        starts, ends, speaker_ids = zip(*rows) if rows else ((), (), ())
+        offsets = np.zeros(len(texts) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+
+        words = word_bounds = None
+        if any("words" in segment for segment in segments):
+            counts = [len(segment.get("words", ())) for segment in segments]
+            word_bounds = np.zeros(len(segments) + 1, dtype=OFFSET_DTYPE)
+            np.cumsum(counts, out=word_bounds[1:])
+            words = cls.from_segments(
+                {
+                    "text": word["word"],
+                    "speaker": word.get("speaker", "UNKNOWN"),
+                    "start": word["start"],
+                    "end": word["end"],
+                }
+                for segment in segments
+                for word in segment.get("words", ())
+            )
+        return cls(
+            np.array(starts, dtype=START_DTYPE),
+            np.array(ends, dtype=START_DTYPE),
+            np.array(speaker_ids, dtype=SPEAKER_DTYPE),
+            list(speakers),
+            offsets,
+            b"".join(texts),
+            words,
+            word_bounds,
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Columns are views into ``data``; nothing is copied or decoded."""
+        data = memoryview(data)
+        magic, version, header_size = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a version 1 segment store")
+        position = HEADER.size + header_size
+        header = json.loads(bytes(data[HEADER.size : position]))
+        count = header["count"]
+
+        columns = []
+        for dtype, length in (
+            (START_DTYPE, count),
+            (START_DTYPE, count),
+            (SPEAKER_DTYPE, count),
+            (OFFSET_DTYPE, count + 1),
+        ):
+            columns.append(np.frombuffer(data, dtype, length, position))
+            position += dtype.itemsize * length
+        starts, ends, speaker_ids, offsets = columns
+        if "text_bytes" not in header:
+            return cls(
+                starts, ends, speaker_ids, header["speakers"], offsets, data[position:]
+            )
+
+        # Words follow the text, after padding to the next 8-byte boundary
+        buffer = data[position : position + header["text_bytes"]]
+        position += header["text_bytes"] + header["padding"]
+        word_bounds = np.frombuffer(data, OFFSET_DTYPE, count + 1, position)
+        position += OFFSET_DTYPE.itemsize * (count + 1)
+        words = cls.from_bytes(data[position:])
+        return cls(
+            starts,
+            ends,
+            speaker_ids,
+            header["speakers"],
+            offsets,
+            buffer,
+            words,
+            word_bounds,
+        )
+
+    def to_bytes(self):
+        header = {"count": len(self), "speakers": self.speakers}
+        columns = [
+            self.starts.astype(START_DTYPE).tobytes(),
+            self.ends.astype(START_DTYPE).tobytes(),
+            self.speaker_ids.astype(SPEAKER_DTYPE).tobytes(),
+            self.offsets.astype(OFFSET_DTYPE).tobytes(),
+            bytes(self.buffer),
+        ]
+        if self.words is not None:
+            # The text keeps its place at the end of the segment columns, so
+            # readers that don't know about words still decode the segments
+            header["text_bytes"] = len(self.buffer)
+            header["padding"] = -len(self.buffer) % 8
+            columns += [
+                b"\0" * header["padding"],
+                self.word_bounds.astype(OFFSET_DTYPE).tobytes(),
+                self.words.to_bytes(),
+            ]
+        header = json.dumps(header, separators=(",", ":")).encode()
+        # Pad so the columns start 8-byte aligned
+        header += b" " * (-(HEADER.size + len(header)) % 8)
+        return b"".join((HEADER.pack(MAGIC, VERSION, len(header)), header, *columns))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def text(self, index):
+        return bytes(
+            self.buffer[self.offsets[index] : self.offsets[index + 1]]
+        ).decode()
+
+    def speaker(self, index):
+        return self.speakers[self.speaker_ids[index]]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        segment = {
+            "text": self.text(index),
+            "speaker": self.speaker(index),
+            "start": float(self.starts[index]),
+            "end": float(self.ends[index]),
+        }
+        if self.words is not None:
+            segment["words"] = [
+                {
+                    "word": self.words.text(i),
+                    "start": float(self.words.starts[i]),
+                    "end": float(self.words.ends[i]),
+                    "speaker": self.words.speaker(i),
+                }
+                for i in range(self.word_bounds[index], self.word_bounds[index + 1])
+            ]
+        return segment
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def renamed(self, names):
+        """A store sharing these columns with speakers renamed per ``names``."""
+        speakers = [names.get(speaker, speaker) for speaker in self.speakers]
+        return SegmentStore(
+            self.starts,
+            self.ends,
+            self.speaker_ids,
+            speakers,
+            self.offsets,
+            self.buffer,
+            self.words.renamed(names) if self.words is not None else None,
+            self.word_bounds,
+        )
+
+    def document(self, transcription):
+        """The transcript as the JSON endpoints return it."""
+        return {"transcription": transcription, "segments": list(self)}
+
+
+def load_segments(segment_data, transcription_json=None):
+    """Segments from a stored blob, or from a row written before segment_data."""
+    if segment_data:
+        return SegmentStore.from_bytes(segment_data)
+    return SegmentStore.from_segments((transcription_json or {}).get("segments", []))
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import CustomUser, AudioFile
+from .asr_backends import AsrConfig
+from .models import CustomUser, AudioFile, SpeakerProfile, UploadSession
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
 
@@ -14,6 +15,26 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+def validate_asr_options(attrs, instance=None):
+    """Check the job's speech recognition options, as AudioFile stores them."""
+    fields = ("asr_backend", "asr_model", "asr_compute_type")
+    if not any(attrs.get(field) for field in fields):
+        return attrs
+    backend, model_size, compute_type = (
+        attrs.get(field, getattr(instance, field, "")) for field in fields
+    )
+    asr = AsrConfig(backend, model_size, compute_type)
+    try:
+        asr.check_model_allowed()
+    except ValueError as e:
+        raise serializers.ValidationError({"asr_model": str(e)})
+    try:
+        asr.validate()
+    except ValueError as e:
+        raise serializers.ValidationError({"asr_backend": str(e)})
+    return attrs
+
+
 class AudioFileSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source="user.username")
 
@@ -25,10 +46,70 @@ class AudioFileSerializer(serializers.ModelSerializer):
             "uploaded_at",
             "processed",
             "status",
+            "stage",
+            "progress",
             "transcription_text",
+            "transcription_mode",
+            "profile",
+            "asr_backend",
+            "asr_model",
+            "asr_compute_type",
             "user",
         )
-        read_only_fields = ("user",)
+        read_only_fields = ("user", "stage", "progress")
+
+    def validate(self, attrs):
+        return validate_asr_options(attrs, self.instance)
+
+
+class AudioFileListSerializer(AudioFileSerializer):
+    class Meta(AudioFileSerializer.Meta):
+        fields = tuple(
+            field
+            for field in AudioFileSerializer.Meta.fields
+            if field != "transcription_text"
+        )
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = (
+            "id",
+            "filename",
+            "size",
+            "offset",
+            "transcription_mode",
+            "profile",
+            "asr_backend",
+            "asr_model",
+            "asr_compute_type",
+            "created_at",
+            "audio_file",
+        )
+        read_only_fields = ("offset", "audio_file")
+
+    def validate(self, attrs):
+        return validate_asr_options(attrs, self.instance)
+
+    def validate_size(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Size must be positive")
+        return value
+
+
+class SpeakerProfileSerializer(serializers.ModelSerializer):
+    embedding_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SpeakerProfile
+        fields = ("id", "name", "created_at", "embedding_count")
+        read_only_fields = ("created_at",)
+
+
+class SpeakerEnrollmentSerializer(serializers.Serializer):
+    speaker = serializers.CharField(help_text="Diarization label, e.g. SPEAKER_00")
+    name = serializers.CharField(max_length=100)
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -0,0 +1,78 @@
+import heapq
+
+UNKNOWN_SPEAKER = "UNKNOWN"
+
+
+def label_intervals(intervals, turns):
+    """Return the speaker whose turn overlaps each (start, end) interval the most.
+
+    ``turns`` is a list of (start, end, label) tuples in diarization order.
+    Ties go to the earliest turn in that order and intervals without any
+    overlap get ``UNKNOWN``, matching the original pairwise comparison.
+    Both lists are swept by start time and only the turns overlapping an
+    interval are compared, so it runs in O(N log N + M log M + K) for K
+    overlapping pairs. Diarization turns barely overlap each other, so K
+    stays close to N + M rather than the pairwise N * M.
+    """
+    labels = [UNKNOWN_SPEAKER] * len(intervals)
+    turn_order = sorted(range(len(turns)), key=lambda t: turns[t][0])
+    active = []
+    next_turn = 0
+
+    for i in sorted(range(len(intervals)), key=lambda i: intervals[i][0]):
+        start, end = intervals[i]
+
+        while next_turn < len(turn_order) and turns[turn_order[next_turn]][0] < end:
+            t = turn_order[next_turn]
+            heapq.heappush(active, (turns[t][1], t))
+            next_turn += 1
+        # Intervals are visited by increasing start, so turns that ended
+        # before this one can never overlap a later interval either. What
+        # remains started before the end and ends after the start: exactly
+        # the turns overlapping this interval.
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+
+        best_turn = None
+        max_overlap = 0
+        for turn_end, t in active:
+            overlap = min(end, turn_end) - max(start, turns[t][0])
+            if overlap > max_overlap or (
+                overlap == max_overlap and best_turn is not None and t < best_turn
+            ):
+                max_overlap = overlap
+                best_turn = t
+        if best_turn is not None:
+            labels[i] = turns[best_turn][2]
+
+    return labels
+
+
+def label_intervals_bruteforce(intervals, turns):
+    """Reference O(N * M) implementation, kept for tests and benchmarks."""
+    labels = []
+    for start, end in intervals:
+        max_overlap = 0
+        best_match_label = UNKNOWN_SPEAKER
+        for turn_start, turn_end, label in turns:
+            overlap = max(0, min(end, turn_end) - max(start, turn_start))
+            if overlap > max_overlap:
+                max_overlap = overlap
+                best_match_label = label
+        labels.append(best_match_label)
+    return labels
+
+
+def assign_speakers(segments, turns, word_level=False):
+    """Set ``speaker`` on every segment, and on its words when asked to."""
+    labels = label_intervals([(s["start"], s["end"]) for s in segments], turns)
+    for segment, label in zip(segments, labels):
+        segment["speaker"] = label
+
+    if word_level:
+        words = [word for segment in segments for word in segment.get("words", ())]
+        labels = label_intervals([(w["start"], w["end"]) for w in words], turns)
+        for word, label in zip(words, labels):
+            word["speaker"] = label
+
+    return segments
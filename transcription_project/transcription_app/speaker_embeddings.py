@@ -0,0 +1,69 @@
+import logging
+import threading
+
+import numpy as np
+import torch
+
+from .model_registry import get_diarization_pipeline
+
+logger = logging.getLogger(__name__)
+
+_embedding_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """The speaker embedding model the diarization pipeline clusters with."""
+    return get_diarization_pipeline()._embedding
+
+
+def normalize(embeddings):
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def embed_clips(clips):
+    """Unit-length speaker embeddings for equally long mono 16 kHz clips."""
+    model = get_embedding_model()
+    waveforms = torch.from_numpy(np.stack(clips).astype(np.float32)).unsqueeze(1)
+    with _embedding_lock, torch.inference_mode():
+        return normalize(model(waveforms))
+
+
+def embed_clip(clip):
+    return embed_clips([clip])[0]
+
+
+class OnlineSpeakerClustering:
+    """Incremental speaker labels from one embedding per utterance.
+
+    An utterance joins the closest known speaker when their cosine similarity
+    reaches ``threshold`` and otherwise starts a new speaker. Centroids are
+    running means, so labels settle as more speech is heard.
+    """
+
+    def __init__(self, threshold, max_speakers=None):
+        self.threshold = threshold
+        self.max_speakers = max_speakers
+        self.centroids = []
+        self.counts = []
+
+    def label(self, index):
+        return f"SPEAKER_{index:02d}"
+
+    def assign(self, embedding):
+        embedding = normalize(embedding)[0]
+        if self.centroids:
+            similarities = normalize(self.centroids) @ embedding
+            best = int(np.argmax(similarities))
+            full = self.max_speakers and len(self.centroids) >= self.max_speakers
+            if similarities[best] >= self.threshold or full:
+                self.counts[best] += 1
+                self.centroids[best] += (
+                    embedding - self.centroids[best]
+                ) / self.counts[best]
+                return self.label(best)
+
+        self.centroids.append(embedding.copy())
+        self.counts.append(1)
+        return self.label(len(self.centroids) - 1)
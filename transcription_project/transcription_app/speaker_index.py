@@ -0,0 +1,179 @@
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from . import diarization_cache
+from .models import SpeakerEmbedding, SpeakerProfile
+from .speaker_embeddings import normalize
+
+logger = logging.getLogger(__name__)
+
+KMEANS_ITERATIONS = 10
+# k-means is trained on at most this many embeddings per centroid
+KMEANS_SAMPLES_PER_LIST = 64
+
+
+class SpeakerIndex:
+    """Cosine nearest-neighbour search over speaker embeddings.
+
+    Small indexes are searched exhaustively. From ``ivf_min_size`` embeddings
+    on, an inverted file index is built: embeddings are bucketed under
+    spherical k-means centroids and each query scans only the ``nprobe``
+    buckets closest to it, which keeps lookups well under a millisecond at
+    100k embeddings on one core.
+    """
+
+    def __init__(self, embeddings, labels, nprobe=8, ivf_min_size=4096, seed=0):
+        vectors = normalize(embeddings) if len(embeddings) else np.zeros((0, 1))
+        labels = np.asarray(labels)
+        self.nprobe = nprobe
+        self.centroids = None
+        if len(vectors) < ivf_min_size:
+            self.vectors, self.labels = vectors, labels
+            return
+
+        nlist = int(np.sqrt(len(vectors)))
+        self.centroids = self._train(vectors, nlist, np.random.default_rng(seed))
+        assignment = np.argmax(vectors @ self.centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.labels = labels[order]
+        self.offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @staticmethod
+    def _train(vectors, nlist, rng):
+        sample_size = min(len(vectors), nlist * KMEANS_SAMPLES_PER_LIST)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            empty = ~sums.any(axis=1)
+            # Reseed empty buckets so every list stays useful
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = normalize(sums)
+        return centroids
+
+    def search(self, queries):
+        """Closest label and cosine similarity for each query embedding."""
+        queries = normalize(queries)
+        best_labels = np.full(len(queries), None, dtype=object)
+        best_scores = np.full(len(queries), -np.inf, dtype=np.float32)
+        if not len(self.vectors) or not len(queries):
+            return best_labels, best_scores
+
+        if self.centroids is None:
+            scores = queries @ self.vectors.T
+            best = np.argmax(scores, axis=1)
+            return self.labels[best], scores[np.arange(len(queries)), best]
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        coarse = queries @ self.centroids.T
+        probes = np.argpartition(-coarse, nprobe - 1, axis=1)[:, :nprobe]
+        # Visit each probed bucket once, scoring every query that probes it
+        for bucket in np.unique(probes):
+            start, end = self.offsets[bucket], self.offsets[bucket + 1]
+            if start == end:
+                continue
+            query_ids = np.flatnonzero((probes == bucket).any(axis=1))
+            scores = queries[query_ids] @ self.vectors[start:end].T
+            best = np.argmax(scores, axis=1)
+            top = scores[np.arange(len(query_ids)), best]
+            better = top > best_scores[query_ids]
+            best_scores[query_ids[better]] = top[better]
+            best_labels[query_ids[better]] = self.labels[start + best[better]]
+        return best_labels, best_scores
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_user_index(user_id):
+    """The user's SpeakerIndex, rebuilt only after enrollments change."""
+    version = SpeakerEmbedding.objects.filter(user_id=user_id).aggregate(
+        count=Count("id"), last=Max("id")
+    )
+    version = (version["count"], version["last"])
+    with _indexes_lock:
+        cached = _indexes.get(user_id)
+        if cached and cached[0] == version:
+            return cached[1]
+
+    rows = list(
+        SpeakerEmbedding.objects.filter(user_id=user_id).values_list(
+            "profile_id", "vector"
+        )
+    )
+    embeddings = np.array(
+        [np.frombuffer(vector, dtype=np.float32) for _, vector in rows]
+    )
+    index = SpeakerIndex(
+        embeddings,
+        [profile_id for profile_id, _ in rows],
+        nprobe=settings.TRANSCRIPTION_SPEAKER_INDEX_NPROBE,
+    )
+    with _indexes_lock:
+        _indexes[user_id] = (version, index)
+    logger.info(f"Built speaker index of {len(index)} embeddings for user {user_id}")
+    return index
+
+
+def identify_speakers(user_id, content_hash):
+    """Map a recording's diarization labels to the user's enrolled speaker names."""
+    result = diarization_cache.load(content_hash)
+    if result is None or result.embeddings is None or not len(result.labels):
+        return {}
+    embeddings = np.asarray(result.embeddings)
+    # Speakers pyannote couldn't embed come back as zero rows
+    usable = np.flatnonzero(
+        np.isfinite(embeddings).all(axis=1) & embeddings.any(axis=1)
+    )
+    if not len(usable):
+        return {}
+
+    profile_ids, scores = get_user_index(user_id).search(embeddings[usable])
+    matches = {
+        result.labels[i]: profile_id
+        for i, profile_id, score in zip(usable, profile_ids, scores)
+        if profile_id is not None
+        and score >= settings.TRANSCRIPTION_SPEAKER_MATCH_THRESHOLD
+    }
+    names = dict(
+        SpeakerProfile.objects.filter(id__in=set(matches.values())).values_list(
+            "id", "name"
+        )
+    )
+    return {label: names[profile_id] for label, profile_id in matches.items()}
+
+
+def enroll(user, audio_file, label, name):
+    """Add the embedding of speaker ``label`` in ``audio_file`` to profile ``name``."""
+    result = diarization_cache.load(audio_file.content_hash)
+    if result is None or result.embeddings is None or label not in result.labels:
+        return None
+    embedding = normalize(result.embeddings[result.labels.index(label)])[0]
+    profile, _ = SpeakerProfile.objects.get_or_create(user=user, name=name)
+    SpeakerEmbedding.objects.create(
+        profile=profile,
+        user=user,
+        audio_file=audio_file,
+        vector=embedding.astype(np.float32).tobytes(),
+    )
+    return profile
+
+
+def name_speakers(audio_file, segments):
+    """``segments`` with speakers the owner has enrolled renamed to their names.
+
+    The result cache is shared between users, so a renamed copy is returned.
+    """
+    names = identify_speakers(audio_file.user_id, audio_file.content_hash)
+    return segments.renamed(names) if names else segments
@@ -1,33 +1,222 @@
-from celery import shared_task
+from celery import Task, chain, group, shared_task
+from django.conf import settings
+from django.db.models import F
+from . import result_cache, scheduler, search, speaker_index
+from .asr_backends import AsrConfig
+from .batch_scheduler import get_batch_scheduler
+from .instrumentation import measure_stage
 from .models import AudioFile
+from .progress import ProgressReporter, publish, set_status
+from .realtime import decode_window
+from .segment_store import SegmentStore
+from .speaker_embeddings import embed_clip
 from .transcription_service import TranscriptionService
+from .vad import SpeechMap
+from .workspace import JobWorkspace
 import os
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+class PipelineError(Exception):
+    """A stage produced no usable result; retrying won't help."""
+
+
+class PipelineTask(Task):
+    autoretry_for = (Exception,)
+    dont_autoretry_for = (PipelineError,)
+    max_retries = 3
+    retry_backoff = True
+
+    def __call__(self, audio_file_id, *args, **kwargs):
+        stage = self.name.rsplit(".", 1)[-1].removesuffix("_stage")
+        profile = (
+            settings.TRANSCRIPTION_PROFILE_STAGES
+            or AudioFile.objects.filter(id=audio_file_id, profile=True).exists()
+        )
+        workspace = JobWorkspace(audio_file_id)
+        with measure_stage(audio_file_id, stage, profile=profile) as measurement:
+            # Export removes the workspace, decode creates the audio
+            measurement.audio_seconds = workspace.audio_seconds()
+            try:
+                return super().__call__(audio_file_id, *args, **kwargs)
+            finally:
+                if measurement.audio_seconds is None:
+                    measurement.audio_seconds = workspace.audio_seconds()
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        audio_file_id = args[0]
+        logger.error(
+            f"Stage {self.name} failed for audio file {audio_file_id}: {str(exc)}"
+        )
+        # A failed export leaves the stored transcript usable
+        if (
+            AudioFile.objects.filter(id=audio_file_id)
+            .exclude(status="completed")
+            .update(status="failed")
+        ):
+            publish(audio_file_id, {"status": "failed", "stage": self.name})
+        JobWorkspace(audio_file_id).cleanup()
+        scheduler.release(audio_file_id)
+
+
+def _service(audio_file):
+    return TranscriptionService(
+        str(audio_file.id),
+        transcription_mode=audio_file.transcription_mode,
+        progress_callback=ProgressReporter(audio_file.id),
+        asr=AsrConfig.for_audio_file(audio_file),
+    )
+
+
+def pipeline(audio_file_id):
+    """decode -> (transcribe | diarize) -> merge -> export, each on its own queue."""
+    return chain(
+        decode_stage.si(audio_file_id),
+        group(transcribe_stage.si(audio_file_id), diarize_stage.si(audio_file_id)),
+        merge_stage.si(audio_file_id),
+        export_stage.si(audio_file_id),
+    )
+
+
 @shared_task(bind=True, max_retries=3)
 def process_audio_file(self, audio_file_id):
     try:
         audio_file = AudioFile.objects.get(id=audio_file_id)
-        audio_file.status = "processing"
-        audio_file.save()
-
-        service = TranscriptionService(str(audio_file.id))
-        result = service.process_audio_file(audio_file.file.path)
+        if not audio_file.content_hash:
+            audio_file.content_hash = result_cache.hash_file(audio_file.file.path)
+            audio_file.save(update_fields=["content_hash"])
+        if result_cache.apply_cached_result(audio_file):
+            publish(audio_file_id, {"status": "completed"})
+            scheduler.release(audio_file_id)
+            return
 
-        if result:
-            audio_file.status = "completed"
-            audio_file.processed = True
-        else:
-            audio_file.status = "failed"
-        audio_file.save()
+        set_status(audio_file_id, "processing")
+        pipeline(audio_file_id).apply_async()
 
     except Exception as e:
         logger.error(
             f"Error processing audio file {audio_file_id}: {str(e)}", exc_info=True
         )
-        audio_file.status = "failed"
-        audio_file.save()
-        raise self.retry(exc=e)
+        if self.request.retries < self.max_retries:
+            # Still "pending" or "processing", so the job keeps its slot
+            raise self.retry(exc=e)
+        set_status(audio_file_id, "failed")
+        scheduler.release(audio_file_id)
+        raise
+
+
+@shared_task
+def realtime_transcribe(window):
+    """Text of one live-stream window, batched with the worker's other streams."""
+    text, _ = get_batch_scheduler().transcribe(decode_window(window))
+    return text
+
+
+@shared_task
+def realtime_embed(window):
+    """Speaker embedding of one live-stream window."""
+    return embed_clip(decode_window(window)).tolist()
+
+
+@shared_task
+def dispatch_queued_jobs():
+    return scheduler.dispatch()
+
+
+@shared_task
+def estimate_job(audio_file_id):
+    scheduler.estimate(audio_file_id)
+    scheduler.dispatch()
+
+
+@shared_task(base=PipelineTask)
+def decode_stage(audio_file_id):
+    audio_file = AudioFile.objects.get(id=audio_file_id)
+    workspace = JobWorkspace(audio_file_id)
+    service = _service(audio_file)
+    service.report_progress("decode", 0)
+    audio = service.load_audio(audio_file.file.path, mmap_path=workspace.audio_path)
+    if audio is None:
+        raise PipelineError(f"Failed to decode {audio_file.file.path}")
+    speech = service.speech_map(audio)
+    if speech is not None:
+        workspace.save("speech", speech.to_json())
+    service.report_progress("decode", 100)
+
+
+def _speech_map(workspace):
+    """Speech regions found by the decode stage, if the VAD ran."""
+    if workspace.exists("speech"):
+        return SpeechMap.from_json(workspace.load("speech"))
+    return None
+
+
+@shared_task(base=PipelineTask)
+def transcribe_stage(audio_file_id):
+    audio_file = AudioFile.objects.get(id=audio_file_id)
+    workspace = JobWorkspace(audio_file_id)
+    workspace.reset_segments()
+    segments = []
+    for new_segments in _service(audio_file).iter_transcribe(
+        workspace.load_audio(), speech=_speech_map(workspace)
+    ):
+        workspace.append_segments(new_segments)
+        segments.extend(new_segments)
+    transcription = "".join(segment["text"] for segment in segments)
+    if not transcription or not segments:
+        raise PipelineError(f"Transcription failed for audio file {audio_file_id}")
+    workspace.save("transcript", {"text": transcription, "segments": segments})
+
+
+@shared_task(base=PipelineTask)
+def diarize_stage(audio_file_id):
+    audio_file = AudioFile.objects.get(id=audio_file_id)
+    workspace = JobWorkspace(audio_file_id)
+    turns = _service(audio_file).diarize(
+        workspace.load_audio(),
+        content_hash=audio_file.content_hash,
+        speech=_speech_map(workspace),
+    )
+    workspace.save("turns", turns)
+
+
+@shared_task(base=PipelineTask)
+def merge_stage(audio_file_id):
+    audio_file = AudioFile.objects.get(id=audio_file_id)
+    workspace = JobWorkspace(audio_file_id)
+    transcript = workspace.load("transcript")
+    service = _service(audio_file)
+    service.report_progress("merge", 0)
+    segments = service.assign_speakers(transcript["segments"], workspace.load("turns"))
+    segments = SegmentStore.from_segments(segments)
+    named = speaker_index.name_speakers(audio_file, segments)
+
+    set_status(
+        audio_file_id,
+        "completed",
+        stage="merge",
+        progress=100,
+        processed=True,
+        transcription_text=transcript["text"],
+        segment_data=named.to_bytes(),
+        transcript_version=F("transcript_version") + 1,
+    )
+    search.index_transcript(audio_file, named)
+    result_cache.store(audio_file, transcript["text"], segments)
+    # Exporting is cheap, so the next job can start on the model workers
+    scheduler.release(audio_file_id)
+
+
+@shared_task(base=PipelineTask)
+def export_stage(audio_file_id):
+    audio_file = AudioFile.objects.get(id=audio_file_id)
+    transcription, segments = audio_file.get_transcript()
+    _service(audio_file).export_transcription(
+        transcription,
+        segments,
+        audio_file.file.path,
+        version=audio_file.transcript_version,
+    )
+    JobWorkspace(audio_file_id).cleanup()
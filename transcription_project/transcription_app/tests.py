@@ -1,8 +1,77 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.db import connection
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import CustomUser
+from .models import (
+    AudioFile,
+    CustomUser,
+    JobQueueEntry,
+    JobStageMetric,
+    TranscriptionResult,
+    UploadSession,
+)
+from . import result_cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from .model_registry import ModelRegistry
+from .speaker_assignment import (
+    assign_speakers,
+    label_intervals,
+    label_intervals_bruteforce,
+)
+from .audio_decoding import SAMPLE_RATE, AudioDecodingError, decode_audio
+from .exporters import TranscriptExporter
+from .batch_scheduler import BatchScheduler, split_segments
+from .chunked_transcription import (
+    iter_transcribe_chunked,
+    plan_chunks,
+    stitch_segments,
+)
+from . import progress
+from .progress import ProgressReporter, publish
+from . import diarization_cache
+from pyannote.core import Annotation, Segment
+from . import realtime
+from .realtime import RealtimeSession, StreamSegmenter, websocket_application
+from .speaker_embeddings import OnlineSpeakerClustering
+from .speaker_index import SpeakerIndex, name_speakers
+from .segment_store import SegmentStore, slim_segments
+from . import scheduler, search
+from django.core.management import CommandError, call_command
+from .management.commands.benchmark_pipeline import (
+    StubWhisperModel,
+    compare_results,
+    synthetic_wav,
+)
+from .management.commands.benchmark_asr import word_error_rate
+from .asr_backends import AsrConfig, quantize_dynamic_int8
+from .vad import SpeechMap, detect_speech
+from .model_registry import get_registry
+from .instrumentation import measure_stage
+from .tasks import process_audio_file
+from rest_framework_simplejwt.tokens import AccessToken
+from django.test import AsyncClient
+from .transcription_service import TranscriptionService
+from .workspace import JobWorkspace
+from transcription_project.celery import app as celery_app, configure_stage_worker
+import asyncio
+import base64
+import concurrent.futures
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+import wave
+import numpy as np
+from pathlib import Path
 
 
 class AuthenticationTest(TestCase):
@@ -57,3 +126,1927 @@ class AuthenticationTest(TestCase):
         response = self.client.post(verify_url, {"token": access_token}, format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(response.data["valid"])
+
+
+class ModelRegistryTest(SimpleTestCase):
+    def test_models_are_loaded_once(self):
+        registry = ModelRegistry(max_size=2)
+        loads = []
+
+        def loader():
+            loads.append(1)
+            return object()
+
+        first = registry.get(("whisper", "base", "cpu"), loader)
+        second = registry.get(("whisper", "base", "cpu"), loader)
+        self.assertIs(first, second)
+        self.assertEqual(len(loads), 1)
+
+    def test_least_recently_used_model_is_evicted(self):
+        registry = ModelRegistry(max_size=2)
+        registry.get(("whisper", "base", "cpu"), object)
+        registry.get(("whisper", "small", "cpu"), object)
+        registry.get(("whisper", "base", "cpu"), object)
+        registry.get(("whisper", "medium", "cpu"), object)
+        self.assertEqual(
+            registry.keys(),
+            [("whisper", "base", "cpu"), ("whisper", "medium", "cpu")],
+        )
+
+
+class SpeakerAssignmentTest(SimpleTestCase):
+    def test_matches_pairwise_assignment(self):
+        rng = random.Random(42)
+        for _ in range(50):
+            # Integer boundaries make ties and zero-length overlaps common
+            intervals = []
+            for _ in range(rng.randint(0, 40)):
+                start = rng.randint(0, 100)
+                intervals.append((start, start + rng.randint(0, 15)))
+            turns = []
+            for _ in range(rng.randint(0, 40)):
+                start = rng.randint(0, 100)
+                turns.append((start, start + rng.randint(0, 15), rng.choice("ABC")))
+            self.assertEqual(
+                label_intervals(intervals, turns),
+                label_intervals_bruteforce(intervals, turns),
+            )
+
+    def test_segments_are_labelled(self):
+        turns = [(0.0, 2.0, "SPEAKER_00"), (2.0, 4.0, "SPEAKER_01")]
+        segments = [
+            {"start": 0.0, "end": 3.0, "text": " Hi there"},
+            {"start": 2.5, "end": 4.0, "text": " Hello"},
+            {"start": 5.0, "end": 6.0, "text": " Bye"},
+        ]
+        assign_speakers(segments, turns)
+        self.assertEqual(
+            [s["speaker"] for s in segments], ["SPEAKER_00", "SPEAKER_01", "UNKNOWN"]
+        )
+
+    def test_word_level_assignment(self):
+        turns = [(0.0, 2.0, "SPEAKER_00"), (2.0, 4.0, "SPEAKER_01")]
+        segments = [
+            {
+                "start": 0.0,
+                "end": 3.0,
+                "text": " Hi there",
+                "words": [
+                    {"word": " Hi", "start": 0.0, "end": 1.0},
+                    {"word": " there", "start": 2.2, "end": 3.0},
+                ],
+            },
+            {"start": 5.0, "end": 6.0, "text": " Bye"},
+        ]
+        assign_speakers(segments, turns, word_level=True)
+        self.assertEqual(segments[0]["speaker"], "SPEAKER_00")
+        self.assertEqual(
+            [w["speaker"] for w in segments[0]["words"]],
+            ["SPEAKER_00", "SPEAKER_01"],
+        )
+        self.assertEqual(segments[1]["speaker"], "UNKNOWN")
+
+    def test_benchmark_fails_on_label_mismatch(self):
+        options = {"segments": 50, "turns": 50, "stdout": io.StringIO()}
+        call_command("benchmark_speaker_assignment", **options)
+        with mock.patch(
+            "transcription_app.management.commands.benchmark_speaker_assignment"
+            ".label_intervals",
+            side_effect=lambda intervals, turns: ["X"] * len(intervals),
+        ):
+            with self.assertRaises(CommandError):
+                call_command("benchmark_speaker_assignment", **options)
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class AudioDecodingTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        # One second of a stereo 44.1 kHz tone
+        self.wav_path = self.tmp_dir / "tone.wav"
+        tone = np.sin(np.linspace(0, 440 * 2 * np.pi, 44100)) * 0.5
+        frames = np.repeat((tone * 32767).astype("<i2"), 2)
+        with wave.open(str(self.wav_path), "wb") as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(44100)
+            wav.writeframes(frames.tobytes())
+
+    def test_decodes_to_mono_16k_float32(self):
+        audio = decode_audio(self.wav_path)
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertAlmostEqual(len(audio) / SAMPLE_RATE, 1.0, places=2)
+
+    def test_memory_mapped_decode_matches_in_memory_decode(self):
+        audio = decode_audio(self.wav_path)
+        mapped = decode_audio(self.wav_path, mmap_path=self.tmp_dir / "tone.pcm")
+        np.testing.assert_array_equal(audio, mapped)
+
+    def test_damaged_file_raises_decoding_error(self):
+        damaged = self.tmp_dir / "damaged.wav"
+        damaged.write_bytes(os.urandom(1 << 20))
+        with self.assertRaises(AudioDecodingError):
+            decode_audio(damaged)
+
+
+class ChunkedTranscriptionTest(SimpleTestCase):
+    def test_chunks_are_cut_in_silence(self):
+        rng = np.random.default_rng(0)
+        audio = rng.uniform(-0.5, 0.5, SAMPLE_RATE * 100).astype(np.float32)
+        silence = slice(SAMPLE_RATE * 47, SAMPLE_RATE * 48)
+        audio[silence] = 0
+        chunks = plan_chunks(audio, chunk_seconds=50, overlap_seconds=1)
+
+        self.assertEqual(len(chunks), 2)
+        boundary = chunks[0][1]
+        self.assertTrue(silence.start <= boundary < silence.stop)
+        self.assertEqual(chunks[1][0], boundary)
+        self.assertEqual(chunks[0][3], boundary + SAMPLE_RATE)
+        self.assertEqual(chunks[1][2], boundary - SAMPLE_RATE)
+
+    def test_stitching_drops_overlap_duplicates(self):
+        first = [
+            {"start": 0.0, "end": 4.0, "text": " Hello there."},
+            {"start": 4.0, "end": 6.5, "text": " General Kenobi."},
+        ]
+        second = [
+            {"start": 5.6, "end": 6.6, "text": " general kenobi"},
+            {"start": 6.6, "end": 9.0, "text": " You are a bold one."},
+        ]
+        segments = stitch_segments([(0.0, 6.0, first), (6.0, 10.0, second)])
+        self.assertEqual(
+            [s["text"] for s in segments],
+            [" Hello there.", " General Kenobi.", " You are a bold one."],
+        )
+        self.assertEqual([s["id"] for s in segments], [0, 1, 2])
+
+    def test_stitching_trims_partial_overlaps(self):
+        first = [{"start": 0.0, "end": 6.2, "text": " Hello there, General Kenobi."}]
+        second = [
+            {"start": 5.0, "end": 7.5, "text": " general kenobi, you are a bold one"},
+            {"start": 7.5, "end": 9.0, "text": " Kill him."},
+        ]
+        segments = stitch_segments([(0.0, 6.0, first), (6.0, 10.0, second)])
+        self.assertEqual(
+            [(s["start"], s["end"], s["text"]) for s in segments],
+            [
+                (0.0, 6.2, " Hello there, General Kenobi."),
+                (6.2, 7.5, " you are a bold one"),
+                (7.5, 9.0, " Kill him."),
+            ],
+        )
+
+    def test_stitched_segments_never_end_before_they_start(self):
+        first = [{"start": 0.0, "end": 8.0, "text": " A long opening statement."}]
+        second = [
+            {"start": 6.5, "end": 7.0, "text": " Right."},
+            {"start": 8.0, "end": 9.0, "text": " Next."},
+        ]
+        segments = stitch_segments([(0.0, 6.5, first), (6.5, 10.0, second)])
+        self.assertEqual([s["text"] for s in segments], [first[0]["text"], " Next."])
+        for segment in segments:
+            self.assertLessEqual(segment["start"], segment["end"])
+
+    @mock.patch("transcription_app.chunked_transcription.transcribe_chunk")
+    def test_sequential_chunks_are_yielded_with_prompt(self, transcribe_chunk):
+        rng = np.random.default_rng(0)
+        audio = rng.uniform(-0.5, 0.5, SAMPLE_RATE * 100).astype(np.float32)
+        audio[SAMPLE_RATE * 47 : SAMPLE_RATE * 48] = 0
+        transcribe_chunk.side_effect = [
+            [{"start": 1.0, "end": 2.0, "text": " One."}],
+            [{"start": 2.0, "end": 3.0, "text": " Two."}],
+        ]
+
+        chunks = iter_transcribe_chunked(
+            audio, "base", {}, chunk_seconds=50, sequential=True
+        )
+        done, segments = next(chunks)
+        self.assertEqual([s["text"] for s in segments], [" One."])
+        self.assertEqual(transcribe_chunk.call_count, 1)
+
+        done, segments = next(chunks)
+        self.assertEqual(done, 100)
+        self.assertEqual(segments[0]["id"], 1)
+        self.assertEqual(transcribe_chunk.call_args[0][2], {"initial_prompt": " One."})
+
+    @override_settings(TRANSCRIPTION_CHUNK_WORKERS=2)
+    def test_pool_holds_a_bounded_number_of_chunks(self):
+        audio = np.zeros(SAMPLE_RATE * 100, dtype=np.float32)
+        submitted = []
+
+        class InlineExecutor:
+            def __init__(self, **kwargs):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, fn, chunk, asr, options):
+                submitted.append(len(chunk))
+                future = concurrent.futures.Future()
+                future.set_result([{"start": 0.0, "end": 1.0, "text": " Hi."}])
+                return future
+
+        module = "transcription_app.chunked_transcription"
+        with mock.patch(f"{module}.ProcessPoolExecutor", InlineExecutor):
+            chunks = iter_transcribe_chunked(audio, "base", {}, chunk_seconds=10)
+            # Chunks queued behind the one being stitched, at every yield
+            in_flight = [len(submitted) - i - 1 for i, _ in enumerate(chunks)]
+        self.assertGreater(len(submitted), 4)
+        self.assertEqual(len(in_flight), len(submitted))
+        self.assertLessEqual(max(in_flight), 4)
+
+    def test_transcribe_workers_use_threads(self):
+        # Prefork children are daemonic and can't start the chunk pool
+        sender = mock.Mock(pool_cls="prefork")
+        sender.app.amqp.queues.consume_from = {"transcribe": None}
+        configure_stage_worker(sender)
+        self.assertEqual(sender.pool_cls, "threads")
+        sender = mock.Mock(pool_cls="prefork")
+        sender.app.amqp.queues.consume_from = {"diarize": None}
+        configure_stage_worker(sender)
+        self.assertEqual(sender.pool_cls, "prefork")
+
+
+class TranscriptExporterTest(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.segments = [
+            {"start": 0.0, "end": 1.5, "text": " Hello.", "speaker": "SPEAKER_00"},
+            {"start": 1.5, "end": 3.0, "text": " Hi!"},
+        ]
+
+    def test_writes_all_formats_in_one_location(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            exporter = TranscriptExporter(
+                7, "meeting", formats=["txt", "json", "srt", "vtt"]
+            )
+            paths = exporter.export(" Hello. Hi!", self.segments)
+
+        self.assertEqual(set(paths), {"txt", "json", "srt", "vtt"})
+        output_dir = Path(self.media_root) / "transcriptions" / "7" / "meeting"
+        self.assertEqual(
+            sorted(p.name for p in output_dir.iterdir()),
+            sorted(
+                f"meeting_transcription_with_speakers.{ext}"
+                for ext in ("txt", "json", "srt", "vtt")
+            ),
+        )
+        self.assertEqual(
+            paths["txt"].read_text(), "SPEAKER_00:  Hello.\nUNKNOWN:  Hi!\n"
+        )
+        self.assertEqual(
+            json.loads(paths["json"].read_text()),
+            {
+                "transcription": " Hello. Hi!",
+                "segments": [
+                    {
+                        "text": " Hello.",
+                        "speaker": "SPEAKER_00",
+                        "start": 0.0,
+                        "end": 1.5,
+                    },
+                    {"text": " Hi!", "speaker": "UNKNOWN", "start": 1.5, "end": 3.0},
+                ],
+            },
+        )
+        self.assertTrue(paths["vtt"].read_text().startswith("WEBVTT\n\n1\n0:00:00"))
+        self.assertIn(
+            "2\n0:00:01.500000 --> 0:00:03\nUNKNOWN:  Hi!", paths["srt"].read_text()
+        )
+
+    def test_only_enabled_formats_are_written(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            paths = TranscriptExporter(7, "meeting", formats=["srt"]).export(
+                "", self.segments
+            )
+        self.assertEqual(list(paths), ["srt"])
+        self.assertEqual(len(list(paths["srt"].parent.iterdir())), 1)
+
+
+class TranscriptDownloadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.audio_file = AudioFile.objects.create(
+            user=self.user,
+            file="uploads/meeting.wav",
+            processed=True,
+            status="completed",
+            transcription_text=" Hello.",
+            transcription_json={
+                "transcription": " Hello.",
+                "segments": [
+                    {"text": " Hello.", "speaker": "SPEAKER_00", "start": 0, "end": 1}
+                ],
+            },
+        )
+        self.url = reverse("audiofile-download", args=[self.audio_file.id])
+
+    def test_format_is_rendered_on_first_request(self):
+        path = Path(self.audio_file.get_file_path("srt"))
+        self.assertFalse(path.exists())
+
+        response = self.client.get(self.url, {"format": "srt"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            b"".join(response.streaming_content),
+            b"1\n0:00:00 --> 0:00:01\nSPEAKER_00:  Hello.\n\n",
+        )
+        self.assertTrue(path.exists())
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+    def test_new_transcript_replaces_renders_without_removing_directory(self):
+        self.client.get(self.url, {"format": "srt"}).close()
+        old_path = Path(self.audio_file.get_file_path("srt"))
+        # An on-demand render still writing when the next transcript lands
+        in_progress = old_path.parent / "render.tmp"
+        in_progress.write_text("")
+
+        AudioFile.objects.filter(id=self.audio_file.id).update(transcript_version=1)
+        self.audio_file.refresh_from_db()
+        TranscriptionService(self.audio_file.id).export_transcription(
+            " Hello.", [], self.audio_file.file.name, formats=["txt"], version=1
+        )
+        self.assertFalse(old_path.exists())
+        self.assertTrue(in_progress.exists())
+        self.assertTrue(os.path.exists(self.audio_file.get_file_path("txt")))
+
+        response = self.client.get(self.url, {"format": "srt"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn(
+            "meeting_transcription_with_speakers.srt", response["Content-Disposition"]
+        )
+        self.assertTrue(os.path.exists(self.audio_file.get_file_path("srt")))
+
+    def test_repeat_download_is_not_modified(self):
+        response = self.client.get(self.url, {"format": "txt"})
+        response.close()
+
+        response = self.client.get(
+            self.url, {"format": "txt"}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_byte_range_request(self):
+        response = self.client.get(self.url, {"format": "srt"}, HTTP_RANGE="bytes=2-8")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), b"0:00:00")
+        self.assertEqual(response["Content-Length"], "7")
+        self.assertEqual(response["Content-Range"], "bytes 2-8/43")
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, {"format": "srt"}, HTTP_RANGE="bytes=100-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+
+    def test_multiple_ranges_get_the_whole_file(self):
+        for header in ("bytes=0-1,4-5", "bytes=-", "lines=1-2"):
+            response = self.client.get(self.url, {"format": "srt"}, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(b"".join(response.streaming_content)), 43)
+
+    def test_gzip_encoded_download(self):
+        response = self.client.get(
+            self.url, {"format": "txt"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(
+            gzip.decompress(b"".join(response.streaming_content)),
+            b"SPEAKER_00:  Hello.\n",
+        )
+
+    def test_accel_redirect_mode(self):
+        with override_settings(TRANSCRIPTION_DOWNLOAD_SENDFILE="x-accel-redirect"):
+            response = self.client.get(self.url, {"format": "txt"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(
+            response["X-Accel-Redirect"],
+            f"/protected-media/transcriptions/{self.audio_file.id}/meeting/"
+            "meeting_transcription_with_speakers.txt",
+        )
+
+
+class ResumableUploadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.data = bytes(range(256)) * 40
+        response = self.client.post(
+            reverse("upload-list"),
+            {"filename": "call.mp3", "size": len(self.data)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.session_id = response.data["id"]
+        self.chunk_url = reverse("upload-chunk", args=[self.session_id])
+
+    def send_chunk(self, offset, body, checksum=None):
+        headers = {"HTTP_UPLOAD_OFFSET": str(offset)}
+        if checksum is None:
+            checksum = base64.b64encode(hashlib.sha256(body).digest()).decode()
+        if checksum:
+            headers["HTTP_UPLOAD_CHECKSUM"] = f"sha256 {checksum}"
+        return self.client.generic(
+            "PATCH",
+            self.chunk_url,
+            body,
+            content_type="application/offset+octet-stream",
+            **headers,
+        )
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_chunks_are_assembled_and_finalized(self, task):
+        response = self.send_chunk(0, self.data[:4000])
+        self.assertEqual(response.data["offset"], 4000)
+
+        # A retried chunk at a stale offset is rejected with the real offset
+        response = self.send_chunk(0, self.data[:4000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["offset"], 4000)
+
+        response = self.send_chunk(4000, self.data[4000:])
+        self.assertEqual(response.data["offset"], len(self.data))
+
+        response = self.client.post(reverse("upload-finalize", args=[self.session_id]))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        audio_file = AudioFile.objects.get(id=response.data["id"])
+        with open(audio_file.file.path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+        # Hashed by the worker, not while finalizing
+        self.assertEqual(audio_file.content_hash, "")
+        task.delay.assert_called_once_with(audio_file.id)
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_job_options_are_carried_to_the_audio_file(self, task):
+        options = {
+            "transcription_mode": "chunked",
+            "profile": True,
+            "asr_compute_type": "int8",
+        }
+        response = self.client.post(
+            reverse("upload-list"),
+            {"filename": "call.mp3", "size": len(self.data), **options},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.chunk_url = reverse("upload-chunk", args=[response.data["id"]])
+        self.send_chunk(0, self.data)
+        response = self.client.post(
+            reverse("upload-finalize", args=[response.data["id"]])
+        )
+        audio_file = AudioFile.objects.get(id=response.data["id"])
+        for option, value in options.items():
+            self.assertEqual(getattr(audio_file, option), value)
+
+        response = self.client.post(
+            reverse("upload-list"),
+            {"filename": "call.mp3", "size": 10, "asr_model": "large-v3"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checksum_mismatch_discards_chunk(self):
+        bad_checksum = base64.b64encode(hashlib.sha256(b"other").digest()).decode()
+        response = self.send_chunk(0, self.data[:4000], checksum=bad_checksum)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        session = UploadSession.objects.get(id=self.session_id)
+        self.assertEqual(session.offset, 0)
+        self.assertEqual(os.path.getsize(session.get_part_path()), 0)
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_incomplete_upload_cannot_be_finalized(self, task):
+        self.send_chunk(0, self.data[:100])
+        response = self.client.post(reverse("upload-finalize", args=[self.session_id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(AudioFile.objects.exists())
+        task.delay.assert_not_called()
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.content = b"RIFF fake audio bytes"
+        self.url = reverse("audiofile-list")
+
+    def upload(self):
+        return self.client.post(
+            self.url,
+            {"file": SimpleUploadedFile("call.wav", self.content)},
+            format="multipart",
+        )
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_upload_is_hashed_while_received(self, task):
+        response = self.upload()
+        audio_file = AudioFile.objects.get(id=response.data["id"])
+        self.assertEqual(
+            audio_file.content_hash, hashlib.sha256(self.content).hexdigest()
+        )
+        task.delay.assert_called_once_with(audio_file.id)
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_large_upload_is_hashed_once(self, task):
+        hashed = []
+
+        class RecordingSha256:
+            def __init__(self, data=b""):
+                self.hash = sha256(data)
+
+            def update(self, data):
+                hashed.append(data)
+                self.hash.update(data)
+
+            def hexdigest(self):
+                return self.hash.hexdigest()
+
+        sha256 = hashlib.sha256
+        # Too large for the memory handler, which passes chunks on
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=8), mock.patch.object(
+            result_cache, "hashlib", types.SimpleNamespace(sha256=RecordingSha256)
+        ):
+            response = self.upload()
+        audio_file = AudioFile.objects.get(id=response.data["id"])
+        self.assertEqual(audio_file.content_hash, sha256(self.content).hexdigest())
+        self.assertEqual(b"".join(hashed), self.content)
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_repeated_upload_reuses_cached_result(self, task):
+        segments = SegmentStore.from_segments(
+            [{"text": " Hi.", "speaker": "SPEAKER_00", "start": 0.0, "end": 1.0}]
+        )
+        first = AudioFile.objects.create(
+            user=self.user,
+            file="uploads/first.wav",
+            content_hash=hashlib.sha256(self.content).hexdigest(),
+        )
+        result_cache.store(first, " Hi.", segments)
+
+        response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        audio_file = AudioFile.objects.get(id=response.data["id"])
+        self.assertEqual(audio_file.status, "completed")
+        self.assertTrue(audio_file.processed)
+        self.assertEqual(audio_file.transcript_document(), segments.document(" Hi."))
+        task.delay.assert_not_called()
+
+    def test_config_change_misses_cache(self):
+        audio_file = AudioFile.objects.create(
+            user=self.user, file="uploads/first.wav", content_hash="abc"
+        )
+        result_cache.store(audio_file, "", SegmentStore.from_segments([]))
+        audio_file.transcription_mode = "chunked"
+        self.assertIsNone(result_cache.lookup(audio_file))
+        self.assertEqual(TranscriptionResult.objects.count(), 1)
+
+    def test_vad_change_misses_cache(self):
+        audio_file = AudioFile.objects.create(
+            user=self.user, file="uploads/first.wav", content_hash="abc"
+        )
+        with override_settings(TRANSCRIPTION_VAD_ENABLED=True):
+            result_cache.store(audio_file, "", SegmentStore.from_segments([]))
+            self.assertIsNotNone(result_cache.lookup(audio_file))
+            with override_settings(TRANSCRIPTION_VAD_PADDING_SECONDS=0.5):
+                self.assertIsNone(result_cache.lookup(audio_file))
+        with override_settings(TRANSCRIPTION_VAD_ENABLED=False):
+            self.assertIsNone(result_cache.lookup(audio_file))
+
+    @mock.patch("transcription_app.tasks.process_audio_file")
+    def test_upload_selects_asr_config(self, task):
+        response = self.client.post(
+            self.url,
+            {
+                "file": SimpleUploadedFile("call.wav", self.content),
+                "asr_compute_type": "int8",
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        audio_file = AudioFile.objects.get(id=response.data["id"])
+        self.assertEqual(AsrConfig.for_audio_file(audio_file).compute_type, "int8")
+        default_key = result_cache.config_key(AudioFile(transcription_mode="standard"))
+        self.assertNotEqual(result_cache.config_key(audio_file), default_key)
+
+        for invalid in (
+            {"asr_backend": "nope"},
+            {"asr_compute_type": "int4"},
+            {"asr_model": "large-v3"},
+            {"asr_model": "someone/any-hub-repo"},
+            {"asr_model": "/tmp/model.pt"},
+        ):
+            response = self.client.post(
+                self.url,
+                {"file": SimpleUploadedFile("call.wav", self.content), **invalid},
+                format="multipart",
+            )
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AudioFileListTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        other = CustomUser.objects.create_user(
+            username="other", email="other@example.com", password="pw123456789"
+        )
+        for i in range(6):
+            AudioFile.objects.create(
+                user=self.user if i % 2 else other,
+                file=f"uploads/{i}.wav",
+                transcription_text="x" * 1000,
+                transcription_json={"transcription": "x" * 1000, "segments": []},
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_query_count_is_constant(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("audiofile-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_list_omits_transcripts(self):
+        response = self.client.get(reverse("audiofile-list"))
+        self.assertNotIn("transcription_text", response.data["results"][0])
+        self.assertIn("user", response.data["results"][0])
+
+    def test_list_is_scoped_to_user_and_paginated(self):
+        url = reverse("audiofile-list")
+        response = self.client.get(url, {"page_size": 2})
+        first_page = [item["id"] for item in response.data["results"]]
+        response = self.client.get(response.data["next"])
+        second_page = [item["id"] for item in response.data["results"]]
+
+        expected = list(
+            AudioFile.objects.filter(user=self.user)
+            .order_by("-uploaded_at", "-id")
+            .values_list("id", flat=True)
+        )
+        self.assertEqual(first_page + second_page, expected)
+        self.assertIsNone(response.data["next"])
+
+    def test_list_filters(self):
+        audio_file = AudioFile.objects.filter(user=self.user).first()
+        AudioFile.objects.filter(id=audio_file.id).update(status="completed")
+        url = reverse("audiofile-list")
+
+        response = self.client.get(url, {"status": "completed"})
+        self.assertEqual(
+            [item["id"] for item in response.data["results"]], [audio_file.id]
+        )
+
+        response = self.client.get(url, {"uploaded_before": "2000-01-01"})
+        self.assertEqual(response.data["results"], [])
+
+        response = self.client.get(url, {"uploaded_after": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BenchmarkAudioFileListTest(TestCase):
+    def test_command_seeds_and_measures(self):
+        command = "transcription_app.management.commands.benchmark_audio_file_list"
+        stdout = io.StringIO()
+        # The test database stands in for the command's throwaway one
+        with mock.patch(f"{command}.setup_test_environment"), mock.patch(
+            f"{command}.teardown_test_environment"
+        ), mock.patch.object(connection.creation, "create_test_db"), mock.patch.object(
+            connection.creation, "destroy_test_db"
+        ):
+            call_command(
+                "benchmark_audio_file_list",
+                rows=20,
+                users=2,
+                pages=2,
+                page_size=5,
+                batch_size=8,
+                stdout=stdout,
+            )
+        self.assertIn("Seeded 20 rows for 2 users", stdout.getvalue())
+        self.assertIn("last 30 days", stdout.getvalue())
+        self.assertEqual(AudioFile.objects.count(), 20)
+        self.assertGreater(
+            AudioFile.objects.values("uploaded_at").distinct().count(), 1
+        )
+
+
+class RecordingBatchScheduler(BatchScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_sizes = []
+
+    def _infer(self, audios):
+        self.batch_sizes.append(len(audios))
+        return [
+            [
+                {
+                    "id": 0,
+                    "start": 0.0,
+                    "end": len(audio) / SAMPLE_RATE,
+                    "text": f" clip of {len(audio)} samples",
+                }
+            ]
+            for audio in audios
+        ]
+
+
+class StubTokenizer:
+    eot = 100
+    timestamp_begin = 200
+
+    def decode(self, tokens):
+        return "".join(f" w{token}" for token in tokens)
+
+
+class BatchSchedulerTest(SimpleTestCase):
+    def test_concurrent_jobs_are_coalesced(self):
+        scheduler = RecordingBatchScheduler("base", max_batch_size=4, max_wait=0.2)
+        futures = [
+            scheduler.submit(np.zeros(SAMPLE_RATE * (i + 1), dtype=np.float32))
+            for i in range(6)
+        ]
+        results = [future.result(timeout=5) for future in futures]
+
+        self.assertEqual(scheduler.batch_sizes, [4, 2])
+        text, segments = results[1]
+        self.assertEqual(text, f" clip of {SAMPLE_RATE * 2} samples")
+        self.assertEqual(segments[0]["end"], 2.0)
+        stats = scheduler.stats()
+        self.assertEqual(stats["jobs"], 6)
+        self.assertEqual(stats["batches"], 2)
+
+    def test_decoded_tokens_are_split_at_timestamps(self):
+        # <|0.00|> w1 w2 <|1.00|><|1.50|> w3 <|9.00|> <|endoftext|>
+        tokens = [200, 1, 2, 250, 275, 3, 650, 100]
+        segments = split_segments(tokens, StubTokenizer(), duration=5.0)
+        self.assertEqual(
+            [(s["start"], s["end"], s["text"]) for s in segments],
+            [(0.0, 1.0, " w1 w2"), (1.5, 5.0, " w3")],
+        )
+
+    def test_long_clips_are_rejected(self):
+        scheduler = RecordingBatchScheduler("base", max_batch_size=4, max_wait=0.01)
+        with self.assertRaises(ValueError):
+            scheduler.submit(np.zeros(SAMPLE_RATE * 31, dtype=np.float32))
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class PipelineTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            TRANSCRIPTION_EXPORT_FORMATS=["srt"],
+            CACHES={
+                "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+                "progress": {
+                    "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+                },
+            },
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        channel = mock.patch.object(progress, "_channel", None)
+        channel.start()
+        self.addCleanup(channel.stop)
+        # Run the whole canvas in-process with results kept in memory
+        conf = celery_app.conf
+        self.addCleanup(
+            conf.update,
+            CELERY_TASK_ALWAYS_EAGER=conf.task_always_eager,
+            CELERY_RESULT_BACKEND=conf.result_backend,
+        )
+        conf.update(
+            CELERY_TASK_ALWAYS_EAGER=True, CELERY_RESULT_BACKEND="cache+memory://"
+        )
+
+        os.makedirs(os.path.join(self.media_root, "uploads"))
+        with wave.open(
+            os.path.join(self.media_root, "uploads", "call.wav"), "wb"
+        ) as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(np.zeros(SAMPLE_RATE * 2, dtype="<i2").tobytes())
+        user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.audio_file = AudioFile.objects.create(
+            user=user, file="uploads/call.wav", content_hash="abc"
+        )
+
+    @mock.patch.object(TranscriptionService, "diarize")
+    @mock.patch.object(TranscriptionService, "iter_transcribe")
+    def test_stages_complete_audio_file(self, transcribe, diarize):
+        transcribe.return_value = iter(
+            [
+                [{"text": " Hi.", "start": 0.0, "end": 1.0}],
+                [{"text": " Bye.", "start": 1.0, "end": 2.0}],
+            ]
+        )
+        diarize.return_value = [(0.0, 1.0, "SPEAKER_00"), (1.0, 2.0, "SPEAKER_01")]
+
+        process_audio_file.delay(self.audio_file.id)
+
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, "completed")
+        self.assertEqual(self.audio_file.transcription_text, " Hi. Bye.")
+        self.assertEqual(
+            [s["speaker"] for s in self.audio_file.get_transcript()[1]],
+            ["SPEAKER_00", "SPEAKER_01"],
+        )
+        # Both model stages saw the same decoded audio
+        self.assertEqual(len(transcribe.call_args[0][0]), SAMPLE_RATE * 2)
+        self.assertEqual(len(diarize.call_args[0][0]), SAMPLE_RATE * 2)
+        self.assertTrue(os.path.exists(self.audio_file.get_file_path("srt")))
+        self.assertFalse(JobWorkspace(self.audio_file.id).root.exists())
+
+    @override_settings(TRANSCRIPTION_WORD_TIMESTAMPS=True)
+    @mock.patch.object(TranscriptionService, "diarize")
+    @mock.patch.object(TranscriptionService, "iter_transcribe")
+    def test_words_are_labelled_and_stored(self, transcribe, diarize):
+        words = [
+            {"word": " Hi", "start": 0.0, "end": 0.4},
+            {"word": " there.", "start": 1.2, "end": 1.8},
+        ]
+        transcribe.return_value = iter(
+            [[{"text": " Hi there.", "start": 0.0, "end": 1.8, "words": words}]]
+        )
+        diarize.return_value = [(0.0, 1.0, "SPEAKER_00"), (1.0, 2.0, "SPEAKER_01")]
+
+        process_audio_file.delay(self.audio_file.id)
+
+        self.audio_file.refresh_from_db()
+        [segment] = self.audio_file.transcript_document()["segments"]
+        self.assertEqual(
+            [(w["word"], w["speaker"]) for w in segment["words"]],
+            [(" Hi", "SPEAKER_00"), (" there.", "SPEAKER_01")],
+        )
+
+    @mock.patch.object(TranscriptionService, "diarize", return_value=[])
+    @mock.patch.object(
+        TranscriptionService,
+        "iter_transcribe",
+        side_effect=lambda audio, speech=None: iter(
+            [[{"text": " Hi.", "start": 0, "end": 1}]]
+        ),
+    )
+    def test_stage_metrics_are_recorded(self, transcribe, diarize):
+        AudioFile.objects.filter(id=self.audio_file.id).update(profile=True)
+        process_audio_file.delay(self.audio_file.id)
+
+        metrics = {m.stage: m for m in self.audio_file.stage_metrics.all()}
+        self.assertEqual(
+            set(metrics), {"decode", "transcribe", "diarize", "merge", "export"}
+        )
+        for metric in metrics.values():
+            self.assertEqual(metric.status, "succeeded")
+            self.assertEqual(metric.audio_seconds, 2.0)
+            self.assertGreater(metric.peak_rss_bytes, 0)
+            self.assertEqual(metric.real_time_factor, metric.wall_seconds / 2.0)
+            self.assertTrue(
+                os.path.exists(os.path.join(self.media_root, metric.profile))
+            )
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        staff = CustomUser.objects.create_user(
+            username="admin", email="admin@example.com", is_staff=True
+        )
+        self.client.force_login(staff)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.client.logout()
+        self.assertIn(
+            'transcription_stage_runs{stage="decode",status="succeeded"} 1.0',
+            response.content.decode(),
+        )
+        with override_settings(TRANSCRIPTION_METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+            response = self.client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_overlapping_stages_are_marked_shared(self):
+        with measure_stage(self.audio_file.id, "transcribe"):
+            with measure_stage(self.audio_file.id, "diarize"):
+                pass
+        with measure_stage(self.audio_file.id, "export"):
+            pass
+        self.assertEqual(
+            dict(self.audio_file.stage_metrics.values_list("stage", "shared_process")),
+            {"transcribe": True, "diarize": True, "export": False},
+        )
+
+    @mock.patch.object(TranscriptionService, "diarize", return_value=[])
+    @mock.patch.object(
+        TranscriptionService,
+        "iter_transcribe",
+        side_effect=lambda audio, speech=None: iter([]),
+    )
+    def test_failed_stage_marks_audio_file_failed(self, transcribe, diarize):
+        process_audio_file.delay(self.audio_file.id)
+
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.status, "failed")
+        self.assertFalse(JobWorkspace(self.audio_file.id).root.exists())
+        self.assertTrue(
+            JobStageMetric.objects.filter(stage="transcribe", status="failed").exists()
+        )
+
+    def test_stages_are_routed_to_their_queues(self):
+        for stage in ("decode", "transcribe", "diarize", "merge", "export"):
+            route = celery_app.amqp.router.route(
+                {}, f"transcription_app.tasks.{stage}_stage"
+            )
+            self.assertEqual(route["queue"].name, stage)
+
+
+@override_settings(
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        "progress": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    },
+    TRANSCRIPTION_PROGRESS_REDIS_URL=None,
+    TRANSCRIPTION_PROGRESS_POLL_SECONDS=0.01,
+)
+class ProgressTest(TestCase):
+    def setUp(self):
+        channel = mock.patch.object(progress, "_channel", None)
+        channel.start()
+        self.addCleanup(channel.stop)
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.audio_file = AudioFile.objects.create(
+            user=self.user, file="uploads/call.wav", status="processing"
+        )
+        self.url = reverse("audiofile-events", args=[self.audio_file.id])
+
+    def test_only_stage_boundaries_are_written(self):
+        report = ProgressReporter(self.audio_file.id)
+        with self.assertNumQueries(1):
+            report("transcribe", 0)
+        with self.assertNumQueries(0):
+            report("transcribe", 40)
+        with self.assertNumQueries(1):
+            report("transcribe", 100)
+
+        self.audio_file.refresh_from_db()
+        self.assertEqual(self.audio_file.stage, "transcribe")
+        self.assertEqual(self.audio_file.progress, 100)
+
+    async def test_events_stream_until_job_finishes(self):
+        publish(self.audio_file.id, {"status": "processing", "stage": "diarize"})
+        publish(self.audio_file.id, {"status": "completed"})
+        token = AccessToken.for_user(self.user)
+
+        response = await AsyncClient().get(self.url, {"token": str(token)})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        events = [
+            json.loads(line[len(b"data: ") :])
+            for line in body.splitlines()
+            if line.startswith(b"data: ")
+        ]
+        self.assertEqual(
+            [event["status"] for event in events], ["processing", "completed"]
+        )
+
+    async def test_events_require_token(self):
+        response = await AsyncClient().get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(TRANSCRIPTION_PROGRESS_KEEPALIVE_SECONDS=0.2)
+    async def test_redis_keepalive_waits_for_an_idle_interval(self):
+        message = {"data": json.dumps({"status": "processing"})}
+        # A message, then a control message that get_message returns as None
+        replies = [message, None]
+        timeouts = []
+
+        async def get_message(ignore_subscribe_messages, timeout):
+            timeouts.append(timeout)
+            if replies:
+                return replies.pop(0)
+            await asyncio.sleep(timeout)
+            return None
+
+        pubsub = mock.Mock(subscribe=mock.AsyncMock(), aclose=mock.AsyncMock())
+        pubsub.get_message = get_message
+        client = mock.Mock(
+            get=mock.AsyncMock(return_value=None),
+            aclose=mock.AsyncMock(),
+            pubsub=mock.Mock(return_value=pubsub),
+        )
+        fake = types.SimpleNamespace(Redis=mock.Mock(from_url=lambda url: client))
+        with mock.patch.object(progress, "aioredis", fake, create=True):
+            # Skip __init__, which needs the synchronous redis client
+            channel = progress.RedisChannel.__new__(progress.RedisChannel)
+            channel.url = "redis://"
+            stream = channel.subscribe(self.audio_file.id)
+            self.assertEqual(await anext(stream), {"status": "processing"})
+            started = time.monotonic()
+            self.assertIsNone(await anext(stream))
+            await stream.aclose()
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+        self.assertEqual(len(timeouts), 3)
+
+
+class PartialTranscriptTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.audio_file = AudioFile.objects.create(
+            user=self.user, file="uploads/call.wav", status="processing"
+        )
+        self.workspace = JobWorkspace(self.audio_file.id)
+        self.workspace.append_segments(
+            [
+                {"start": 0.0, "end": 2.0, "text": " Hi."},
+                {"start": 2.0, "end": 4.0, "text": " Hello."},
+            ]
+        )
+        self.url = reverse("audiofile-partial", args=[self.audio_file.id])
+
+    def read(self, response):
+        return [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+
+    def test_segments_are_available_before_diarization(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Transcript-Complete"], "false")
+        self.assertEqual(response["X-Diarized"], "false")
+        segments = self.read(response)
+        self.assertEqual([s["text"] for s in segments], [" Hi.", " Hello."])
+        self.assertEqual({s["speaker"] for s in segments}, {"UNKNOWN"})
+
+        response = self.client.get(self.url, {"after": 1})
+        self.assertEqual([s["id"] for s in self.read(response)], [1])
+        self.assertEqual(response["X-Next-Segment"], "2")
+
+    def test_speakers_are_filled_in_after_diarization(self):
+        self.workspace.save(
+            "turns", [[0.0, 2.0, "SPEAKER_00"], [2.0, 4.0, "SPEAKER_01"]]
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Diarized"], "true")
+        self.assertEqual(
+            [s["speaker"] for s in self.read(response)], ["SPEAKER_00", "SPEAKER_01"]
+        )
+
+    def test_completed_job_serves_stored_transcript(self):
+        self.workspace.cleanup()
+        AudioFile.objects.filter(id=self.audio_file.id).update(
+            status="completed",
+            processed=True,
+            transcription_json={
+                "transcription": " Hi.",
+                "segments": [
+                    {"text": " Hi.", "speaker": "SPEAKER_00", "start": 0, "end": 2}
+                ],
+            },
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Transcript-Complete"], "true")
+        self.assertEqual(self.read(response)[0]["speaker"], "SPEAKER_00")
+
+    @mock.patch("transcription_app.transcription_service.iter_transcribe_chunked")
+    @mock.patch.object(TranscriptionService, "_transcribe_whole", return_value=[])
+    def test_standard_mode_is_windowed_only_when_enabled(self, whole, chunked):
+        chunked.return_value = iter([])
+        audio = np.random.default_rng(0).normal(0, 0.1, SAMPLE_RATE * 90)
+        service = TranscriptionService("window")
+        with override_settings(TRANSCRIPTION_VAD_ENABLED=False):
+            list(service.iter_transcribe(audio.astype(np.float32)))
+            whole.assert_called_once()
+            chunked.assert_not_called()
+
+            with override_settings(TRANSCRIPTION_PARTIAL_WINDOW_SECONDS=60):
+                list(service.iter_transcribe(audio.astype(np.float32)))
+            self.assertEqual(chunked.call_args.kwargs["chunk_seconds"], 60)
+            whole.assert_called_once()
+
+
+class StreamSegmenterTest(SimpleTestCase):
+    def tone(self, seconds):
+        t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+        return (np.sin(2 * np.pi * 220 * t) * 0.3).astype(np.float32)
+
+    def test_utterances_are_cut_at_pauses(self):
+        segmenter = StreamSegmenter(0.01, silence_seconds=0.5, max_seconds=15)
+        stream = np.concatenate(
+            [np.zeros(SAMPLE_RATE), self.tone(2), np.zeros(SAMPLE_RATE), self.tone(1)]
+        )
+        windows = []
+        for offset in range(0, len(stream), 4000):
+            windows += segmenter.feed(stream[offset : offset + 4000])
+
+        self.assertEqual(len(windows), 1)
+        start, audio = windows[0]
+        # Leading silence is dropped but for a short lead-in
+        self.assertAlmostEqual(start / SAMPLE_RATE, 0.7, places=1)
+        self.assertAlmostEqual((start + len(audio)) / SAMPLE_RATE, 3.5, places=1)
+        self.assertIsNotNone(segmenter.pending)
+        start, audio = segmenter.flush()
+        self.assertAlmostEqual(start / SAMPLE_RATE, 3.7, places=1)
+        self.assertIsNone(segmenter.pending)
+
+    def test_long_speech_is_cut_at_max_window(self):
+        segmenter = StreamSegmenter(0.01, silence_seconds=0.5, max_seconds=5)
+        windows = segmenter.feed(self.tone(12))
+        self.assertGreaterEqual(len(windows), 2)
+        for _, audio in windows:
+            self.assertTrue(2.5 * SAMPLE_RATE <= len(audio) <= 5 * SAMPLE_RATE)
+
+
+class OnlineSpeakerClusteringTest(SimpleTestCase):
+    def test_similar_embeddings_share_a_speaker(self):
+        rng = np.random.default_rng(0)
+        alice, bob = rng.normal(size=(2, 64))
+        clustering = OnlineSpeakerClustering(threshold=0.7)
+        labels = [
+            clustering.assign(voice + rng.normal(scale=0.2, size=64))
+            for voice in (alice, bob, alice, bob, alice)
+        ]
+        self.assertEqual(
+            labels,
+            ["SPEAKER_00", "SPEAKER_01", "SPEAKER_00", "SPEAKER_01", "SPEAKER_00"],
+        )
+
+
+class FakeTranscriptionSession(RealtimeSession):
+    async def transcribe(self, audio):
+        return f" {len(audio) // SAMPLE_RATE} seconds."
+
+    async def speaker(self, audio):
+        return "SPEAKER_00"
+
+
+@override_settings(TRANSCRIPTION_REALTIME_PARTIAL_SECONDS=0.5)
+class RealtimeWebSocketTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.token = str(AccessToken.for_user(self.user))
+
+    async def connect(self, messages, query):
+        incoming = iter(messages)
+        sent = []
+
+        async def receive():
+            # Let decode tasks run between frames, as network waits would
+            await asyncio.sleep(0)
+            return next(incoming)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "websocket",
+            "path": "/ws/transcribe/",
+            "query_string": query.encode(),
+            "headers": [],
+        }
+        with mock.patch(
+            "transcription_app.realtime.RealtimeSession", FakeTranscriptionSession
+        ):
+            await websocket_application(scope, receive, send)
+        return sent
+
+    async def test_stream_is_transcribed_and_saved(self):
+        t = np.arange(SAMPLE_RATE * 2) / SAMPLE_RATE
+        speech = (np.sin(2 * np.pi * 220 * t) * 0.3 * 32767).astype("<i2")
+        pcm = np.concatenate([speech, np.zeros(SAMPLE_RATE, "<i2"), speech])
+        frames = [
+            {"type": "websocket.receive", "bytes": pcm[i : i + 3200].tobytes()}
+            for i in range(0, len(pcm), 3200)
+        ]
+        sent = await self.connect(
+            [{"type": "websocket.connect"}]
+            + frames
+            + [{"type": "websocket.receive", "text": '{"type": "stop"}'}],
+            f"token={self.token}",
+        )
+
+        self.assertEqual(sent[0], {"type": "websocket.accept"})
+        messages = [json.loads(m["text"]) for m in sent if m.get("text")]
+        finals = [m["segment"] for m in messages if m["type"] == "final"]
+        self.assertEqual(len(finals), 2)
+        self.assertIn("partial", {m["type"] for m in messages})
+        self.assertEqual(messages[-1]["type"], "completed")
+        self.assertEqual(sent[-1], {"type": "websocket.close", "code": 1000})
+
+        audio_file = await AudioFile.objects.aget(id=messages[-1]["audio_file"])
+        self.assertEqual(audio_file.status, "completed")
+        self.assertEqual(audio_file.get_transcript()[1].speaker(1), "SPEAKER_00")
+        with wave.open(audio_file.file.path) as wav:
+            self.assertEqual(wav.getnframes(), len(pcm))
+
+    async def test_unauthenticated_stream_is_rejected(self):
+        sent = await self.connect([{"type": "websocket.connect"}], "token=nope")
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4401}])
+
+    @override_settings(TRANSCRIPTION_REALTIME_MAX_STREAMS_PER_USER=1)
+    async def test_streams_per_user_are_capped(self):
+        messages = [
+            {"type": "websocket.connect"},
+            {"type": "websocket.receive", "text": '{"type": "stop"}'},
+        ]
+        with mock.patch.dict(realtime._streams, {self.user.id: 1}):
+            sent = await self.connect(messages, f"token={self.token}")
+        self.assertEqual(sent, [{"type": "websocket.close", "code": 4429}])
+
+        sent = await self.connect(messages, f"token={self.token}")
+        self.assertEqual(sent[-1], {"type": "websocket.close", "code": 1000})
+        self.assertEqual(realtime._streams, {})
+
+    @override_settings(TRANSCRIPTION_REALTIME_ON_WORKERS=True)
+    async def test_windows_are_decoded_on_workers(self):
+        audio = np.linspace(-1, 1, SAMPLE_RATE, dtype=np.float32)
+
+        def delay(window):
+            decoded = realtime.decode_window(window)
+            np.testing.assert_allclose(decoded, audio, atol=1e-4)
+            return types.SimpleNamespace(get=lambda timeout: " Hello.")
+
+        session = RealtimeSession(self.user, send=None)
+        self.addCleanup(session.abort)
+        with mock.patch(
+            "transcription_app.tasks.realtime_transcribe.delay", side_effect=delay
+        ) as task, mock.patch.object(realtime, "get_batch_scheduler") as local:
+            self.assertEqual(await session.transcribe(audio), " Hello.")
+        task.assert_called_once()
+        local.assert_not_called()
+
+
+class DiarizationCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.service = TranscriptionService("1")
+
+    def test_turns_and_embeddings_round_trip_memory_mapped(self):
+        turns = [(0.0, 1.5, "SPEAKER_01"), (1.5, 3.0, "SPEAKER_00")]
+        embeddings = np.eye(2, 4, dtype=np.float32)
+        diarization_cache.store(
+            "ab" * 32, turns, embeddings, labels=["SPEAKER_00", "SPEAKER_01"]
+        )
+
+        result = diarization_cache.load("ab" * 32)
+        self.assertIsInstance(result.turns, np.memmap)
+        self.assertIsInstance(result.embeddings, np.memmap)
+        self.assertEqual(result.turn_list(), turns)
+        np.testing.assert_array_equal(result.embeddings, embeddings)
+        self.assertIsNone(diarization_cache.load("cd" * 32))
+
+    def test_cache_is_keyed_by_vad_settings(self):
+        diarization_cache.store("ab" * 32, [(0.0, 1.5, "SPEAKER_00")])
+        with override_settings(TRANSCRIPTION_VAD_PADDING_SECONDS=1.0):
+            self.assertIsNone(diarization_cache.load("ab" * 32))
+        with override_settings(TRANSCRIPTION_VAD_ENABLED=False):
+            self.assertIsNone(diarization_cache.load("ab" * 32))
+        self.assertIsNotNone(diarization_cache.load("ab" * 32))
+
+    def test_cached_recording_skips_pipeline(self):
+        annotation = Annotation()
+        annotation[Segment(0, 2)] = "SPEAKER_00"
+        annotation[Segment(2, 3)] = "SPEAKER_01"
+        pipeline = mock.Mock(return_value=(annotation, np.ones((2, 4))))
+        audio = (
+            np.random.default_rng(0).normal(0, 0.1, SAMPLE_RATE * 3).astype(np.float32)
+        )
+
+        with mock.patch.object(
+            TranscriptionService, "pipeline", new_callable=mock.PropertyMock
+        ) as pipeline_property:
+            pipeline_property.return_value = pipeline
+            first = self.service.diarize(audio, content_hash="ef" * 32)
+            second = self.service.diarize(audio, content_hash="ef" * 32)
+
+        self.assertEqual(pipeline.call_count, 1)
+        self.assertEqual(first, second)
+        self.assertEqual(diarization_cache.load("ef" * 32).embeddings.shape, (2, 4))
+
+
+class SpeakerIndexTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.voices = np.eye(2, 8, dtype=np.float32)
+        diarization_cache.store(
+            "ab" * 32,
+            [(0.0, 1.0, "SPEAKER_00"), (1.0, 2.0, "SPEAKER_01")],
+            self.voices,
+            labels=["SPEAKER_00", "SPEAKER_01"],
+        )
+        self.audio_file = AudioFile.objects.create(
+            user=self.user,
+            file="uploads/meeting.wav",
+            processed=True,
+            status="completed",
+            content_hash="ab" * 32,
+            transcription_json={
+                "transcription": " Hi. Hello.",
+                "segments": [
+                    {"text": " Hi.", "speaker": "SPEAKER_00", "start": 0, "end": 1},
+                    {"text": " Hello.", "speaker": "SPEAKER_01", "start": 1, "end": 2},
+                ],
+            },
+        )
+
+    def test_inverted_file_search_matches_exhaustive_search(self):
+        rng = np.random.default_rng(0)
+        centres = rng.standard_normal((50, 32))
+        labels = np.repeat(np.arange(50), 40)
+        embeddings = centres[labels] + 0.3 * rng.standard_normal((len(labels), 32))
+        queries = centres + 0.3 * rng.standard_normal(centres.shape)
+
+        index = SpeakerIndex(embeddings, labels, nprobe=4, ivf_min_size=100)
+        exhaustive = SpeakerIndex(embeddings, labels)
+        self.assertIsNotNone(index.centroids)
+        self.assertIsNone(exhaustive.centroids)
+
+        found, scores = index.search(queries)
+        expected, expected_scores = exhaustive.search(queries)
+        self.assertEqual(list(found), list(range(50)))
+        self.assertEqual(list(found), list(expected))
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-5)
+
+    def test_enrolled_speaker_is_named_in_later_recordings(self):
+        response = self.client.post(
+            reverse("audiofile-speakers", args=[self.audio_file.id]),
+            {"speaker": "SPEAKER_01", "name": "Alice"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["embedding_count"], 1)
+        self.audio_file.refresh_from_db()
+        speakers = [s["speaker"] for s in self.audio_file.get_transcript()[1]]
+        self.assertEqual(speakers, ["SPEAKER_00", "Alice"])
+
+        # Alice is SPEAKER_00 in the next recording; the stranger stays unnamed
+        diarization_cache.store(
+            "cd" * 32,
+            [(0.0, 1.0, "SPEAKER_00"), (1.0, 2.0, "SPEAKER_01")],
+            np.array([self.voices[1] + 0.1, -self.voices[1]]),
+            labels=["SPEAKER_00", "SPEAKER_01"],
+        )
+        later = AudioFile(user=self.user, content_hash="cd" * 32)
+        segments = SegmentStore.from_segments(
+            [
+                {"text": "", "speaker": "SPEAKER_00", "start": 0, "end": 1},
+                {"text": "", "speaker": "SPEAKER_01", "start": 1, "end": 2},
+            ]
+        )
+        named = name_speakers(later, segments)
+        self.assertEqual([s["speaker"] for s in named], ["Alice", "SPEAKER_01"])
+        self.assertEqual(segments.speaker(0), "SPEAKER_00")
+
+        response = self.client.get(reverse("speaker-list"))
+        self.assertEqual([p["name"] for p in response.data], ["Alice"])
+
+    def test_exports_use_the_enrolled_name(self):
+        download = reverse("audiofile-download", args=[self.audio_file.id])
+        response = self.client.get(download, {"format": "srt"})
+        self.assertIn(b"SPEAKER_01", b"".join(response.streaming_content))
+
+        self.client.post(
+            reverse("audiofile-speakers", args=[self.audio_file.id]),
+            {"speaker": "SPEAKER_01", "name": "Alice"},
+            format="json",
+        )
+        response = self.client.get(download, {"format": "srt"})
+        body = b"".join(response.streaming_content)
+        self.assertIn(b"Alice", body)
+        self.assertNotIn(b"SPEAKER_01", body)
+
+    def test_unknown_speaker_cannot_be_enrolled(self):
+        response = self.client.post(
+            reverse("audiofile-speakers", args=[self.audio_file.id]),
+            {"speaker": "SPEAKER_07", "name": "Bob"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TranscriptSearchTest(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="testuser", email="test@example.com", password="pw123456789"
+        )
+        self.other = CustomUser.objects.create_user(
+            username="other", email="other@example.com", password="pw123456789"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.meeting = self.create_file(
+            self.user,
+            [
+                ("SPEAKER_00", "Let's review the budget."),
+                ("SPEAKER_01", "The budget for next year looks fine."),
+                ("SPEAKER_00", "Next, the hiring plan."),
+            ],
+        )
+        self.create_file(self.other, [("SPEAKER_00", "My budget is private.")])
+
+    def create_file(self, user, lines):
+        segments = [
+            {
+                "text": f" {text}",
+                "speaker": speaker,
+                "start": i * 2.0,
+                "end": i * 2.0 + 2,
+            }
+            for i, (speaker, text) in enumerate(lines)
+        ]
+        return AudioFile.objects.create(
+            user=user,
+            file="uploads/meeting.wav",
+            processed=True,
+            status="completed",
+            transcription_json={"transcription": "", "segments": segments},
+        )
+
+    def query(self, q):
+        response = self.client.get(reverse("transcript_search"), {"q": q})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["results"]
+
+    def assert_search_works(self):
+        call_command("reindex_transcripts", stdout=io.StringIO())
+
+        hits = self.query("budget")
+        self.assertEqual({hit["audio_file"] for hit in hits}, {self.meeting.id})
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(
+            {
+                (hit["segment"], hit["speaker"], hit["start"], hit["end"])
+                for hit in hits
+            },
+            {(0, "SPEAKER_00", 0.0, 2.0), (1, "SPEAKER_01", 2.0, 4.0)},
+        )
+        self.assertEqual([hit["segment"] for hit in self.query("next budget")], [1])
+        self.assertEqual([hit["segment"] for hit in self.query('"next year"')], [1])
+        self.assertEqual(self.query('"year next"'), [])
+
+        self.meeting.delete()
+        self.assertEqual(self.query("budget"), [])
+
+    def test_fts5_search(self):
+        self.assertEqual(search.backend(), "fts5")
+        self.assert_search_works()
+
+    @override_settings(TRANSCRIPTION_SEARCH_BACKEND="inverted")
+    def test_inverted_index_search(self):
+        self.assert_search_works()
+
+    def test_query_is_required(self):
+        response = self.client.get(reverse("transcript_search"))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SegmentStoreTest(SimpleTestCase):
+    segments = [
+        {"text": " Hello there.", "speaker": "SPEAKER_01", "start": 0.0, "end": 1.5},
+        {"text": " Grüße!", "speaker": "SPEAKER_00", "start": 1.5, "end": 2.25},
+        {"text": " Bye.", "speaker": "SPEAKER_01", "start": 2.25, "end": 3.0},
+    ]
+
+    def test_round_trips_through_bytes(self):
+        data = SegmentStore.from_segments(self.segments).to_bytes()
+        store = SegmentStore.from_bytes(data)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(list(store), self.segments)
+        self.assertEqual(store[-1], self.segments[-1])
+        self.assertEqual(store[1:], self.segments[1:])
+        self.assertEqual(store.speakers, ["SPEAKER_01", "SPEAKER_00"])
+        self.assertLess(len(data), len(json.dumps(self.segments, indent=2)))
+
+    def test_words_round_trip_through_bytes(self):
+        segments = [
+            {
+                **self.segments[0],
+                "words": [
+                    {"word": " Hello", "start": 0.0, "end": 0.5, "speaker": "A"},
+                    {"word": " there.", "start": 0.5, "end": 1.5, "speaker": "B"},
+                ],
+            },
+            {**self.segments[1], "words": []},
+            {
+                **self.segments[2],
+                "words": [{"word": " Bye.", "start": 2.25, "end": 3.0}],
+            },
+        ]
+        data = SegmentStore.from_segments(segments).to_bytes()
+        store = SegmentStore.from_bytes(data)
+        segments[2]["words"][0]["speaker"] = "UNKNOWN"
+        self.assertEqual(list(store), segments)
+        renamed = store.renamed({"B": "Bob"})
+        self.assertEqual([w["speaker"] for w in renamed[0]["words"]], ["A", "Bob"])
+
+    def test_renaming_shares_columns(self):
+        store = SegmentStore.from_segments(self.segments)
+        renamed = store.renamed({"SPEAKER_01": "Alice"})
+        self.assertIs(renamed.starts, store.starts)
+        self.assertEqual(
+            [s["speaker"] for s in renamed], ["Alice", "SPEAKER_00", "Alice"]
+        )
+        self.assertEqual(store.speaker(0), "SPEAKER_01")
+
+    def test_whisper_extras_are_dropped(self):
+        segment = dict(
+            self.segments[0],
+            id=0,
+            tokens=[1, 2, 3],
+            avg_logprob=-0.2,
+            words=[{"word": " Hello", "start": 0.0, "end": 0.5, "probability": 0.9}],
+        )
+        self.assertEqual(
+            slim_segments([segment]),
+            [
+                dict(
+                    self.segments[0],
+                    words=[{"word": " Hello", "start": 0.0, "end": 0.5}],
+                )
+            ],
+        )
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg is not installed")
+class BenchmarkPipelineTest(SimpleTestCase):
+    def setUp(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        self.output = os.path.join(output_dir, "results.json")
+
+    def run_benchmark(self, **options):
+        call_command(
+            "benchmark_pipeline",
+            duration=65,
+            repeat=1,
+            skip_api=True,
+            output=self.output,
+            stdout=io.StringIO(),
+            stderr=io.StringIO(),
+            **options,
+        )
+        with open(self.output) as f:
+            return json.load(f)
+
+    def test_stages_are_measured_and_compared(self):
+        report = self.run_benchmark()
+        self.assertEqual(
+            set(report["results"]),
+            {
+                f"stage.{s}"
+                for s in ("decode", "vad", "transcribe", "diarize", "merge", "export")
+            },
+        )
+        self.assertGreater(report["results"]["stage.decode"]["median_seconds"], 0)
+
+        baseline = os.path.join(os.path.dirname(self.output), "baseline.json")
+        for result in report["results"].values():
+            result["median_seconds"] = 1e-6
+        with open(baseline, "w") as f:
+            json.dump(report, f)
+        with self.assertRaises(CommandError):
+            self.run_benchmark(baseline=baseline, min_delta_ms=0)
+
+    def test_small_slowdowns_are_not_regressions(self):
+        baseline = {"results": {"api.list": {"metric": "p95_ms", "p95_ms": 2.0}}}
+        current = {"results": {"api.list": {"metric": "p95_ms", "p95_ms": 4.0}}}
+        self.assertEqual(compare_results(baseline, current, 0.25, 0.005), [])
+        self.assertEqual(
+            compare_results(baseline, current, 0.25, 0.001),
+            [("api.list", 2.0, 4.0)],
+        )
+
+
+class AsrBackendTest(SimpleTestCase):
+    def test_config_defaults_and_parsing(self):
+        config = AsrConfig.parse("whisper:small")
+        self.assertEqual(config.model_size, "small")
+        self.assertEqual(config.compute_type, "float32")
+        self.assertTrue(config.batchable)
+        self.assertEqual(config.decode_options(), {})
+
+        config = AsrConfig.parse("whisper:base:int8")
+        config.beam_size = 5
+        self.assertFalse(config.batchable)
+        self.assertEqual(config.decode_options(), {"beam_size": 5})
+        with self.assertRaises(ValueError):
+            AsrConfig(backend="nope").validate()
+
+    def test_int8_quantization_keeps_outputs_close(self):
+        import torch
+
+        torch.manual_seed(0)
+        model = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.GELU())
+        quantized = quantize_dynamic_int8(model)
+        self.assertIsInstance(quantized[0], torch.ao.nn.quantized.dynamic.Linear)
+        inputs = torch.randn(8, 64)
+        self.assertLess((quantized(inputs) - model(inputs)).abs().max(), 0.05)
+
+    def test_word_error_rate(self):
+        self.assertEqual(word_error_rate(["The cat sat."], ["the cat sat"]), 0)
+        self.assertEqual(word_error_rate(["the cat sat"], ["the bat sat down"]), 2 / 3)
+
+    def test_benchmark_reports_wer_and_speed(self):
+        corpus = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, corpus)
+        synthetic_wav(os.path.join(corpus, "meeting.wav"), 4)
+        stub_text = StubWhisperModel().transcribe(np.zeros(4 * SAMPLE_RATE))["text"]
+        Path(corpus, "meeting.txt").write_text(stub_text)
+        get_registry().get(
+            AsrConfig.parse("whisper:asr-stub").model_key(), StubWhisperModel
+        )
+        output = os.path.join(corpus, "results.json")
+
+        call_command(
+            "benchmark_asr",
+            corpus=corpus,
+            configs=["whisper:asr-stub"],
+            output=output,
+            stdout=io.StringIO(),
+        )
+        with open(output) as f:
+            result = json.load(f)["results"]["whisper:asr-stub:float32"]
+        self.assertEqual(result["wer"], 0)
+        self.assertGreater(result["real_time_factor"], 0)
+
+        with self.assertRaises(CommandError):
+            call_command("benchmark_asr", corpus=os.path.join(corpus, "missing"))
+
+
+class VoiceActivityTest(SimpleTestCase):
+    def speech_with_pauses(self):
+        """1s of silence, 2s of speech-like noise, 3s of silence, 2s of noise."""
+        rng = np.random.default_rng(0)
+        audio = rng.normal(0, 0.001, SAMPLE_RATE * 8).astype(np.float32)
+        for start in (1, 6):
+            audio[start * SAMPLE_RATE : (start + 2) * SAMPLE_RATE] += rng.normal(
+                0, 0.1, SAMPLE_RATE * 2
+            )
+        return audio
+
+    def test_speech_regions_are_padded(self):
+        regions = detect_speech(self.speech_with_pauses(), padding_seconds=0.3)
+        np.testing.assert_allclose(
+            regions / SAMPLE_RATE, [[0.69, 3.3], [5.7, 8.0]], atol=0.03
+        )
+        self.assertEqual(len(detect_speech(np.zeros(SAMPLE_RATE))), 0)
+
+    def test_compacted_times_map_back(self):
+        audio = self.speech_with_pauses()
+        speech = SpeechMap.from_audio(audio, padding_seconds=0)
+        compacted = speech.compact(audio)
+        self.assertEqual(len(compacted), speech.speech_samples)
+        self.assertAlmostEqual(speech.speech_ratio, 0.5, delta=0.02)
+
+        segments = speech.remap_segments(
+            [
+                {"text": " One.", "start": 0.5, "end": 2.0},
+                {"text": " Two.", "start": 2.1, "end": 3.5},
+            ]
+        )
+        self.assertAlmostEqual(segments[0]["start"], 1.5, delta=0.03)
+        self.assertAlmostEqual(segments[0]["end"], 3.0, delta=0.03)
+        self.assertAlmostEqual(segments[1]["start"], 6.1, delta=0.03)
+        self.assertAlmostEqual(segments[1]["end"], 7.5, delta=0.03)
+        self.assertEqual(
+            SpeechMap.from_json(speech.to_json()).to_original(3.5),
+            speech.to_original(3.5),
+        )
+
+    def test_mostly_speech_is_not_cut(self):
+        audio = np.random.default_rng(0).normal(0, 0.1, SAMPLE_RATE * 4)
+        speech = SpeechMap.from_audio(audio.astype(np.float32), min_silence_ratio=0.05)
+        self.assertTrue(speech.is_everything)
+        self.assertIs(speech.compact(audio), audio)
+
+    @mock.patch.object(TranscriptionService, "_transcribe_whole")
+    def test_only_speech_is_transcribed(self, transcribe):
+        transcribe.return_value = [{"text": " Two.", "start": 2.5, "end": 3.0}]
+        service = TranscriptionService("vad")
+        with override_settings(
+            TRANSCRIPTION_BATCHING_ENABLED=False, TRANSCRIPTION_VAD_PADDING_SECONDS=0
+        ):
+            segments = list(service.iter_transcribe(self.speech_with_pauses()))
+
+        self.assertAlmostEqual(
+            len(transcribe.call_args[0][0]) / SAMPLE_RATE, 4, delta=0.1
+        )
+        self.assertAlmostEqual(segments[0][0]["start"], 6.5, delta=0.03)
+
+
+@override_settings(TRANSCRIPTION_MAX_ACTIVE_JOBS=2)
+@mock.patch("transcription_app.tasks.estimate_job", mock.Mock())
+@mock.patch("transcription_app.tasks.process_audio_file")
+class SchedulerTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.bulk = CustomUser.objects.create_user(
+            username="bulk", email="bulk@example.com", password="pw123456789"
+        )
+        self.other = CustomUser.objects.create_user(
+            username="other", email="other@example.com", password="pw123456789"
+        )
+
+    def submit(self, user, count=1):
+        audio_files = [
+            AudioFile.objects.create(user=user, file=f"uploads/{user}-{i}.wav")
+            for i in range(count)
+        ]
+        for audio_file in audio_files:
+            scheduler.enqueue(audio_file)
+        return audio_files
+
+    def started(self, task):
+        return [call.args[0] for call in task.delay.call_args_list]
+
+    def test_bulk_upload_does_not_starve_other_users(self, task):
+        bulk_files = self.submit(self.bulk, 5)
+        self.assertEqual(self.started(task), [f.id for f in bulk_files[:2]])
+        (other_file,) = self.submit(self.other)
+        self.assertEqual(task.delay.call_count, 2)
+
+        scheduler.release(bulk_files[0].id)
+        self.assertEqual(self.started(task)[-1], other_file.id)
+        AudioFile.objects.filter(id=bulk_files[1].id).update(status="failed")
+        scheduler.dispatch()
+        self.assertEqual(self.started(task)[-1], bulk_files[2].id)
+        stats = scheduler.queue_stats()["free"]
+        self.assertEqual((stats["queued"], stats["dispatched"]), (2, 4))
+        self.assertGreaterEqual(stats["wait_seconds"], 0)
+
+    def test_waiting_job_is_estimated_and_prioritised(self, task):
+        self.submit(self.bulk, 2)
+        (audio_file,) = self.submit(self.bulk)
+        os.makedirs(os.path.join(self.media_root, "uploads"))
+        with wave.open(audio_file.file.path, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            wav.writeframes(np.zeros(SAMPLE_RATE * 3, dtype="<i2").tobytes())
+
+        scheduler.estimate(audio_file.id)
+        entry = JobQueueEntry.objects.get(audio_file=audio_file)
+        self.assertEqual(entry.audio_seconds, 3.0)
+        self.assertEqual(entry.priority, 5)
+        self.assertEqual(entry.estimated_seconds, 3.0 * scheduler.real_time_factor())
+
+    def test_caps_follow_the_users_current_tier(self, task):
+        self.submit(self.bulk, 2)
+        self.bulk.tier = "paid"
+        self.bulk.save()
+        self.submit(self.bulk, 2)
+        with override_settings(TRANSCRIPTION_MAX_ACTIVE_JOBS=4):
+            scheduler.dispatch()
+        # Free and paid entries of one user share the paid cap of 4
+        self.assertEqual(task.delay.call_count, 4)
+
+    @override_settings(TRANSCRIPTION_MAX_ACTIVE_JOBS=4)
+    def test_tier_caps_and_weights(self, task):
+        self.submit(self.bulk, 3)
+        self.assertEqual(task.delay.call_count, 2)
+
+        self.other.tier = "paid"
+        self.other.save()
+        paid_files = self.submit(self.other, 3)
+        # The free user is at its cap, so the paid user gets the last slots
+        self.assertEqual(self.started(task)[2:], [f.id for f in paid_files[:2]])
+
+    def test_retrying_job_keeps_its_slot(self, task):
+        conf = celery_app.conf
+        self.addCleanup(conf.update, CELERY_RESULT_BACKEND=conf.result_backend)
+        conf.update(CELERY_RESULT_BACKEND="cache+memory://")
+        (audio_file,) = self.submit(self.bulk)
+        states = []
+
+        def fail(path):
+            # Another job ending in between reaps the slots of failed files
+            scheduler.dispatch()
+            states.append(JobQueueEntry.objects.get(audio_file=audio_file).state)
+            raise OSError("storage unavailable")
+
+        with mock.patch.object(result_cache, "hash_file", side_effect=fail):
+            process_audio_file.apply(args=[audio_file.id])
+        self.assertEqual(states, ["running"] * 4)
+        audio_file.refresh_from_db()
+        self.assertEqual(audio_file.status, "failed")
+        self.assertEqual(JobQueueEntry.objects.get(audio_file=audio_file).state, "done")
+
+    def test_higher_priority_then_shorter_jobs_first(self, task):
+        audio_files = [
+            AudioFile.objects.create(user=self.bulk, file=f"uploads/{i}.wav")
+            for i in range(3)
+        ]
+        for audio_file, priority, estimate in zip(
+            audio_files, (0, 5, 0), (10.0, 900.0, 5.0)
+        ):
+            JobQueueEntry.objects.create(
+                audio_file=audio_file,
+                user=self.bulk,
+                tier="free",
+                priority=priority,
+                estimated_seconds=estimate,
+            )
+        scheduler.dispatch()
+        self.assertEqual(self.started(task), [audio_files[1].id, audio_files[2].id])
+
+    @override_settings(
+        TRANSCRIPTION_MAX_ACTIVE_JOBS=0,
+        TRANSCRIPTION_TIERS={
+            "free": {"weight": 1, "priority": 0, "max_active": 1, "max_queued": 1}
+        },
+    )
+    def test_full_queue_refuses_uploads_and_is_reported(self, task):
+        client = APIClient()
+        client.force_authenticate(self.bulk)
+        for expected in (status.HTTP_201_CREATED, status.HTTP_429_TOO_MANY_REQUESTS):
+            response = client.post(
+                reverse("audiofile-list"),
+                {"file": SimpleUploadedFile("call.wav", b"RIFF fake audio bytes")},
+                format="multipart",
+            )
+            self.assertEqual(response.status_code, expected)
+        task.delay.assert_not_called()
+
+        with override_settings(TRANSCRIPTION_METRICS_TOKEN="secret"):
+            response = client.get(
+                reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret"
+            )
+        metrics = response.content.decode()
+        self.assertIn('transcription_queue_depth{tier="free"} 1.0', metrics)
+        self.assertIn('transcription_queue_running{tier="free"} 0.0', metrics)
@@ -1,22 +1,73 @@
 import os
 import logging
 from pathlib import Path
-from pyannote.audio import Pipeline
-import whisper
-from pydub import AudioSegment
-import shutil
-import json
-import datetime
+import numpy as np
 from django.conf import settings
+from .audio_decoding import (
+    SAMPLE_RATE,
+    AudioDecodingError,
+    decode_audio,
+    to_pyannote_input,
+    write_wav,
+)
+from . import diarization_cache
+from .batch_scheduler import get_batch_scheduler
+from .chunked_transcription import iter_transcribe_chunked
+from .exporters import TranscriptExporter, transcript_document
+from .asr_backends import AsrConfig
+from .model_registry import (
+    get_diarization_pipeline,
+    asr_inference_lock,
+    get_asr_model,
+)
+from .segment_store import slim_segments
+from .speaker_assignment import assign_speakers
+from .vad import SpeechMap
+
+# Share of the diarization stage taken by the pyannote steps that report
+# their own progress
+DIARIZATION_STEPS = {"segmentation": (0, 30), "embeddings": (30, 100)}
 
 
 class TranscriptionService:
-    def __init__(self, session_id):
-        self.auth_token = settings.PYANNOTE_AUTH_TOKEN
+    def __init__(
+        self,
+        session_id,
+        whisper_model_size=None,
+        transcription_mode=None,
+        progress_callback=None,
+        asr=None,
+    ):
         self.session_id = session_id
-        self.pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization-3.1", use_auth_token=self.auth_token
+        self.asr = asr or AsrConfig(model_size=whisper_model_size)
+        self.whisper_model_size = self.asr.model_size
+        self.transcription_mode = transcription_mode or "standard"
+        self.progress_callback = progress_callback
+
+    def report_progress(self, stage, percent):
+        if self.progress_callback:
+            self.progress_callback(stage, percent)
+
+    @property
+    def pipeline(self):
+        return get_diarization_pipeline()
+
+    def load_audio(self, audio_path, mmap_path=None):
+        audio_path = Path(audio_path)
+        if not audio_path.is_file():
+            logging.error(f"Input file does not exist: {audio_path}")
+            return None
+
+        try:
+            audio = decode_audio(audio_path, mmap_path=mmap_path)
+        except AudioDecodingError as e:
+            logging.error(f"Error decoding {audio_path}: {str(e)}")
+            return None
+
+        logging.info(
+            f"Decoded {audio_path} to {len(audio) / SAMPLE_RATE:.1f}s of 16 kHz PCM"
         )
+        return audio
 
     def convert_to_wav(self, audio_path):
         try:
@@ -30,21 +81,11 @@ class TranscriptionService:
                 return audio_path
 
             wav_path = audio_path.with_suffix(".wav")
-            non_wave_files_dir = Path("non_wave_files") / self.session_id
-            non_wave_files_dir.mkdir(parents=True, exist_ok=True)
-
             try:
-                audio = AudioSegment.from_file(audio_path)
-                audio.export(wav_path, format="wav")
+                write_wav(audio_path, wav_path)
                 logging.info(f"Successfully converted {audio_path} to {wav_path}")
-
-                shutil.move(audio_path, non_wave_files_dir / audio_path.name)
-                logging.info(
-                    f"Moved original file to {non_wave_files_dir / audio_path.name}"
-                )
-
                 return wav_path
-            except Exception as e:
+            except AudioDecodingError as e:
                 logging.error(f"Error converting {audio_path} to WAV: {str(e)}")
                 return None
 
@@ -52,152 +93,195 @@ class TranscriptionService:
             logging.error(f"Unexpected error in convert_to_wav: {str(e)}")
             return None
 
-    def transcribe_audio(self, audio_path):
-        model = whisper.load_model("base")
-        result = model.transcribe(str(audio_path), language="en")
-        logging.info(f"Transcribed {audio_path}")
-        return result["text"], result["segments"]
+    def transcribe_audio(self, audio):
+        segments = []
+        for new_segments in self.iter_transcribe(audio):
+            segments.extend(new_segments)
+        text = "".join(segment["text"] for segment in segments)
+        return text, segments
+
+    def speech_map(self, audio):
+        """Speech regions of decoded audio, or None with the VAD disabled."""
+        if not settings.TRANSCRIPTION_VAD_ENABLED or not isinstance(audio, np.ndarray):
+            return None
+        speech = SpeechMap.from_audio(
+            audio,
+            min_silence_ratio=settings.TRANSCRIPTION_VAD_MIN_SILENCE_RATIO,
+            min_silence_seconds=settings.TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS,
+            min_speech_seconds=settings.TRANSCRIPTION_VAD_MIN_SPEECH_SECONDS,
+            padding_seconds=settings.TRANSCRIPTION_VAD_PADDING_SECONDS,
+            min_energy=settings.TRANSCRIPTION_VAD_MIN_ENERGY,
+        )
+        logging.info(
+            f"Found {speech.speech_samples / SAMPLE_RATE:.1f}s of speech in "
+            f"{len(audio) / SAMPLE_RATE:.1f}s for session {self.session_id}"
+        )
+        return speech
+
+    def iter_transcribe(self, audio, speech=None):
+        """Yield lists of segments, on the file's timeline, as they are decoded.
+
+        Only the keys the pipeline reads are kept; Whisper's tokens and
+        log-probabilities would otherwise travel through every stage. Only
+        the speech regions of ``speech`` (detected when not given) are
+        decoded.
+        """
+        options = {
+            "language": "en",
+            "word_timestamps": settings.TRANSCRIPTION_WORD_TIMESTAMPS,
+            **self.asr.decode_options(),
+        }
+        if not isinstance(audio, np.ndarray):
+            yield slim_segments(self._transcribe_whole(str(audio), options))
+            return
+
+        speech = speech or self.speech_map(audio)
+        if speech is not None:
+            audio = speech.compact(audio)
+        if not len(audio):
+            self.report_progress("transcribe", 100)
+            return
+
+        def remapped(segments):
+            segments = slim_segments(segments)
+            return speech.remap_segments(segments) if speech else segments
 
-    def perform_speaker_diarization(self, audio_path, segments):
-        diarization = self.pipeline(audio_path)
-        labels = [
-            {"start": segment.start, "end": segment.end, "label": speaker}
+        duration = len(audio) / SAMPLE_RATE
+        window = settings.TRANSCRIPTION_PARTIAL_WINDOW_SECONDS
+        self.report_progress("transcribe", 0)
+        if self.can_batch(audio):
+            scheduler = get_batch_scheduler(self.whisper_model_size)
+            _, segments = scheduler.transcribe(audio)
+            logging.info(f"Transcribed audio for session {self.session_id} in a batch")
+            yield remapped(segments)
+        elif self.transcription_mode == "chunked" or (window and duration > window):
+            sequential = self.transcription_mode != "chunked"
+            for done, segments in iter_transcribe_chunked(
+                audio,
+                self.asr,
+                options,
+                chunk_seconds=window if sequential else None,
+                sequential=sequential,
+            ):
+                self.report_progress("transcribe", done / duration * 100)
+                yield remapped(segments)
+            logging.info(f"Transcribed audio for session {self.session_id} in chunks")
+        else:
+            yield remapped(self._transcribe_whole(audio, options))
+        self.report_progress("transcribe", 100)
+
+    def _transcribe_whole(self, audio, options):
+        model = get_asr_model(self.asr)
+        with asr_inference_lock(self.asr):
+            result = model.transcribe(audio, **options)
+        logging.info(f"Transcribed audio for session {self.session_id} ({self.asr!r})")
+        return result["segments"]
+
+    def can_batch(self, audio):
+        # The batch scheduler decodes greedily with the plain fp32 Whisper
+        # model, one padded 30 second window per clip, and has no word
+        # timestamps
+        return (
+            settings.TRANSCRIPTION_BATCHING_ENABLED
+            and self.asr.batchable
+            and not settings.TRANSCRIPTION_WORD_TIMESTAMPS
+            and len(audio) <= settings.TRANSCRIPTION_BATCH_MAX_SECONDS * SAMPLE_RATE
+        )
+
+    def diarize(self, audio, content_hash=None, speech=None):
+        """Speaker turns as (start, end, label), reused per recording when cached.
+
+        Only the speech regions of ``speech`` (detected when not given) are
+        diarized.
+        """
+        cached = diarization_cache.load(content_hash)
+        if cached is not None:
+            logging.info(f"Reusing cached diarization for session {self.session_id}")
+            return cached.turn_list()
+
+        if isinstance(audio, np.ndarray):
+            speech = speech or self.speech_map(audio)
+            if speech is not None:
+                audio = speech.compact(audio)
+            if not len(audio):
+                return []
+            audio = to_pyannote_input(audio)
+        self.report_progress("diarize", 0)
+        diarization, embeddings = self.pipeline(
+            audio, hook=self._diarization_hook, return_embeddings=True
+        )
+        self.report_progress("diarize", 100)
+        turns = [
+            (segment.start, segment.end, speaker)
             for segment, _, speaker in diarization.itertracks(yield_label=True)
         ]
-        for i, segment in enumerate(segments):
-            max_overlap = 0
-            best_match_label = "UNKNOWN"
-            for label in labels:
-                overlap_start = max(segment["start"], label["start"])
-                overlap_end = min(segment["end"], label["end"])
-                overlap = max(0, overlap_end - overlap_start)
-                if overlap > max_overlap:
-                    max_overlap = overlap
-                    best_match_label = label["label"]
-            segment["speaker"] = best_match_label
-        return segments
-
-    def save_transcription_with_speaker_labels(
-        self, transcription, segments, audio_path
-    ):
-        audio_name = Path(audio_path).stem
-        transcription_dir = Path("transcriptions") / self.session_id / audio_name
-        transcription_dir.mkdir(parents=True, exist_ok=True)
-        file_name = transcription_dir / f"{audio_name}_transcription_with_speakers.txt"
-
-        with open(file_name, "w") as f:
-            for segment in segments:
-                speaker = segment.get("speaker", "UNKNOWN")
-                f.write(f"{speaker}: {segment['text']}\n")
-        logging.info(f"Saved transcription to {file_name}")
-
-    def save_transcription_as_json(self, transcription, segments, audio_path):
-        audio_name = Path(audio_path).stem
-        transcription_dir = (
-            Path(settings.MEDIA_ROOT)
-            / "transcriptions"
-            / str(self.session_id)
-            / audio_name
+        if speech is not None:
+            turns = speech.remap_turns(turns)
+        if content_hash:
+            diarization_cache.store(
+                content_hash, turns, embeddings, labels=list(diarization.labels())
+            )
+        return turns
+
+    def _diarization_hook(self, step_name, step_artifact, file=None, **kwargs):
+        if step_name not in DIARIZATION_STEPS:
+            return
+        start, end = DIARIZATION_STEPS[step_name]
+        total, completed = kwargs.get("total"), kwargs.get("completed")
+        fraction = completed / total if total and completed is not None else 1
+        self.report_progress("diarize", start + (end - start) * fraction)
+
+    def assign_speakers(self, segments, turns):
+        return assign_speakers(
+            segments, turns, word_level=settings.TRANSCRIPTION_WORD_TIMESTAMPS
         )
-        transcription_dir.mkdir(parents=True, exist_ok=True)
-        file_name = transcription_dir / f"{audio_name}_transcription_with_speakers.json"
-
-        segments_with_speakers = [
-            {
-                "text": segment["text"],
-                "speaker": segment.get("speaker", "UNKNOWN"),
-                "start": segment["start"],
-                "end": segment["end"],
-            }
-            for segment in segments
-        ]
-        json_data = {"transcription": transcription, "segments": segments_with_speakers}
-
-        with open(file_name, "w") as f:
-            json.dump(json_data, f, indent=4)
-        logging.info(f"Saved JSON transcription to {file_name}")
-
-    def save_transcription_as_srt(self, transcription, segments, audio_path):
-        audio_name = Path(audio_path).stem
-        transcription_dir = (
-            Path(settings.MEDIA_ROOT)
-            / "transcriptions"
-            / str(self.session_id)
-            / audio_name
+
+    def perform_speaker_diarization(self, audio, segments, content_hash=None):
+        return self.assign_speakers(
+            segments, self.diarize(audio, content_hash=content_hash)
         )
-        transcription_dir.mkdir(parents=True, exist_ok=True)
-        file_name = transcription_dir / f"{audio_name}_transcription_with_speakers.srt"
-
-        with open(file_name, "w") as f:
-            for i, segment in enumerate(segments, start=1):
-                speaker = segment.get("speaker", "UNKNOWN")
-                start_time = datetime.timedelta(seconds=segment["start"])
-                end_time = datetime.timedelta(seconds=segment["end"])
-                f.write(
-                    f"{i}\n{start_time} --> {end_time}\n{speaker}: {segment['text']}\n\n"
-                )
-        logging.info(f"Saved SRT transcription to {file_name}")
-
-    def save_transcription_as_vtt(self, transcription, segments, audio_path):
-        audio_name = Path(audio_path).stem
-        transcription_dir = (
-            Path(settings.MEDIA_ROOT)
-            / "transcriptions"
-            / str(self.session_id)
-            / audio_name
+
+    def export_transcription(
+        self, transcription, segments, audio_path, formats=None, version=0
+    ):
+        exporter = TranscriptExporter(
+            self.session_id, Path(audio_path).stem, formats=formats, version=version
         )
-        transcription_dir.mkdir(parents=True, exist_ok=True)
-        file_name = transcription_dir / f"{audio_name}_transcription_with_speakers.vtt"
-
-        with open(file_name, "w") as f:
-            f.write("WEBVTT\n\n")
-            for i, segment in enumerate(segments, start=1):
-                speaker = segment.get("speaker", "UNKNOWN")
-                start_time = datetime.timedelta(seconds=segment["start"])
-                end_time = datetime.timedelta(seconds=segment["end"])
-                f.write(
-                    f"{i}\n{start_time} --> {end_time}\n{speaker}: {segment['text']}\n\n"
-                )
-        logging.info(f"Saved VTT transcription to {file_name}")
+        # Renders of a previous transcript version are stale
+        exporter.clear()
+        return exporter.export(transcription, segments)
 
     def process_audio_file(service, audio_file):
         try:
             logging.info(f"Starting processing for {audio_file}")
 
-            wav_file = service.convert_to_wav(audio_file)
-            if wav_file is None:
-                logging.error(f"Failed to convert {audio_file} to WAV format")
-                return False
-
-            logging.info(f"Successfully converted to WAV: {wav_file}")
+            audio = service.load_audio(audio_file)
+            if audio is None:
+                logging.error(f"Failed to decode {audio_file}")
+                return None
 
-            transcription, segments = service.transcribe_audio(wav_file)
+            transcription, segments = service.transcribe_audio(audio)
             if not transcription or not segments:
-                logging.error(f"Transcription failed for {wav_file}")
-                return False
+                logging.error(f"Transcription failed for {audio_file}")
+                return None
 
-            logging.info(f"Transcription successful for {wav_file}")
+            logging.info(f"Transcription successful for {audio_file}")
 
-            segments = service.perform_speaker_diarization(wav_file, segments)
+            segments = service.perform_speaker_diarization(audio, segments)
             if not segments:
-                logging.error(f"Diarization failed for {wav_file}")
-                return False
+                logging.error(f"Diarization failed for {audio_file}")
+                return None
 
-            logging.info(f"Diarization successful for {wav_file}")
+            logging.info(f"Diarization successful for {audio_file}")
 
-            service.save_transcription_with_speaker_labels(
-                transcription, segments, wav_file
-            )
-            service.save_transcription_as_json(transcription, segments, wav_file)
-            service.save_transcription_as_srt(transcription, segments, wav_file)
-            service.save_transcription_as_vtt(transcription, segments, wav_file)
+            service.export_transcription(transcription, segments, audio_file)
 
-            logging.info(f"Successfully processed {wav_file}")
-            return True, "Processing completed successfully"
+            logging.info(f"Successfully processed {audio_file}")
+            return transcript_document(transcription, segments)
         except Exception as e:
             error_message = f"An error occurred processing {audio_file}: {str(e)}"
             logging.error(error_message, exc_info=True)
-            return False, error_message
+            return None
 
 
 def process_audio_file_wrapper(args):
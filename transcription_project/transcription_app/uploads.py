@@ -0,0 +1,126 @@
+import base64
+import binascii
+import fcntl
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .models import AudioFile, UploadSession
+
+READ_BLOCK_SIZE = 1 << 16
+# Per-job options an upload session carries over to its AudioFile
+JOB_OPTIONS = (
+    "transcription_mode",
+    "profile",
+    "asr_backend",
+    "asr_model",
+    "asr_compute_type",
+)
+SUPPORTED_CHECKSUMS = {"sha256": hashlib.sha256, "md5": hashlib.md5}
+
+
+class UploadError(Exception):
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadConflict(UploadError):
+    pass
+
+
+def parse_checksum(header):
+    """Parse a tus-style ``Upload-Checksum: <algorithm> <base64 digest>`` header."""
+    if not header:
+        return None
+    algorithm, _, encoded = header.strip().partition(" ")
+    algorithm = algorithm.lower()
+    if algorithm not in SUPPORTED_CHECKSUMS:
+        raise UploadError(f"Unsupported checksum algorithm: {algorithm}")
+    try:
+        digest = base64.b64decode(encoded.strip(), validate=True)
+    except binascii.Error:
+        raise UploadError("Malformed checksum")
+    return algorithm, digest
+
+
+def append_chunk(session, stream, length, offset, checksum=None):
+    """Write ``length`` bytes from ``stream`` to the session's part file at ``offset``.
+
+    The body goes straight from the request stream to disk in small blocks
+    while being hashed. A chunk whose checksum doesn't match is cut off again,
+    and one that arrives incomplete without a checksum is kept so the client
+    can resume from the new offset. Returns the new offset.
+    """
+    part_path = session.get_part_path()
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+
+    with open(part_path, "ab+") as f:
+        # Serialize appends to the same session across workers
+        fcntl.flock(f, fcntl.LOCK_EX)
+        session.refresh_from_db(fields=["offset"])
+        if offset != session.offset:
+            raise UploadConflict("Offset does not match upload", session.offset)
+        if offset + length > session.size:
+            raise UploadError("Chunk exceeds declared upload size", session.offset)
+
+        f.truncate(offset)
+        digest = hashlib.new(checksum[0]) if checksum else None
+        received = 0
+        while received < length:
+            block = stream.read(min(READ_BLOCK_SIZE, length - received))
+            if not block:
+                break
+            f.write(block)
+            if digest:
+                digest.update(block)
+            received += len(block)
+
+        if checksum and (received != length or digest.digest() != checksum[1]):
+            f.truncate(offset)
+            raise UploadError("Checksum mismatch", offset)
+
+        f.flush()
+        os.fsync(f.fileno())
+        UploadSession.objects.filter(id=session.id).update(offset=offset + received)
+        session.offset = offset + received
+    return session.offset
+
+
+def finalize_upload(session):
+    """Move a complete upload into storage and create its AudioFile.
+
+    The content hash is left for process_audio_file, which hashes the file
+    in the worker rather than while this request holds the session lock.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session.id)
+        if session.audio_file_id:
+            return session.audio_file, False
+        if session.offset != session.size:
+            raise UploadError("Upload is incomplete", session.offset)
+
+        name = default_storage.get_available_name(
+            os.path.join("uploads", os.path.basename(session.filename))
+        )
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(session.get_part_path(), target)
+
+        audio_file = AudioFile.objects.create(
+            user=session.user,
+            file=name,
+            **{option: getattr(session, option) for option in JOB_OPTIONS},
+        )
+        session.audio_file = audio_file
+        session.save(update_fields=["audio_file"])
+    return audio_file, True
+
+
+def discard_upload(session):
+    try:
+        os.unlink(session.get_part_path())
+    except FileNotFoundError:
+        pass
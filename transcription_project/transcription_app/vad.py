@@ -0,0 +1,216 @@
+import numpy as np
+
+from .audio_decoding import SAMPLE_RATE
+
+FRAME_SECONDS = 0.03
+
+
+def frame_energy(audio, frame_samples=int(SAMPLE_RATE * FRAME_SECONDS)):
+    """Root-mean-square energy of consecutive, non-overlapping frames."""
+    frame_count = len(audio) // frame_samples
+    if frame_count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = np.asarray(audio[: frame_count * frame_samples]).reshape(
+        frame_count, frame_samples
+    )
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+def find_split_points(audio, target_seconds, search_seconds=10.0):
+    """Pick chunk boundaries near every ``target_seconds`` at the quietest frame.
+
+    Returns sample offsets, starting at 0 and ending at ``len(audio)``.
+    """
+    frame_samples = int(SAMPLE_RATE * FRAME_SECONDS)
+    energy = frame_energy(audio, frame_samples)
+    target = int(target_seconds / FRAME_SECONDS)
+    search = min(int(search_seconds / FRAME_SECONDS), target // 2)
+
+    points = [0]
+    frame = 0
+    while frame + target + search < len(energy):
+        low = frame + target - search
+        high = frame + target + search + 1
+        frame = low + int(np.argmin(energy[low:high]))
+        points.append(frame * frame_samples)
+    points.append(len(audio))
+    return points
+
+
+def frame_zero_crossing_rate(audio, frame_samples=int(SAMPLE_RATE * FRAME_SECONDS)):
+    """Share of adjacent samples changing sign, per non-overlapping frame."""
+    frame_count = len(audio) // frame_samples
+    if frame_count == 0:
+        return np.zeros(0, dtype=np.float32)
+    signs = np.signbit(
+        np.asarray(audio[: frame_count * frame_samples]).reshape(
+            frame_count, frame_samples
+        )
+    )
+    crossings = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1)
+    return (crossings / (frame_samples - 1)).astype(np.float32)
+
+
+def _runs(mask):
+    """(starts, ends) of the runs of True in a boolean array."""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def _close_gaps(starts, ends, min_gap):
+    if len(starts) < 2:
+        return starts, ends
+    keep = starts[1:] - ends[:-1] >= min_gap
+    return (
+        np.concatenate((starts[:1], starts[1:][keep])),
+        np.concatenate((ends[:-1][keep], ends[-1:])),
+    )
+
+
+def detect_speech(
+    audio,
+    min_silence_seconds=1.0,
+    min_speech_seconds=0.25,
+    padding_seconds=0.25,
+    min_energy=0.005,
+    zcr_threshold=0.3,
+):
+    """Speech regions as an (n, 2) array of [start, end) sample offsets.
+
+    A frame is speech when its energy clears a threshold placed a tenth of
+    the way from the recording's noise floor to its loud level, or clears
+    half of that with a high zero-crossing rate, which catches unvoiced
+    consonants. Recordings without a clear noise floor are kept whole. Runs
+    shorter than ``min_speech_seconds`` are dropped, the rest padded, and
+    pauses shorter than ``min_silence_seconds`` kept.
+    """
+    frame_samples = int(SAMPLE_RATE * FRAME_SECONDS)
+    energy = frame_energy(audio, frame_samples)
+    if len(energy) == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    noise, loud = np.percentile(energy, [10, 95])
+    if loud > min_energy and loud < 2 * noise:
+        # No quiet stretches stand out, so there is nothing to skip
+        return np.array([[0, len(audio)]], dtype=np.int64)
+    threshold = max(min_energy, noise + (loud - noise) * 0.1)
+    speech = (energy > threshold) | (
+        (energy > threshold / 2)
+        & (frame_zero_crossing_rate(audio, frame_samples) > zcr_threshold)
+    )
+
+    starts, ends = _runs(speech)
+    long_enough = ends - starts >= min_speech_seconds / FRAME_SECONDS
+    starts, ends = starts[long_enough], ends[long_enough]
+    padding = int(round(padding_seconds / FRAME_SECONDS))
+    starts = np.maximum(starts - padding, 0)
+    ends = np.minimum(ends + padding, len(energy))
+    starts, ends = _close_gaps(starts, ends, min_silence_seconds / FRAME_SECONDS)
+
+    regions = np.stack((starts, ends), axis=1).astype(np.int64) * frame_samples
+    if len(regions) and ends[-1] == len(energy):
+        # The last partial frame belongs to a region running to the end
+        regions[-1, 1] = len(audio)
+    return regions
+
+
+class SpeechMap:
+    """Where the speech is in a recording, and how to skip the rest.
+
+    ``compact`` concatenates the speech regions so ASR and diarization only
+    see voiced audio, and ``to_original`` maps times on that compacted
+    timeline back to the recording's.
+    """
+
+    def __init__(self, regions, total_samples):
+        self.regions = np.asarray(regions, dtype=np.int64).reshape(-1, 2)
+        self.total_samples = total_samples
+        lengths = self.regions[:, 1] - self.regions[:, 0]
+        # Where each region starts on the compacted timeline
+        self.compact_starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        self.speech_samples = int(lengths.sum())
+
+    @classmethod
+    def from_audio(cls, audio, min_silence_ratio=0.0, **options):
+        """Detect speech; keep everything when less silence than that is found."""
+        speech = cls(detect_speech(audio, **options), len(audio))
+        if 1 - speech.speech_ratio < min_silence_ratio:
+            return cls.everything(len(audio))
+        return speech
+
+    @classmethod
+    def everything(cls, total_samples):
+        return cls([[0, total_samples]] if total_samples else [], total_samples)
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["regions"], data["total_samples"])
+
+    def to_json(self):
+        return {"regions": self.regions.tolist(), "total_samples": self.total_samples}
+
+    @property
+    def speech_ratio(self):
+        return self.speech_samples / self.total_samples if self.total_samples else 0.0
+
+    @property
+    def is_everything(self):
+        return self.speech_samples == self.total_samples
+
+    def compact(self, audio):
+        if self.is_everything:
+            return audio
+        return np.concatenate(
+            [audio[start:end] for start, end in self.regions]
+            or [np.zeros(0, dtype=np.float32)]
+        )
+
+    def to_original(self, seconds, end=False):
+        """Map compacted times (seconds) to the recording's timeline.
+
+        A time exactly on a junction belongs to the next region, or to the
+        previous one with ``end``, so segments never stretch over a gap they
+        didn't touch.
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        if self.is_everything or not len(self.regions):
+            return seconds
+        samples = seconds * SAMPLE_RATE
+        index = np.searchsorted(
+            self.compact_starts, samples, side="left" if end else "right"
+        )
+        index = np.clip(index - 1, 0, len(self.regions) - 1)
+        offsets = self.regions[index, 0] - self.compact_starts[index]
+        return seconds + offsets / SAMPLE_RATE
+
+    def remap_segments(self, segments):
+        """Copies of Whisper segments (and their words) on the original timeline."""
+        if self.is_everything:
+            return segments
+        remapped = []
+        for segment in segments:
+            segment = dict(
+                segment,
+                start=float(self.to_original(segment["start"])),
+                end=float(self.to_original(segment["end"], end=True)),
+            )
+            if "words" in segment:
+                starts = self.to_original([word["start"] for word in segment["words"]])
+                ends = self.to_original(
+                    [word["end"] for word in segment["words"]], end=True
+                )
+                segment["words"] = [
+                    dict(word, start=float(s), end=float(e))
+                    for word, s, e in zip(segment["words"], starts, ends)
+                ]
+            remapped.append(segment)
+        return remapped
+
+    def remap_turns(self, turns):
+        if self.is_everything or not turns:
+            return turns
+        starts = self.to_original([start for start, _, _ in turns])
+        ends = self.to_original([end for _, end, _ in turns], end=True)
+        return [
+            (float(start), float(end), speaker)
+            for start, end, (_, _, speaker) in zip(starts, ends, turns)
+        ]
@@ -1,22 +1,48 @@
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import AccessToken
-from .models import AudioFile
-from .serializers import AudioFileSerializer, UserSerializer
-from .tasks import process_audio_file
+from .models import AudioFile, SpeakerProfile, UploadSession
+from .serializers import (
+    AudioFileListSerializer,
+    AudioFileSerializer,
+    SpeakerEnrollmentSerializer,
+    SpeakerProfileSerializer,
+    UploadSessionSerializer,
+    UserSerializer,
+)
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled, ValidationError
+import datetime
 import json
 import os
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .serializers import CustomTokenObtainPairSerializer
 import logging
-from django.http import FileResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.conf import settings
-
+from django.db import IntegrityError
+from django.db.models import Count, F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .downloads import serve_file
+from . import result_cache, scheduler, search, speaker_index
+from .exporters import render_transcript, transcription_file_name
+from .instrumentation import render_prometheus
+from .pagination import AudioFileCursorPagination
+from .speaker_assignment import assign_speakers
+from .workspace import JobWorkspace
+from .uploads import (
+    UploadConflict,
+    UploadError,
+    append_chunk,
+    discard_upload,
+    finalize_upload,
+    parse_checksum,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +50,65 @@ logger = logging.getLogger(__name__)
 class AudioFileViewSet(viewsets.ModelViewSet):
     queryset = AudioFile.objects.all()
     serializer_class = AudioFileSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = AudioFileCursorPagination
+
+    def get_queryset(self):
+        queryset = (
+            super().get_queryset().filter(user=self.request.user).select_related("user")
+        )
+        if self.action == "list":
+            # Transcripts can be megabytes per row; list views never show them
+            queryset = queryset.defer(
+                "transcription_text", "transcription_json", "segment_data"
+            )
+            queryset = self.filter_list(queryset)
+        return queryset
+
+    def filter_list(self, queryset):
+        params = self.request.query_params
+        if params.get("status"):
+            queryset = queryset.filter(status__in=params["status"].split(","))
+
+        for param, lookup in (
+            ("uploaded_after", "uploaded_at__gte"),
+            ("uploaded_before", "uploaded_at__lt"),
+        ):
+            value = params.get(param)
+            if not value:
+                continue
+            try:
+                moment = parse_datetime(value) or parse_date(value)
+            except ValueError:
+                moment = None
+            if moment is None:
+                raise ValidationError({param: "Expected an ISO 8601 date or datetime"})
+            if not isinstance(moment, datetime.datetime):
+                moment = datetime.datetime.combine(moment, datetime.time.min)
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            queryset = queryset.filter(**{lookup: moment})
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == "list":
+            return AudioFileListSerializer
+        return super().get_serializer_class()
 
     def perform_create(self, serializer):
         try:
-            serializer.save(user=self.request.user)
-            audio_file_id = serializer.instance.id
-            process_audio_file.delay(audio_file_id)
+            scheduler.check_capacity(self.request.user)
+        except scheduler.QueueFull as e:
+            raise Throttled(detail=str(e))
+        try:
+            uploaded_file = serializer.validated_data.get("file")
+            serializer.save(
+                user=self.request.user,
+                content_hash=getattr(uploaded_file, "content_hash", ""),
+            )
+            audio_file = serializer.instance
+            if not result_cache.apply_cached_result(audio_file):
+                scheduler.enqueue(audio_file)
             logger.info(
                 f"AudioFile created successfully for user {self.request.user.username}"
             )
@@ -37,13 +116,11 @@ class AudioFileViewSet(viewsets.ModelViewSet):
             logger.error(f"Error creating AudioFile: {str(e)}")
             raise
 
-    def create(self, request, *args, **kwargs):
-        if not request.user.is_authenticated:
-            return Response(
-                {"error": "Authentication required"},
-                status=status.HTTP_401_UNAUTHORIZED,
-            )
-        return super().create(request, *args, **kwargs)
+    def perform_content_negotiation(self, request, force=False):
+        # download's ?format= names a transcript format, not a DRF renderer,
+        # and both actions answer with their own content types
+        force = force or self.action in ("download", "partial")
+        return super().perform_content_negotiation(request, force=force)
 
     @action(detail=True, methods=["get"])
     def transcription(self, request, pk=None):
@@ -57,7 +134,7 @@ class AudioFileViewSet(viewsets.ModelViewSet):
             return Response(
                 {
                     "text": audio_file.transcription_text,
-                    "json": audio_file.transcription_json,
+                    "json": audio_file.transcript_document(),
                 }
             )
         except AudioFile.DoesNotExist:
@@ -66,6 +143,92 @@ class AudioFileViewSet(viewsets.ModelViewSet):
                 {"error": "File not found"}, status=status.HTTP_404_NOT_FOUND
             )
 
+    @action(detail=True, methods=["get"])
+    def partial(self, request, pk=None):
+        """Segments transcribed so far as NDJSON, starting at segment ``?after=``.
+
+        Available while the job is still running. Speakers are UNKNOWN until
+        diarization has finished, so clients re-read once X-Diarized is true.
+        """
+        try:
+            after = max(0, int(request.query_params.get("after", 0)))
+        except ValueError:
+            raise ValidationError({"after": "Expected a segment index"})
+
+        audio_file = self.get_object()
+        if audio_file.processed:
+            segments = audio_file.get_transcript()[1][after:]
+            complete = diarized = True
+        else:
+            workspace = JobWorkspace(audio_file.id)
+            segments = list(workspace.iter_segments(after))
+            complete = False
+            diarized = workspace.exists("turns")
+            if diarized and segments:
+                segments = assign_speakers(
+                    segments,
+                    workspace.load("turns"),
+                    word_level=settings.TRANSCRIPTION_WORD_TIMESTAMPS,
+                )
+
+        lines = (
+            json.dumps(
+                {
+                    "id": after + index,
+                    "start": segment["start"],
+                    "end": segment["end"],
+                    "text": segment["text"],
+                    "speaker": segment.get("speaker", "UNKNOWN"),
+                    **({"words": segment["words"]} if "words" in segment else {}),
+                }
+            )
+            + "\n"
+            for index, segment in enumerate(segments)
+        )
+        response = StreamingHttpResponse(lines, content_type="application/x-ndjson")
+        response["X-Transcript-Complete"] = str(complete).lower()
+        response["X-Diarized"] = str(diarized).lower()
+        response["X-Next-Segment"] = str(after + len(segments))
+        return response
+
+    @action(detail=True, methods=["post"])
+    def speakers(self, request, pk=None):
+        """Enroll a diarized speaker of this file under a name.
+
+        The voice is added to the user's speaker index, so later recordings
+        of the same person are labelled with the name automatically.
+        """
+        audio_file = self.get_object()
+        serializer = SpeakerEnrollmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        label, name = (
+            serializer.validated_data["speaker"],
+            serializer.validated_data["name"],
+        )
+
+        profile = speaker_index.enroll(request.user, audio_file, label, name)
+        if profile is None:
+            return Response(
+                {"error": f"No voice embedding for {label} in this file"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if audio_file.has_transcript:
+            segments = audio_file.get_transcript()[1].renamed({label: name})
+            # Rows from before segment_data are converted on the way; the new
+            # version keeps exports with the old labels from being served
+            AudioFile.objects.filter(id=audio_file.id).update(
+                segment_data=segments.to_bytes(),
+                transcription_json=None,
+                transcript_version=F("transcript_version") + 1,
+            )
+            search.rename_speaker(audio_file, label, name)
+        logger.info(f"Enrolled {label} of AudioFile {audio_file.id} as {name}")
+        profile.embedding_count = profile.embeddings.count()
+        return Response(
+            SpeakerProfileSerializer(profile).data, status=status.HTTP_201_CREATED
+        )
+
     @action(detail=True, methods=["get"])
     def download(self, request, pk=None):
         audio_file = self.get_object()
@@ -76,28 +239,174 @@ class AudioFileViewSet(viewsets.ModelViewSet):
                 {"error": "Invalid format"}, status=status.HTTP_400_BAD_REQUEST
             )
 
-        file_path = audio_file.get_file_path(format)
-
-        if not os.path.exists(file_path):
+        if not audio_file.processed or not audio_file.has_transcript:
             return Response(
-                {"error": "File not found"}, status=status.HTTP_404_NOT_FOUND
+                {"error": "Transcription not ready"},
+                status=status.HTTP_400_BAD_REQUEST,
             )
 
         try:
-            with open(file_path, "rb") as file:
-                response = HttpResponse(
-                    file.read(), content_type="application/octet-stream"
-                )
-                response["Content-Disposition"] = (
-                    f'attachment; filename="{os.path.basename(file_path)}"'
-                )
-                return response
+            file_path = render_transcript(audio_file, format)
+            # Downloads keep the unversioned name
+            filename = transcription_file_name(file_path.parent.name, format)
+            return serve_file(request, file_path, filename, compressible=True)
         except Exception as e:
+            logger.error(f"Error serving {format} for file ID {pk}: {str(e)}")
             return Response(
                 {"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
+class UploadSessionViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Resumable uploads: create a session, PATCH chunks, then finalize."""
+
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    def perform_destroy(self, instance):
+        discard_upload(instance)
+        instance.delete()
+
+    @action(detail=True, methods=["patch", "put"])
+    def chunk(self, request, pk=None):
+        session = self.get_object()
+        if session.audio_file_id:
+            return Response(
+                {"error": "Upload already finalized"}, status=status.HTTP_409_CONFLICT
+            )
+
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Upload-Offset and Content-Length headers are required"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if length > settings.TRANSCRIPTION_UPLOAD_MAX_CHUNK_SIZE:
+            return Response(
+                {"error": "Chunk too large"},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        try:
+            checksum = parse_checksum(request.headers.get("Upload-Checksum"))
+            new_offset = append_chunk(session, request.stream, length, offset, checksum)
+        except UploadConflict as e:
+            return Response(
+                {"error": str(e), "offset": e.offset}, status=status.HTTP_409_CONFLICT
+            )
+        except UploadError as e:
+            return Response(
+                {"error": str(e), "offset": e.offset},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        response = Response({"offset": new_offset})
+        response["Upload-Offset"] = str(new_offset)
+        return response
+
+    @action(detail=True, methods=["post"])
+    def finalize(self, request, pk=None):
+        session = self.get_object()
+        if not session.audio_file_id:
+            try:
+                scheduler.check_capacity(request.user)
+            except scheduler.QueueFull as e:
+                raise Throttled(detail=str(e))
+        try:
+            audio_file, created = finalize_upload(session)
+        except UploadError as e:
+            return Response(
+                {"error": str(e), "offset": e.offset},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if created and not result_cache.apply_cached_result(audio_file):
+            scheduler.enqueue(audio_file)
+            logger.info(
+                f"AudioFile {audio_file.id} created from upload session {session.id}"
+            )
+        serializer = AudioFileSerializer(audio_file, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class SpeakerProfileViewSet(
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.UpdateModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Named speakers recognised across the user's recordings."""
+
+    serializer_class = SpeakerProfileSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return (
+            SpeakerProfile.objects.filter(user=self.request.user)
+            .annotate(embedding_count=Count("embeddings"))
+            .order_by("name")
+        )
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except IntegrityError:
+            raise ValidationError({"name": "A speaker with this name already exists"})
+
+
+class TranscriptSearchView(APIView):
+    """Ranked transcript segments matching ``?q=`` across the user's files.
+
+    Every word must match; "quoted words" must appear as a phrase.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "A search query is required"})
+        try:
+            limit = int(request.query_params.get("limit", 20))
+            offset = max(0, int(request.query_params.get("offset", 0)))
+        except ValueError:
+            raise ValidationError("limit and offset must be integers")
+        limit = min(max(1, limit), settings.TRANSCRIPTION_SEARCH_MAX_RESULTS)
+
+        hits = search.search(request.user, query, limit=limit, offset=offset)
+        return Response({"query": query, "offset": offset, "results": hits})
+
+
+def prometheus_metrics(request):
+    """Pipeline stage metrics for Prometheus to scrape.
+
+    Prometheus sends the configured bearer token; without one, only staff
+    signed in to the admin can read them.
+    """
+    token = settings.TRANSCRIPTION_METRICS_TOKEN
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    if not token and not request.user.is_staff:
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(
+        render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
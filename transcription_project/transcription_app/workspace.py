@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .audio_decoding import SAMPLE_RATE
+
+
+class JobWorkspace:
+    """Scratch directory shared by the pipeline stages of one audio file.
+
+    Stages may run on different workers, so intermediate results are handed
+    over through MEDIA_ROOT rather than through task arguments: the decoded
+    PCM is memory-mapped by the transcribe and diarize stages, and their
+    outputs are small JSON files picked up by the merge stage. Segments are
+    also appended to segments.jsonl as soon as they are decoded.
+    """
+
+    def __init__(self, audio_file_id):
+        self.root = Path(settings.MEDIA_ROOT) / "work" / str(audio_file_id)
+
+    @property
+    def audio_path(self):
+        return self.root / "audio.pcm"
+
+    @property
+    def segments_path(self):
+        return self.root / "segments.jsonl"
+
+    def audio_seconds(self):
+        """Duration of the decoded audio, or None before the decode stage."""
+        try:
+            size = self.audio_path.stat().st_size
+        except FileNotFoundError:
+            return None
+        return size / np.dtype(np.float32).itemsize / SAMPLE_RATE
+
+    def load_audio(self):
+        return np.memmap(self.audio_path, dtype=np.float32, mode="c")
+
+    def save(self, name, data):
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_name, self.root / f"{name}.json")
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def load(self, name):
+        with open(self.root / f"{name}.json") as f:
+            return json.load(f)
+
+    def exists(self, name):
+        return (self.root / f"{name}.json").exists()
+
+    def reset_segments(self):
+        self.segments_path.unlink(missing_ok=True)
+
+    def append_segments(self, segments):
+        """Append decoded segments for readers following the transcription."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.segments_path, "a") as f:
+            f.write("".join(json.dumps(segment) + "\n" for segment in segments))
+
+    def iter_segments(self, start=0):
+        try:
+            f = open(self.segments_path)
+        except FileNotFoundError:
+            return
+        with f:
+            for index, line in enumerate(f):
+                if not line.endswith("\n"):
+                    # Still being written
+                    break
+                if index >= start:
+                    yield json.loads(line)
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
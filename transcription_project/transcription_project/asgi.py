@@ -3,6 +3,11 @@ ASGI config for transcription_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it under an ASGI server (e.g. ``uvicorn transcription_project.asgi:application``)
+so the server-sent progress streams at /api/audio-files/<id>/events/ don't
+tie up a worker thread per client. WebSocket connections go to the live
+transcription endpoint at /ws/transcribe/.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
@@ -13,4 +18,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "transcription_project.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from transcription_app.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "websocket":
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
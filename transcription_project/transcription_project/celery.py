@@ -1,8 +1,41 @@
 import os
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
+from celery.worker.control import inspect_command
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "transcription_project.settings")
 
 app = Celery("transcription_project")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@worker_init.connect
+def configure_stage_worker(sender, **kwargs):
+    """Apply TRANSCRIPTION_WORKER_QUEUES to a worker started with one -Q queue."""
+    from django.conf import settings
+
+    queues = list(sender.app.amqp.queues.consume_from)
+    if len(queues) != 1:
+        return
+    options = settings.TRANSCRIPTION_WORKER_QUEUES.get(queues[0])
+    if options:
+        sender.concurrency = options["concurrency"]
+        sender.prefetch_multiplier = options["prefetch_multiplier"]
+        # Sent before the pool class is resolved, so it can still be changed
+        sender.pool_cls = options.get("pool", sender.pool_cls)
+
+
+@worker_process_init.connect
+def warm_up_models(**kwargs):
+    from transcription_app.model_registry import warm_up
+
+    warm_up()
+
+
+@inspect_command()
+def batch_stats(state):
+    """Throughput and latency of this worker's batch schedulers."""
+    from transcription_app.batch_scheduler import scheduler_stats
+
+    return scheduler_stats()
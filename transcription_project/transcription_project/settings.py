@@ -1,5 +1,6 @@
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -61,6 +62,155 @@ LOGGING = {
 ALLOWED_HOSTS = []
 
 PYANNOTE_AUTH_TOKEN = os.environ.get("PYANNOTE_AUTH_TOKEN")
+PYANNOTE_DIARIZATION_MODEL = "pyannote/speaker-diarization-3.1"
+
+WHISPER_MODEL_SIZE = os.environ.get("WHISPER_MODEL_SIZE", "base")
+TRANSCRIPTION_DEVICE = os.environ.get("TRANSCRIPTION_DEVICE", "cpu")
+
+# Default speech recognition engine; jobs may override backend, model and
+# compute type. "faster-whisper" needs the faster-whisper package. Compute
+# types: float32, float16 (GPU) or int8 (dynamically quantized on CPU) for
+# whisper; faster-whisper also takes int8_float32 and int8_float16. Threads
+# of 0 keep PyTorch's default and a beam size of 0 decodes greedily.
+TRANSCRIPTION_ASR_BACKEND = os.environ.get("TRANSCRIPTION_ASR_BACKEND", "whisper")
+TRANSCRIPTION_ASR_COMPUTE_TYPE = os.environ.get(
+    "TRANSCRIPTION_ASR_COMPUTE_TYPE", "float32"
+)
+# PyTorch threads per worker process, applied when a model is loaded
+TRANSCRIPTION_ASR_THREADS = int(os.environ.get("TRANSCRIPTION_ASR_THREADS", 0))
+TRANSCRIPTION_ASR_BEAM_SIZE = int(os.environ.get("TRANSCRIPTION_ASR_BEAM_SIZE", 0))
+# Model sizes a job may request; anything else (other Hugging Face repos,
+# local paths, huge models) is refused so users can't exhaust worker memory
+TRANSCRIPTION_ASR_ALLOWED_MODELS = os.environ.get(
+    "TRANSCRIPTION_ASR_ALLOWED_MODELS", "tiny,base,small"
+).split(",")
+
+# Voice activity pre-filter: after decoding, only speech regions (with
+# TRANSCRIPTION_VAD_PADDING_SECONDS either side) are sent to ASR and
+# diarization, and timestamps are mapped back to the recording. Pauses
+# shorter than TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS are kept, and nothing
+# is cut when less than TRANSCRIPTION_VAD_MIN_SILENCE_RATIO of the audio
+# is silence. Frames under TRANSCRIPTION_VAD_MIN_ENERGY RMS are never speech.
+TRANSCRIPTION_VAD_ENABLED = os.getenv("TRANSCRIPTION_VAD_ENABLED", "1") == "1"
+TRANSCRIPTION_VAD_MIN_SILENCE_SECONDS = 1.0
+TRANSCRIPTION_VAD_MIN_SPEECH_SECONDS = 0.25
+TRANSCRIPTION_VAD_PADDING_SECONDS = 0.25
+TRANSCRIPTION_VAD_MIN_ENERGY = 0.005
+TRANSCRIPTION_VAD_MIN_SILENCE_RATIO = 0.05
+
+# Maximum number of models kept in memory per worker process
+TRANSCRIPTION_MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", 3))
+
+# Ask Whisper for word timestamps and label each word with a speaker; the
+# words are stored with the transcript and returned by the JSON endpoints
+TRANSCRIPTION_WORD_TIMESTAMPS = os.getenv("TRANSCRIPTION_WORD_TIMESTAMPS") == "1"
+
+# Chunked transcription mode: audio is cut at the quietest point near every
+# TRANSCRIPTION_CHUNK_SECONDS and chunks are decoded in a process pool
+TRANSCRIPTION_CHUNK_SECONDS = 300
+TRANSCRIPTION_CHUNK_OVERLAP_SECONDS = 2
+TRANSCRIPTION_CHUNK_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+
+# When set, standard mode decodes audio longer than this many seconds in
+# consecutive windows of about this length, so segments can be read while
+# the rest is still being transcribed. Each window is decoded separately
+# with the previous text as prompt, which can change the transcript at the
+# window boundaries. Unset (the default) transcribes the whole file in one
+# pass and partial transcripts appear once it is done.
+TRANSCRIPTION_PARTIAL_WINDOW_SECONDS = (
+    int(os.environ["TRANSCRIPTION_PARTIAL_WINDOW_SECONDS"])
+    if os.environ.get("TRANSCRIPTION_PARTIAL_WINDOW_SECONDS")
+    else None
+)
+
+# Clips up to TRANSCRIPTION_BATCH_MAX_SECONDS are decoded in padded batches
+# of up to TRANSCRIPTION_BATCH_MAX_SIZE, waiting at most
+# TRANSCRIPTION_BATCH_MAX_WAIT_MS for more clips. Batches only form across
+# tasks running in one process, so only enable this for transcribe workers
+# started with --pool threads; under prefork every job would wait out the
+# window alone. Inspect the scheduler with
+# `celery -A transcription_project inspect batch_stats`.
+TRANSCRIPTION_BATCHING_ENABLED = (
+    os.environ.get("TRANSCRIPTION_BATCHING_ENABLED", "0") == "1"
+)
+TRANSCRIPTION_BATCH_MAX_SECONDS = 30
+TRANSCRIPTION_BATCH_MAX_SIZE = 8
+TRANSCRIPTION_BATCH_MAX_WAIT_MS = 300
+
+# Transcript formats written when a job completes. Anything else is rendered
+# from the stored segments on first download and cached on disk.
+TRANSCRIPTION_EXPORT_FORMATS = []
+
+# Hand transcript downloads to the front-end server instead of streaming them
+# from Django: "x-sendfile" (Apache/lighttpd) or "x-accel-redirect" (nginx,
+# with an internal location mapping TRANSCRIPTION_DOWNLOAD_ACCEL_PREFIX to
+# MEDIA_ROOT)
+TRANSCRIPTION_DOWNLOAD_SENDFILE = os.environ.get("DOWNLOAD_SENDFILE")
+TRANSCRIPTION_DOWNLOAD_ACCEL_PREFIX = "/protected-media/"
+# Serve gzip (or brotli, when installed) encoded text transcripts
+TRANSCRIPTION_DOWNLOAD_COMPRESSION = True
+
+# Largest body accepted for a single resumable upload chunk
+TRANSCRIPTION_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Uploads are hashed as they stream in so repeated recordings can reuse
+# cached results. Bump TRANSCRIPTION_CONFIG_VERSION to invalidate the cache
+# after changing anything that affects transcription output.
+FILE_UPLOAD_HANDLERS = [
+    "transcription_app.result_cache.HashingMemoryFileUploadHandler",
+    "transcription_app.result_cache.HashingTemporaryFileUploadHandler",
+]
+TRANSCRIPTION_CONFIG_VERSION = 1
+
+# Workers publish stage progress to Redis pub/sub when PROGRESS_REDIS_URL is
+# set (and the redis package is installed), otherwise to the "progress" cache,
+# which must then be shared with the web processes. Clients follow it at
+# /api/audio-files/<id>/events/ as server-sent events.
+TRANSCRIPTION_PROGRESS_REDIS_URL = os.environ.get("PROGRESS_REDIS_URL")
+TRANSCRIPTION_PROGRESS_INTERVAL_SECONDS = 1
+TRANSCRIPTION_PROGRESS_POLL_SECONDS = 0.5
+TRANSCRIPTION_PROGRESS_KEEPALIVE_SECONDS = 15
+TRANSCRIPTION_PROGRESS_TTL = 24 * 60 * 60
+
+# Live transcription (ws://<host>/ws/transcribe/): the stream is cut into
+# utterances after TRANSCRIPTION_REALTIME_SILENCE_SECONDS of frames below the
+# energy threshold, or at most every TRANSCRIPTION_REALTIME_MAX_WINDOW_SECONDS
+# (at most 30). The utterance in progress is re-decoded as a partial result
+# about every TRANSCRIPTION_REALTIME_PARTIAL_SECONDS. Utterances are labelled
+# with online clustering of the diarization model's speaker embeddings.
+TRANSCRIPTION_REALTIME_ENERGY_THRESHOLD = 0.01
+TRANSCRIPTION_REALTIME_SILENCE_SECONDS = 0.6
+TRANSCRIPTION_REALTIME_MAX_WINDOW_SECONDS = 15
+TRANSCRIPTION_REALTIME_PARTIAL_SECONDS = 1.0
+TRANSCRIPTION_REALTIME_SPEAKER_THRESHOLD = 0.6
+TRANSCRIPTION_REALTIME_MIN_SPEAKER_SECONDS = 1.0
+# Windows are decoded on the "realtime" queue, so web processes don't load
+# Whisper or the embedding model. Its workers should use the threads pool so
+# concurrent streams share batched decodes. Turned off, every web process
+# loads both models and must be sized for its streams' decoding.
+TRANSCRIPTION_REALTIME_ON_WORKERS = (
+    os.getenv("TRANSCRIPTION_REALTIME_ON_WORKERS", "1") == "1"
+)
+TRANSCRIPTION_REALTIME_WORKER_TIMEOUT = 30
+# Concurrent streams a user may open on one web process
+TRANSCRIPTION_REALTIME_MAX_STREAMS_PER_USER = int(
+    os.getenv("TRANSCRIPTION_REALTIME_MAX_STREAMS_PER_USER", 2)
+)
+
+# Cosine similarity a diarized speaker needs to an enrolled voice to be named
+TRANSCRIPTION_SPEAKER_MATCH_THRESHOLD = 0.5
+# Inverted-file buckets scanned per lookup in large speaker indexes
+TRANSCRIPTION_SPEAKER_INDEX_NPROBE = 8
+
+# "fts5" (SQLite), "inverted" (any database) or "auto" to pick FTS5 when present
+TRANSCRIPTION_SEARCH_BACKEND = os.getenv("TRANSCRIPTION_SEARCH_BACKEND", "auto")
+# Largest page of search hits a client may request
+TRANSCRIPTION_SEARCH_MAX_RESULTS = 100
+
+# Profile every pipeline stage with cProfile, not only jobs flagged "profile"
+TRANSCRIPTION_PROFILE_STAGES = os.getenv("TRANSCRIPTION_PROFILE_STAGES") == "1"
+# Bearer token Prometheus must send to /metrics; unset limits it to staff
+TRANSCRIPTION_METRICS_TOKEN = os.getenv("TRANSCRIPTION_METRICS_TOKEN")
 
 # Application definition
 
@@ -187,6 +337,80 @@ SIMPLE_JWT = {
 }
 
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+# Chords (transcribe and diarize joining into merge) need a result backend
+CELERY_RESULT_BACKEND = os.environ.get(
+    "CELERY_RESULT_BACKEND", "redis://localhost:6379/1"
+)
+CELERY_TASK_ACKS_LATE = True
+
+# Jobs wait in a database-backed fair-share queue and at most
+# TRANSCRIPTION_MAX_ACTIVE_JOBS run through the pipeline at once. Free slots
+# go to the user with the fewest running jobs per unit of tier weight, so a
+# bulk upload can't starve other users. Each tier caps its users' running
+# and queued jobs; uploads beyond max_queued are refused with 429. Within a
+# user's queue higher priority runs first, then shorter recordings, and jobs
+# of at most TRANSCRIPTION_SHORT_JOB_SECONDS of audio get
+# TRANSCRIPTION_SHORT_JOB_PRIORITY on top of their tier's priority.
+TRANSCRIPTION_MAX_ACTIVE_JOBS = int(os.environ.get("MAX_ACTIVE_JOBS", 4))
+TRANSCRIPTION_TIERS = {
+    "free": {"weight": 1, "priority": 0, "max_active": 2, "max_queued": 100},
+    "paid": {"weight": 4, "priority": 10, "max_active": 4, "max_queued": 1000},
+}
+TRANSCRIPTION_SHORT_JOB_SECONDS = 300
+TRANSCRIPTION_SHORT_JOB_PRIORITY = 5
+# Pipeline seconds per second of audio assumed before stage metrics exist
+TRANSCRIPTION_DEFAULT_REAL_TIME_FACTOR = 0.5
+# Run dispatch_queued_jobs periodically (with celery beat) so slots freed by
+# crashed workers or jobs failed outside the pipeline are reused
+CELERY_BEAT_SCHEDULE = {
+    "dispatch-queued-jobs": {
+        "task": "transcription_app.tasks.dispatch_queued_jobs",
+        "schedule": 30.0,
+    },
+}
+
+# Each pipeline stage has its own queue so it can be scaled separately, e.g.
+#   celery -A transcription_project worker -Q transcribe
+#   celery -A transcription_project worker -Q diarize
+#   celery -A transcription_project worker -Q realtime
+# Stages hand audio over through MEDIA_ROOT/work, which must be shared by
+# all workers.
+CELERY_TASK_ROUTES = {
+    "transcription_app.tasks.process_audio_file": {"queue": "decode"},
+    "transcription_app.tasks.dispatch_queued_jobs": {"queue": "decode"},
+    "transcription_app.tasks.estimate_job": {"queue": "decode"},
+    "transcription_app.tasks.decode_stage": {"queue": "decode"},
+    "transcription_app.tasks.transcribe_stage": {"queue": "transcribe"},
+    "transcription_app.tasks.diarize_stage": {"queue": "diarize"},
+    "transcription_app.tasks.merge_stage": {"queue": "merge"},
+    "transcription_app.tasks.export_stage": {"queue": "export"},
+    "transcription_app.tasks.realtime_transcribe": {"queue": "realtime"},
+    "transcription_app.tasks.realtime_embed": {"queue": "realtime"},
+}
+# Concurrency, prefetch and pool of a worker consuming a single stage queue.
+# The model-bound stages reserve one job at a time so a long file doesn't hold
+# queued jobs back from idle workers. Transcribe workers use threads: prefork
+# children are daemonic and can't start the chunked mode's process pool.
+TRANSCRIPTION_WORKER_QUEUES = {
+    "decode": {"concurrency": os.cpu_count() or 1, "prefetch_multiplier": 4},
+    "transcribe": {"concurrency": 1, "prefetch_multiplier": 1, "pool": "threads"},
+    "diarize": {"concurrency": 1, "prefetch_multiplier": 1},
+    "merge": {"concurrency": 2, "prefetch_multiplier": 4},
+    "export": {"concurrency": 2, "prefetch_multiplier": 4},
+    # Threads that wait on the batch scheduler, so they can outnumber cores
+    "realtime": {"concurrency": 16, "prefetch_multiplier": 1, "pool": "threads"},
+}
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    "progress": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.environ.get(
+            "PROGRESS_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "transcription_progress"),
+        ),
+    },
+}
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
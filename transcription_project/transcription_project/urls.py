@@ -6,23 +6,37 @@ from django.conf import settings
 from django.conf.urls.static import static
 from transcription_app.views import (
     AudioFileViewSet,
+    SpeakerProfileViewSet,
+    TranscriptSearchView,
+    prometheus_metrics,
+    UploadSessionViewSet,
     RegisterView,
     CustomTokenObtainPairView,
     VerifyTokenView,
 )
+from transcription_app.events import audio_file_events
 from rest_framework_simplejwt.views import TokenRefreshView
 
 router = DefaultRouter()
 router.register(r"audio-files", AudioFileViewSet)
+router.register(r"uploads", UploadSessionViewSet, basename="upload")
+router.register(r"speakers", SpeakerProfileViewSet, basename="speaker")
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", prometheus_metrics, name="metrics"),
     path(
         "",
         include_docs_urls(title="Transcription API", description="API documentation"),
     ),
     path("", include(router.urls)),
     path("api/", include(router.urls)),
+    path(
+        "api/audio-files/<int:pk>/events/",
+        audio_file_events,
+        name="audiofile-events",
+    ),
+    path("api/search/", TranscriptSearchView.as_view(), name="transcript_search"),
     path("api/token/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("api/register/", RegisterView.as_view(), name="register"),